@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from api.starva_api import list_activities
+from utils.metrics import timed, increment
+
+# Local copy of the athlete's Strava activities, so "is this already on Strava?" checks and
+# reconciliation are SQLite queries instead of API listings.
+# Syncs are incremental: only activities that started after the newest one already cached are
+# fetched. The first page is fetched alone (a typical delta fits in it); if it is full, the
+# following pages are fetched ACTIVITY_SYNC_CONCURRENCY at a time through the shared rate-limit
+# scheduler until a short page comes back. The cursor only advances once every page has been
+# stored, so a failed sync is simply repeated next time.
+# Edits and deletions of older activities are not seen by a delta sync, and neither are new
+# activities that start before the cursor (e.g. a backfilled session from last week). A full
+# sync re-reads the lookback window; a windowed sync (`since`) re-reads everything after a time.
+ACTIVITY_CACHE_DB = os.getenv("ACTIVITY_CACHE_DB", os.path.join(tempfile.gettempdir(), "strava_uploader_activities.db"))
+ACTIVITY_SYNC_PER_PAGE = int(os.getenv("ACTIVITY_SYNC_PER_PAGE", "200"))
+ACTIVITY_SYNC_CONCURRENCY = int(os.getenv("ACTIVITY_SYNC_CONCURRENCY", "4"))
+# How far back the first (or a full) sync reaches
+ACTIVITY_SYNC_LOOKBACK_DAYS = int(os.getenv("ACTIVITY_SYNC_LOOKBACK_DAYS", "365"))
+
+_COLUMNS = ('id', 'owner', 'athlete_id', 'name', 'sport_type', 'start_date', 'start_date_local', 'elapsed_time')
+
+def _open_connection():
+    conn = sqlite3.connect(ACTIVITY_CACHE_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS activities ("
+        "id INTEGER PRIMARY KEY, owner TEXT NOT NULL, athlete_id INTEGER, name TEXT NOT NULL, sport_type TEXT, "
+        "start_date TEXT, start_ts REAL NOT NULL, start_date_local TEXT, elapsed_time INTEGER, "
+        "data TEXT NOT NULL, synced_at REAL NOT NULL)"
+    )
+    # Lookups by date (local, as the athlete sees it) and by name; the cursor comes from start_ts
+    conn.execute("CREATE INDEX IF NOT EXISTS activities_owner_local ON activities (owner, start_date_local)")
+    conn.execute("CREATE INDEX IF NOT EXISTS activities_owner_name ON activities (owner, name COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS activities_owner_start ON activities (owner, start_ts)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sync_state ("
+        "owner TEXT PRIMARY KEY, cursor REAL NOT NULL, synced_at REAL NOT NULL, last_fetched INTEGER NOT NULL)"
+    )
+    return conn
+
+# Strava timestamps ("2024-01-01T18:00:00Z") as Unix time; naive values are taken as UTC
+def _timestamp(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _row(owner, activity, now):
+    return (
+        activity['id'],
+        owner,
+        (activity.get('athlete') or {}).get('id'),
+        activity.get('name') or '',
+        activity.get('sport_type') or activity.get('type'),
+        activity.get('start_date'),
+        _timestamp(activity.get('start_date') or activity['start_date_local']),
+        activity.get('start_date_local'),
+        activity.get('elapsed_time'),
+        json.dumps(activity),
+        now
+    )
+
+class ActivityCache:
+    # Activities of every owner (the athlete id, as in the outbox) in one SQLite table
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        # One sync per owner at a time; a second caller waits and then sees the result
+        self._sync_locks = {}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = _open_connection()
+        return self._conn
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            with timed('storage_io'):
+                rows = self._connection().execute(sql, params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def _store(self, owner, activities):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with timed('storage_io'):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO activities (id, owner, athlete_id, name, sport_type, start_date, start_ts, "
+                        "start_date_local, elapsed_time, data, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [_row(owner, activity, now) for activity in activities]
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+
+    def sync_state(self, owner):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT cursor, synced_at, last_fetched FROM sync_state WHERE owner = ?", (owner,)
+            ).fetchone()
+        return {'cursor': row[0], 'synced_at': row[1], 'last_fetched': row[2]} if row else None
+
+    # Fetch pages starting at `page`: one alone, then `concurrency` at a time while they come back full.
+    # Returns (activities, pages_fetched, error).
+    def _fetch(self, owner, access_token, after, per_page, concurrency, client_id=None, max_wait=None):
+        fetched = []
+        page = 1
+        width = 1
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="activity-sync") as pool:
+            while True:
+                results = list(pool.map(
+                    lambda n: list_activities(access_token, after=after, page=n, per_page=per_page, client_id=client_id, max_wait=max_wait),
+                    range(page, page + width)
+                ))
+                for activities, error, _ in results:
+                    if error:
+                        return fetched, page - 1, error
+                    if activities:
+                        self._store(owner, activities)
+                        fetched.extend(activities)
+                page += width
+                if any(len(activities) < per_page for activities, _, _ in results):
+                    return fetched, page - 1, None
+                width = max(1, concurrency)
+
+    # Bring the cache up to date for one owner. Returns a summary of the sync, with 'error' set if it failed.
+    def sync(self, owner, access_token, full=False, per_page=ACTIVITY_SYNC_PER_PAGE,
+             concurrency=ACTIVITY_SYNC_CONCURRENCY, lookback_days=ACTIVITY_SYNC_LOOKBACK_DAYS, client_id=None, max_wait=None,
+             since=None):
+        with self._lock:
+            sync_lock = self._sync_locks.setdefault(owner, threading.Lock())
+        with sync_lock:
+            state = self.sync_state(owner)
+            lookback = (datetime.now(timezone.utc) - timedelta(days=lookback_days)).timestamp()
+            if since is not None:
+                after = since
+            else:
+                # Strava's `after` is exclusive, so re-reading from one second before the newest start is safe
+                after = lookback if full or state is None else max(lookback, state['cursor'] - 1)
+            # Everything after `after` is read again, not just what is new
+            resync = full or since is not None
+            started = time.perf_counter()
+            fetched, pages, error = self._fetch(owner, access_token, after, per_page, concurrency, client_id, max_wait)
+            increment('activities_synced', len(fetched))
+            summary = {'fetched': len(fetched), 'pages': pages, 'after': after, 'full': full or state is None,
+                       'since': since, 'seconds': round(time.perf_counter() - started, 3), 'error': error}
+            if error:
+                return summary
+
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if resync:
+                        # Anything in the window that Strava didn't return again was deleted
+                        synced_ids = [(activity['id'],) for activity in fetched]
+                        conn.execute("CREATE TEMP TABLE IF NOT EXISTS synced_ids (id INTEGER PRIMARY KEY)")
+                        conn.execute("DELETE FROM synced_ids")
+                        conn.executemany("INSERT OR IGNORE INTO synced_ids (id) VALUES (?)", synced_ids)
+                        summary['removed'] = conn.execute(
+                            "DELETE FROM activities WHERE owner = ? AND start_ts > ? AND id NOT IN (SELECT id FROM synced_ids)",
+                            (owner, after)
+                        ).rowcount
+                    cursor = conn.execute("SELECT MAX(start_ts) FROM activities WHERE owner = ?", (owner,)).fetchone()[0]
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sync_state (owner, cursor, synced_at, last_fetched) VALUES (?, ?, ?, ?)",
+                        (owner, cursor if cursor is not None else after, time.time(), len(fetched))
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            summary['cursor'] = cursor
+            return summary
+
+    # Cached activities, newest first, filtered by local start date range (ISO dates or datetimes,
+    # end exclusive) and/or exact name (case-insensitive)
+    def search(self, owner, start=None, end=None, name=None, limit=100):
+        clauses = ["owner = ?"]
+        params = [owner]
+        if start:
+            clauses.append("start_date_local >= ?")
+            params.append(str(start))
+        if end:
+            clauses.append("start_date_local < ?")
+            params.append(str(end))
+        if name:
+            clauses.append("name = ? COLLATE NOCASE")
+            params.append(name)
+        params.append(limit)
+        return self._query(
+            f"SELECT {', '.join(_COLUMNS)} FROM activities WHERE {' AND '.join(clauses)} "
+            "ORDER BY start_date_local DESC LIMIT ?", params
+        )
+
+    # Activities on one local calendar day (a date or a datetime)
+    def on_day(self, owner, day):
+        day = day.date() if isinstance(day, datetime) else day
+        return self.search(owner, start=day.isoformat(), end=(day + timedelta(days=1)).isoformat())
+
+    # The cached activity with this name (on `day`, if given), or None
+    def find_uploaded(self, owner, name, day=None):
+        if day is not None:
+            day = day.date() if isinstance(day, datetime) else day
+            matches = self.search(owner, start=day.isoformat(), end=(day + timedelta(days=1)).isoformat(), name=name, limit=1)
+        else:
+            matches = self.search(owner, name=name, limit=1)
+        return matches[0] if matches else None
+
+    def get(self, activity_id):
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM activities WHERE id = ?", (activity_id,))
+        return rows[0] if rows else None
+
+    # Split activity ids (e.g. from the upload index or the outbox) into those present on Strava, as of
+    # the last sync, and those that are not
+    def reconcile(self, owner, activity_ids):
+        activity_ids = [int(activity_id) for activity_id in activity_ids if activity_id is not None]
+        present = set()
+        for start in range(0, len(activity_ids), 500):
+            chunk = activity_ids[start:start + 500]
+            marks = ', '.join('?' * len(chunk))
+            with self._lock:
+                present.update(row[0] for row in self._connection().execute(
+                    f"SELECT id FROM activities WHERE owner = ? AND id IN ({marks})", (owner, *chunk)
+                ))
+        return {
+            'present': [activity_id for activity_id in activity_ids if activity_id in present],
+            'missing': [activity_id for activity_id in activity_ids if activity_id not in present]
+        }
+
+    def stats(self, owner=None):
+        with self._lock:
+            conn = self._connection()
+            if owner is None:
+                count = conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+            else:
+                count = conn.execute("SELECT COUNT(*) FROM activities WHERE owner = ?", (owner,)).fetchone()[0]
+        stats = {'activities': count}
+        if owner is not None:
+            state = self.sync_state(owner)
+            stats['last_sync'] = datetime.fromtimestamp(state['synced_at']).isoformat(timespec='seconds') if state else None
+            stats['last_fetched'] = state['last_fetched'] if state else None
+        return stats
+
+    def clear(self, owner=None):
+        with self._lock:
+            conn = self._connection()
+            if owner is None:
+                conn.execute("DELETE FROM activities")
+                conn.execute("DELETE FROM sync_state")
+            else:
+                conn.execute("DELETE FROM activities WHERE owner = ?", (owner,))
+                conn.execute("DELETE FROM sync_state WHERE owner = ?", (owner,))
+
+activity_cache = ActivityCache()
@@ -0,0 +1,79 @@
+import os
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from data.parser import summarize_csv, generate_unique_name, archive_upload
+from data.history import progress_notes, record_upload
+from data.upload_index import upload_fingerprints, find_duplicate, remember_upload
+from api.starva_api import post_activity
+
+# Upper bound on concurrent parse + upload jobs in bulk mode
+BULK_MAX_WORKERS = int(os.getenv("BULK_MAX_WORKERS", "4"))
+
+# Parse one workout file and post it as an activity.
+# Never raises: failures are reported in the returned result row.
+def upload_workout_file(owner, access_token, file, selected_exercise=None, client_id=None, max_wait=None):
+    file_name = getattr(file, 'name', str(file))
+    started = time.perf_counter()
+    result = {'file': file_name, 'status': 'failed', 'activity': '', 'activity_id': None, 'seconds': 0.0, 'error': ''}
+
+    try:
+        summary, _ = summarize_csv(file, selected_exercise)
+        fingerprints = upload_fingerprints(file, selected_exercise)
+        existing = find_duplicate(owner, fingerprints)
+        if existing:
+            result['status'] = 'duplicate'
+            result['activity'] = existing['name']
+            result['activity_id'] = existing['activity_id']
+            result['seconds'] = round(time.perf_counter() - started, 2)
+            return result
+        # Name each activity after its file so a team's sessions can be told apart
+        base_name = os.path.splitext(os.path.basename(file_name))[0]
+        result['activity'] = generate_unique_name(
+            base_name,
+            summary['total_weight'],
+            summary['total_sets'],
+            summary['total_reps'],
+            summary['selected_exercise']
+        )
+        activity, error = post_activity(
+            access_token=access_token,
+            name=result['activity'],
+            activity_type="WeightTraining",
+            start_date=datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            elapsed_time=summary['elapsed_time'],
+            description=summary['description'] + progress_notes(owner, file, selected_exercise),
+            client_id=client_id,
+            max_wait=max_wait
+        )
+        if activity:
+            result['status'] = 'uploaded'
+            result['activity_id'] = activity.get('id')
+            try:
+                remember_upload(owner, fingerprints, activity, result['activity'])
+                archive_upload(file, owner)
+                record_upload(owner, file, result['activity'], selected_exercise)
+            except Exception:
+                # Indexing, archiving and history are best effort; the activity is already on Strava
+                pass
+        else:
+            result['error'] = error
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['seconds'] = round(time.perf_counter() - started, 2)
+    return result
+
+# Parse and upload many of an athlete's files through a bounded thread pool sharing one access token (and the
+# rate-limit budget of client_id; max_wait caps each call's wait for budget). Yields (index, result) pairs
+# as uploads finish, in completion order.
+def bulk_upload(owner, access_token, files, selected_exercise=None, max_workers=BULK_MAX_WORKERS, client_id=None, max_wait=None):
+    workers = max(1, min(max_workers, len(files)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-upload") as pool:
+        futures = {
+            pool.submit(upload_workout_file, owner, access_token, file, selected_exercise, client_id, max_wait): index
+            for index, file in enumerate(files)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,445 @@
+import os
+import json
+import base64
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+
+from api.starva_api import send_activity, send_upload, get_upload, list_activities, upload_outcome
+from api.uploads import UPLOAD_POLL_TIMEOUT, poll_delay
+from data.history import record_session
+from data.upload_index import upload_index, remember_upload
+from utils.metrics import timed, increment
+
+# Durable outbox for activity uploads.
+# The UI only enqueues a job: it is committed to SQLite (synchronous=FULL, so it survives a crash
+# or power loss) before the button returns. Background workers drain the queue, retrying
+# throttled, server and network errors with exponential backoff.
+# Strava has no idempotency header, so the job id is the idempotency key and is enforced here:
+# a job is claimed under a lease (renewed while its worker is alive, however long Strava or the
+# rate limiter keeps it waiting), finished exactly once, and a job whose worker died mid-request
+# is checked against the upload index (written together with the job's completion) before it
+# is posted again. Only throttled posts are retried blindly: after a server or network error the
+# activity may exist anyway, so the job is 'unconfirmed' and the athlete's activities around its
+# start are listed before it is posted again.
+# A job whose payload carries a FIT file goes through Strava's uploads endpoint instead: once the
+# file is accepted the job is 'processing' with its upload id, and workers poll the upload
+# (without spending attempts) until Strava reports the activity or an error.
+OUTBOX_DB = os.getenv("UPLOAD_OUTBOX_DB", os.path.join(tempfile.gettempdir(), "strava_uploader_outbox.db"))
+OUTBOX_WORKERS = int(os.getenv("UPLOAD_OUTBOX_WORKERS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("UPLOAD_OUTBOX_MAX_ATTEMPTS", "5"))
+# A running job whose lease has expired is assumed abandoned (e.g. the process restarted). Leases of
+# jobs still being worked on are renewed every third of this.
+OUTBOX_LEASE_SECONDS = int(os.getenv("UPLOAD_OUTBOX_LEASE_SECONDS", "300"))
+# Backoff between attempts: base * 2^(attempt - 1), capped
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 300
+# Longest a worker sleeps before looking for due jobs again
+IDLE_POLL_SECONDS = 5
+# How far around an unconfirmed job's start its activity is looked for (start times are local, so a day)
+CONFIRM_WINDOW_SECONDS = 86400
+
+_JOB_COLUMNS = ('id', 'owner', 'status', 'attempts', 'activity_id', 'name', 'error', 'created_at', 'updated_at', 'next_attempt_at',
+                'upload_id', 'start_at', 'unconfirmed')
+# Columns added after the first release, created on existing databases
+_ADDED_COLUMNS = {'upload_id': 'INTEGER', 'upload_started_at': 'REAL', 'start_at': 'REAL', 'unconfirmed': 'INTEGER NOT NULL DEFAULT 0'}
+
+def _open_connection():
+    conn = sqlite3.connect(OUTBOX_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Every acknowledged job must be on disk, not just in the WAL buffer
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS upload_jobs ("
+        "id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, "
+        "payload TEXT NOT NULL, meta TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+        "next_attempt_at REAL NOT NULL, lease_until REAL, activity_id INTEGER, name TEXT, error TEXT, fingerprint TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(upload_jobs)")}
+    for column, column_type in _ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE upload_jobs ADD COLUMN {column} {column_type}")
+    # Workers look for due jobs by status and time
+    conn.execute("CREATE INDEX IF NOT EXISTS upload_jobs_due ON upload_jobs (status, next_attempt_at)")
+    # Pending-duplicate lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS upload_jobs_fingerprint ON upload_jobs (fingerprint)")
+    return conn
+
+def _backoff(attempts):
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+class UploadOutbox:
+    # Persistent job table plus the worker threads that drain it. A job's owner is the Strava athlete
+    # id it is uploaded for. Workers only pick up jobs whose owner has a token source registered in
+    # this process; others wait until that athlete is back.
+    def __init__(self, workers=OUTBOX_WORKERS):
+        self.workers = workers
+        # Only workers wait on the condition, so notify() always wakes one that can claim the job;
+        # the lease renewer sleeps on its own event
+        self._cond = threading.Condition()
+        self._stop_renewing = threading.Event()
+        self._conn = None
+        self._threads = []
+        self._renewer = None
+        # Ids of the jobs this process's workers are running
+        self._running = set()
+        self._token_sources = {}
+        self._stopped = False
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.recovered = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = _open_connection()
+        return self._conn
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"upload-outbox-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._renewer = threading.Thread(target=self._renew_leases, name="upload-outbox-lease", daemon=True)
+        self._renewer.start()
+
+    # Give workers a way to get a valid access token for a user's jobs (e.g. TokenManager.get_access_token),
+    # and the client id whose rate-limit budget their requests count against
+    def register_token_source(self, owner, get_access_token, client_id=None):
+        with self._cond:
+            self._token_sources[owner] = (get_access_token, client_id)
+            self._start_workers()
+            self._cond.notify_all()
+
+    def unregister_token_source(self, owner):
+        with self._cond:
+            self._token_sources.pop(owner, None)
+
+    # Persist a job and return its id; the job is durable once this returns. start_at is when the
+    # activity starts (Unix time), so a sync can look for it even if it is older than the newest one.
+    def enqueue(self, owner, payload, meta=None, start_at=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        meta = meta or {}
+        fingerprint = (meta.get('fingerprints') or {}).get('content')
+        with self._cond:
+            with timed('storage_io'):
+                self._connection().execute(
+                    "INSERT INTO upload_jobs (id, owner, status, payload, meta, next_attempt_at, name, fingerprint, start_at, "
+                    "created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, owner, json.dumps(payload), json.dumps(meta), now, payload.get('name'), fingerprint, start_at, now, now)
+                )
+            self._start_workers()
+            self._cond.notify()
+        increment('upload_jobs_enqueued')
+        return job_id
+
+    # Claim the oldest due job for an owner we can serve; must hold the condition lock
+    def _claim(self):
+        owners = list(self._token_sources)
+        if not owners:
+            return None
+        now = time.time()
+        conn = self._connection()
+        marks = ', '.join('?' * len(owners))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, owner, status, payload, meta, attempts, upload_id, upload_started_at, start_at, unconfirmed, created_at FROM upload_jobs "
+                f"WHERE owner IN ({marks}) AND ((status IN ('queued', 'processing') AND next_attempt_at <= ?) "
+                "OR (status = 'running' AND lease_until < ?)) ORDER BY created_at LIMIT 1",
+                (*owners, now, now)
+            ).fetchone()
+            if row:
+                # Polling a processing upload is not a new attempt
+                conn.execute(
+                    "UPDATE upload_jobs SET status = 'running', attempts = attempts + (CASE WHEN status = 'processing' THEN 0 ELSE 1 END), "
+                    "lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + OUTBOX_LEASE_SECONDS, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job_id, owner, status, payload, meta, attempts, upload_id, upload_started_at, start_at, unconfirmed, created_at = row
+        return {
+            'id': job_id,
+            'owner': owner,
+            'abandoned': status == 'running',
+            'payload': json.loads(payload),
+            'meta': json.loads(meta),
+            'attempts': attempts if status == 'processing' else attempts + 1,
+            'upload_id': upload_id,
+            'upload_started_at': upload_started_at,
+            'start_at': start_at or created_at,
+            'unconfirmed': bool(unconfirmed)
+        }
+
+    # Seconds until the next queued or processing job this process can serve is due (bounded by the
+    # idle poll); must hold the lock. Jobs of other owners can't be claimed here, so they don't count.
+    def _idle_timeout(self):
+        owners = list(self._token_sources)
+        if not owners:
+            return IDLE_POLL_SECONDS
+        marks = ', '.join('?' * len(owners))
+        row = self._connection().execute(
+            "SELECT MIN(next_attempt_at) FROM upload_jobs "
+            f"WHERE owner IN ({marks}) AND status IN ('queued', 'processing')",
+            owners
+        ).fetchone()
+        if row[0] is None:
+            return IDLE_POLL_SECONDS
+        return min(IDLE_POLL_SECONDS, max(0.05, row[0] - time.time()))
+
+    def _finish(self, job, status, activity_id=None, error=None, retry_at=None):
+        now = time.time()
+        with self._cond:
+            with timed('storage_io'):
+                self._connection().execute(
+                    "UPDATE upload_jobs SET status = ?, activity_id = ?, error = ?, next_attempt_at = ?, unconfirmed = ?, "
+                    "lease_until = NULL, updated_at = ? WHERE id = ? AND status = 'running'",
+                    (status, activity_id, error, retry_at or now, int(job.get('unconfirmed', False)), now, job['id'])
+                )
+
+    # Strava accepted the file; poll the upload from poll_at on
+    def _processing(self, job, upload_id, started_at, poll_at):
+        now = time.time()
+        with self._cond:
+            with timed('storage_io'):
+                self._connection().execute(
+                    "UPDATE upload_jobs SET status = 'processing', upload_id = ?, upload_started_at = ?, error = NULL, "
+                    "next_attempt_at = ?, lease_until = NULL, updated_at = ? WHERE id = ? AND status = 'running'",
+                    (upload_id, started_at, poll_at, now, job['id'])
+                )
+            self._cond.notify()
+
+    # Index and history bookkeeping for a successful upload
+    def _after_upload(self, job, activity):
+        meta = job['meta']
+        name = job['payload']['name']
+        if meta.get('fingerprints'):
+            remember_upload(job['owner'], meta['fingerprints'], activity, name)
+        history = meta.get('history')
+        if history:
+            record_session(job['owner'], history['key'], history['stats'], name, history.get('recorded_at'))
+
+    def _succeeded(self, job, activity):
+        try:
+            self._after_upload(job, activity)
+        except Exception:
+            # The activity exists; index and history are best effort
+            pass
+        self._finish(job, 'done', activity_id=activity.get('id'))
+        self.completed += 1
+        increment('upload_jobs_completed')
+
+    # Act on the state of a FIT upload: finished, failed, or still processing
+    def _upload_state(self, job, upload, started_at):
+        status, activity_id, error = upload_outcome(upload)
+        if status in ('ready', 'duplicate'):
+            # A duplicate means Strava already has this workout as activity_id
+            self._succeeded(job, {'id': activity_id})
+        elif status == 'failed':
+            self._finish(job, 'failed', error=error)
+            self.failed += 1
+            increment('upload_jobs_failed')
+        elif time.time() - started_at > UPLOAD_POLL_TIMEOUT:
+            self._finish(job, 'failed', error=f"Strava was still processing upload {upload['id']} after {UPLOAD_POLL_TIMEOUT:.0f} s")
+            self.failed += 1
+            increment('upload_jobs_failed')
+        else:
+            self._processing(job, upload['id'], started_at, time.time() + poll_delay(time.time() - started_at))
+
+    # The activity an earlier post of this manual-activity job created, if Strava lists one with its
+    # name and duration near its start. Returns (activity, error_text, retryable), like list_activities.
+    def _find_posted(self, job, access_token, client_id):
+        payload = job['payload']
+        activities, error, retryable = list_activities(
+            access_token, after=job['start_at'] - CONFIRM_WINDOW_SECONDS, before=job['start_at'] + CONFIRM_WINDOW_SECONDS,
+            client_id=client_id
+        )
+        if activities is None:
+            return None, error, retryable
+        for activity in activities:
+            if activity.get('name') == payload['name'] and activity.get('elapsed_time') == payload['elapsed_time']:
+                return activity, None, False
+        return None, None, False
+
+    def _run(self, job):
+        fingerprints = job['meta'].get('fingerprints')
+        if job['abandoned'] and fingerprints and not job['upload_id']:
+            # The previous worker may have posted before dying; the index is updated right after a 201.
+            # Only the same content counts: matching totals could be a different session.
+            existing = upload_index.lookup(job['owner'], fingerprints, 'content')
+            if existing:
+                self.recovered += 1
+                self._finish(job, 'done', activity_id=existing['activity_id'])
+                return
+
+        get_access_token, client_id = self._token_sources.get(job['owner'], (None, None))
+        access_token = get_access_token() if get_access_token else None
+        payload = job['payload']
+        if job['abandoned'] and 'fit' not in payload:
+            job['unconfirmed'] = True
+        if access_token and job['unconfirmed']:
+            # An earlier post may have created the activity without us seeing the 201
+            activity, error, retryable = self._find_posted(job, access_token, client_id)
+            if activity:
+                job['unconfirmed'] = False
+                self.recovered += 1
+                self._succeeded(job, activity)
+                return
+            if error:
+                self._retry_or_fail(job, error, retryable)
+                return
+            job['unconfirmed'] = False
+
+        if not access_token:
+            activity, error, retryable = None, "No valid access token", True
+        elif job['upload_id']:
+            started_at = job['upload_started_at'] or time.time()
+            upload, error, retryable = get_upload(access_token, job['upload_id'], client_id=client_id)
+            if upload:
+                self._upload_state(job, upload, started_at)
+                return
+            if retryable and time.time() - started_at <= UPLOAD_POLL_TIMEOUT:
+                # Keep polling; a flaky status check does not cost the job an attempt
+                self._processing(job, job['upload_id'], started_at, time.time() + _backoff(1))
+                return
+            activity, retryable = None, False
+        elif 'fit' in payload:
+            upload, error, retryable = send_upload(
+                access_token, base64.b64decode(payload['fit']), payload['name'],
+                payload.get('description'), payload.get('external_id'), client_id=client_id
+            )
+            if upload:
+                self._upload_state(job, upload, time.time())
+                return
+            activity = None
+        else:
+            activity, error, retryable = send_activity(access_token, client_id=client_id, **payload)
+
+        if activity:
+            self._succeeded(job, activity)
+        else:
+            self._retry_or_fail(job, error, retryable)
+
+    # Queue a failed attempt again with backoff, or fail the job once it is out of attempts.
+    # retryable None means the request may have reached Strava: a manual activity is then unconfirmed,
+    # and looked for before it is posted again (a FIT file posted twice is flagged by Strava as a duplicate).
+    def _retry_or_fail(self, job, error, retryable=True):
+        if retryable is None and 'fit' not in job['payload']:
+            job['unconfirmed'] = True
+        if (retryable or retryable is None) and job['attempts'] < OUTBOX_MAX_ATTEMPTS:
+            self._finish(job, 'queued', error=error, retry_at=time.time() + _backoff(job['attempts']))
+            self.retried += 1
+        else:
+            self._finish(job, 'failed', error=error)
+            self.failed += 1
+            increment('upload_jobs_failed')
+
+    # Extend the leases of the jobs this process is running, so a call that waits a long time (e.g.
+    # for rate-limit budget) is never taken for abandoned and posted again by another worker
+    def _renew_leases(self):
+        interval = OUTBOX_LEASE_SECONDS / 3
+        while not self._stop_renewing.wait(interval):
+            with self._cond:
+                job_ids = list(self._running)
+                if not job_ids:
+                    continue
+                marks = ', '.join('?' * len(job_ids))
+                try:
+                    with timed('storage_io'):
+                        self._connection().execute(
+                            f"UPDATE upload_jobs SET lease_until = ? WHERE id IN ({marks}) AND status = 'running'",
+                            (time.time() + OUTBOX_LEASE_SECONDS, *job_ids)
+                        )
+                except sqlite3.Error:
+                    # Try again next round; the leases still have two thirds of their time left
+                    pass
+
+    def _work(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                job = self._claim()
+                if job is None:
+                    self._cond.wait(self._idle_timeout())
+                    continue
+                self._running.add(job['id'])
+            try:
+                self._run(job)
+            except Exception as e:
+                # We can't tell whether the job got as far as posting
+                self._retry_or_fail(job, str(e), None)
+            finally:
+                with self._cond:
+                    self._running.discard(job['id'])
+
+    # Current state of the given jobs, by primary key (cheap enough to call on every rerun)
+    def status(self, job_ids):
+        if not job_ids:
+            return []
+        marks = ', '.join('?' * len(job_ids))
+        with self._cond:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM upload_jobs WHERE id IN ({marks})", list(job_ids)
+            ).fetchall()
+        jobs = {row[0]: dict(zip(_JOB_COLUMNS, row)) for row in rows}
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    # An athlete's queued, running or processing job for the same workout content, if any (not yet in
+    # the upload index)
+    def find_pending(self, owner, fingerprints):
+        with self._cond:
+            row = self._connection().execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM upload_jobs "
+                "WHERE fingerprint = ? AND owner = ? AND status IN ('queued', 'running', 'processing') LIMIT 1",
+                (fingerprints.get('content'), owner)
+            ).fetchone()
+        return dict(zip(_JOB_COLUMNS, row)) if row else None
+
+    # Re-queue a failed job for another round of attempts (a rejected file is uploaded again; an
+    # unconfirmed activity is still looked for first)
+    def retry(self, job_id):
+        now = time.time()
+        with self._cond:
+            self._connection().execute(
+                "UPDATE upload_jobs SET status = 'queued', attempts = 0, upload_id = NULL, upload_started_at = NULL, "
+                "next_attempt_at = ?, updated_at = ? WHERE id = ? AND status = 'failed'",
+                (now, now, job_id)
+            )
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._stop_renewing.set()
+        for thread in self._threads + ([self._renewer] if self._renewer else []):
+            thread.join(timeout=IDLE_POLL_SECONDS + 1)
+
+    def stats(self):
+        with self._cond:
+            counts = dict(self._connection().execute(
+                "SELECT status, COUNT(*) FROM upload_jobs GROUP BY status"
+            ).fetchall())
+            return {
+                'jobs': counts,
+                'workers': len(self._threads),
+                'owners': len(self._token_sources),
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed,
+                'recovered': self.recovered
+            }
+
+outbox = UploadOutbox()
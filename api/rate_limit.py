@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import threading
+import requests
+
+from utils.http_client import http_client
+
+# Strava enforces a 15-minute window (reset on the quarter hour) and a daily window (reset at midnight UTC)
+SHORT_WINDOW = 15 * 60
+DAILY_WINDOW = 24 * 60 * 60
+
+# Responses worth retrying: throttled or transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest an interactive caller (a Streamlit script run) waits for budget or a retry; beyond it the
+# call fails with RateLimitError instead of holding up the page. Background callers wait up to max_wait.
+INTERACTIVE_MAX_WAIT = float(os.getenv("STRAVA_INTERACTIVE_MAX_WAIT", "10"))
+# A dropped connection or a server error may come after the request took effect, so only these
+# methods are retried then; anything else (e.g. POST /activities) is only retried when throttled
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+class RateLimitError(Exception):
+    pass
+
+# Parse a "short,daily" header pair such as X-RateLimit-Usage: 12,300
+def _parse_pair(value):
+    try:
+        short, daily = (int(part) for part in value.split(',')[:2])
+        return short, daily
+    except (AttributeError, ValueError):
+        return None
+
+def _next_reset(now, window):
+    return (int(now) // window + 1) * window
+
+class RateLimitScheduler:
+    # Keeps one budget per Strava window. Each call reserves a slot from both before it is sent,
+    # and the budgets are corrected from the usage headers Strava returns with every response.
+    def __init__(self, short_limit=200, daily_limit=2000, max_retries=3, backoff_base=1.0, max_wait=SHORT_WINDOW):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        now = time.time()
+        self.short_used = 0
+        self.daily_used = 0
+        self.short_reset = _next_reset(now, SHORT_WINDOW)
+        self.daily_reset = _next_reset(now, DAILY_WINDOW)
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.seconds_waited = 0.0
+
+    def _roll_windows(self, now):
+        if now >= self.short_reset:
+            self.short_used = 0
+            self.short_reset = _next_reset(now, SHORT_WINDOW)
+        if now >= self.daily_reset:
+            self.daily_used = 0
+            self.daily_reset = _next_reset(now, DAILY_WINDOW)
+
+    # Reserve one request from both windows, waiting (at most max_wait) for a reset if either budget is spent
+    def acquire(self, max_wait=None):
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._cond:
+            while True:
+                now = time.time()
+                self._roll_windows(now)
+                if self.short_used < self.short_limit and self.daily_used < self.daily_limit:
+                    self.short_used += 1
+                    self.daily_used += 1
+                    self.requests += 1
+                    return
+
+                reset = self.daily_reset if self.daily_used >= self.daily_limit else self.short_reset
+                wait = reset - now
+                if wait > max_wait:
+                    raise RateLimitError(
+                        f"Strava rate limit reached ({self.short_used}/{self.short_limit} per 15 min, "
+                        f"{self.daily_used}/{self.daily_limit} per day). Try again in {int(wait // 60) + 1} minutes."
+                    )
+                self.throttled += 1
+                started = time.time()
+                self._cond.wait(wait)
+                self.seconds_waited += time.time() - started
+
+    # Sync budgets with the limits and usage Strava reports
+    def update_from_headers(self, headers):
+        limits = _parse_pair(headers.get('X-RateLimit-Limit'))
+        usage = _parse_pair(headers.get('X-RateLimit-Usage'))
+        if not limits and not usage:
+            return
+        with self._cond:
+            self._roll_windows(time.time())
+            if limits:
+                self.short_limit, self.daily_limit = limits
+            if usage:
+                # Local counts also include requests still in flight, so never lower them
+                self.short_used = max(self.short_used, usage[0])
+                self.daily_used = max(self.daily_used, usage[1])
+            self._cond.notify_all()
+
+    # Jittered exponential backoff, honouring Retry-After when Strava sends one
+    def _backoff(self, attempt, response=None):
+        delay = self.backoff_base * (2 ** (attempt - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+        return delay
+
+    # Send a request through the scheduler, retrying throttled failures, and transient ones for
+    # idempotent methods (waiting at most max_wait for budget or before a retry)
+    def request(self, method, url, max_wait=None, **kwargs):
+        max_wait = self.max_wait if max_wait is None else max_wait
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.acquire(max_wait)
+            try:
+                response = http_client.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt + 1)
+                if delay > max_wait:
+                    raise
+                attempt += 1
+                self.retries += 1
+                time.sleep(delay)
+                continue
+
+            self.update_from_headers(response.headers)
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if not retryable or attempt >= self.max_retries:
+                return response
+            delay = self._backoff(attempt + 1, response)
+            if delay > max_wait:
+                return response
+            attempt += 1
+            self.retries += 1
+            time.sleep(delay)
+
+    # Current budget usage for both windows
+    def usage(self):
+        with self._cond:
+            self._roll_windows(time.time())
+            return {
+                'short_used': self.short_used,
+                'short_limit': self.short_limit,
+                'short_reset_in': int(self.short_reset - time.time()),
+                'daily_used': self.daily_used,
+                'daily_limit': self.daily_limit,
+                'daily_reset_in': int(self.daily_reset - time.time()),
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'seconds_waited': round(self.seconds_waited, 2)
+            }
+
+# Strava budgets are per application, and every user brings their own (their client id), so each
+# client id gets its own scheduler; one user's usage or 429s never throttle another. Calls made
+# without a client id share the default scheduler.
+SCHEDULER_OPTIONS = {
+    'short_limit': int(os.getenv("STRAVA_RATE_LIMIT_15MIN", "200")),
+    'daily_limit': int(os.getenv("STRAVA_RATE_LIMIT_DAILY", "2000")),
+    'max_retries': int(os.getenv("STRAVA_MAX_RETRIES", "3")),
+    'max_wait': float(os.getenv("STRAVA_MAX_RATE_WAIT", str(SHORT_WINDOW)))
+}
+scheduler = RateLimitScheduler(**SCHEDULER_OPTIONS)
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+# The scheduler holding a client id's budget
+def scheduler_for(client_id=None):
+    if not client_id:
+        return scheduler
+    with _schedulers_lock:
+        client_scheduler = _schedulers.get(str(client_id))
+        if client_scheduler is None:
+            client_scheduler = _schedulers[str(client_id)] = RateLimitScheduler(**SCHEDULER_OPTIONS)
+    return client_scheduler
+
+# Request, retry and throttling counts summed over every scheduler
+def usage_totals():
+    with _schedulers_lock:
+        schedulers = [scheduler, *_schedulers.values()]
+    totals = {'clients': len(schedulers) - 1, 'requests': 0, 'retries': 0, 'throttled': 0, 'seconds_waited': 0.0}
+    for client_scheduler in schedulers:
+        usage = client_scheduler.usage()
+        for key in ('requests', 'retries', 'throttled', 'seconds_waited'):
+            totals[key] += usage[key]
+    totals['seconds_waited'] = round(totals['seconds_waited'], 2)
+    return totals
+
+# Send any outbound Strava request through the scheduler of the app (client id) it is made for
+def strava_request(method, url, client_id=None, max_wait=None, **kwargs):
+    return scheduler_for(client_id).request(method, url, max_wait=max_wait, **kwargs)
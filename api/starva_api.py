@@ -1,9 +1,19 @@
+import re
+
 import requests
 import streamlit as st
 
-# Create a custom activity
-def create_activity(access_token, name, activity_type, start_date, elapsed_time, description=None, debug=False):
-    url = "https://www.strava.com/api/v3/activities"
+from api.rate_limit import strava_request, RateLimitError, RETRY_STATUSES
+from api.urls import strava_url
+from utils.metrics import timed, increment
+
+# Post a custom activity without touching the Streamlit UI, so it is safe to call from worker threads.
+# Returns (activity, error_text, retryable); retryable marks throttling, server and network errors.
+# Strava has no idempotency key, so a POST may have created the activity even if it failed (a 5xx,
+# a read timeout, a dropped connection): for those retryable is None, "unknown", and only throttling
+# and errors raised before the request was sent are True.
+def send_activity(access_token, name, activity_type, start_date, elapsed_time, description=None, client_id=None, max_wait=None):
+    url = strava_url("api/v3/activities")
     headers = {"Authorization": f"Bearer {access_token}"}
     payload = {
         "name": name,
@@ -12,15 +22,129 @@ def create_activity(access_token, name, activity_type, start_date, elapsed_time,
         "elapsed_time": elapsed_time,
         "description": description
     }
-    
-    if debug:
-        st.write("Debug - Create Activity Request:", payload)
-    
-    response = requests.post(url, headers=headers, data=payload)
+
+    try:
+        with timed('create_activity'):
+            response = strava_request("POST", url, client_id=client_id, max_wait=max_wait, headers=headers, data=payload)
+    except (RateLimitError, requests.ConnectTimeout) as e:
+        increment('create_activity_failures')
+        return None, str(e), True
+    except requests.RequestException as e:
+        increment('create_activity_failures')
+        return None, str(e), None
     if response.status_code == 201:
+        increment('activities_created')
+        return response.json(), None, False
+    increment('create_activity_failures')
+    if response.status_code == 429:
+        return None, response.text, True
+    return None, response.text, None if response.status_code in RETRY_STATUSES else False
+
+# The authenticated athlete. Returns (athlete, error_text, retryable), like send_activity.
+def get_athlete(access_token, client_id=None, max_wait=None):
+    url = strava_url("api/v3/athlete")
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    try:
+        response = strava_request("GET", url, client_id=client_id, max_wait=max_wait, headers=headers)
+    except (RateLimitError, requests.RequestException) as e:
+        return None, str(e), True
+    if response.status_code == 200:
+        return response.json(), None, False
+    return None, response.text, response.status_code in RETRY_STATUSES
+
+# Fetch one page of the athlete's activities (newest first, or oldest first when `after` is given).
+# Returns (activities, error_text, retryable), like send_activity.
+def list_activities(access_token, after=None, before=None, page=1, per_page=200, client_id=None, max_wait=None):
+    url = strava_url("api/v3/athlete/activities")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = {"page": page, "per_page": per_page}
+    if after is not None:
+        params["after"] = int(after)
+    if before is not None:
+        params["before"] = int(before)
+
+    try:
+        with timed('list_activities'):
+            response = strava_request("GET", url, client_id=client_id, max_wait=max_wait, headers=headers, params=params)
+    except (RateLimitError, requests.RequestException) as e:
+        return None, str(e), True
+    if response.status_code == 200:
+        return response.json(), None, False
+    return None, response.text, response.status_code in RETRY_STATUSES
+
+# Strava's error for a file it already has, e.g. "workout.fit duplicate of activity 123"
+DUPLICATE_UPLOAD = re.compile(r"duplicate of (?:activity )?(\d+)")
+
+# Start an upload of an activity file (a FIT file by default). Strava processes uploads
+# asynchronously: the returned upload has an id to poll with get_upload until it has an
+# activity_id or an error. Returns (upload, error_text, retryable), like send_activity.
+def send_upload(access_token, data, name=None, description=None, external_id=None, data_type="fit", client_id=None):
+    url = strava_url("api/v3/uploads")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    form = {"data_type": data_type, "name": name, "description": description, "external_id": external_id}
+    files = {"file": (external_id or f"activity.{data_type}", data, "application/octet-stream")}
+
+    try:
+        with timed('upload_file'):
+            response = strava_request("POST", url, client_id=client_id, headers=headers, data={k: v for k, v in form.items() if v is not None}, files=files)
+    except (RateLimitError, requests.RequestException) as e:
+        increment('upload_file_failures')
+        return None, str(e), True
+    if response.status_code == 201:
+        increment('files_uploaded')
+        return response.json(), None, False
+    increment('upload_file_failures')
+    return None, response.text, response.status_code in RETRY_STATUSES
+
+# Current state of an upload. Returns (upload, error_text, retryable), like send_activity.
+def get_upload(access_token, upload_id, client_id=None):
+    url = strava_url(f"api/v3/uploads/{upload_id}")
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    try:
+        with timed('upload_status'):
+            response = strava_request("GET", url, client_id=client_id, headers=headers)
+    except (RateLimitError, requests.RequestException) as e:
+        return None, str(e), True
+    if response.status_code == 200:
+        return response.json(), None, False
+    return None, response.text, response.status_code in RETRY_STATUSES
+
+# Interpret an upload: ('processing', None, None) while Strava works on it, ('ready', activity_id, None),
+# ('duplicate', activity_id, error) when Strava already had the file, or ('failed', None, error)
+def upload_outcome(upload):
+    error = upload.get('error')
+    if error:
+        duplicate = DUPLICATE_UPLOAD.search(error)
+        if duplicate:
+            return 'duplicate', int(duplicate.group(1)), error
+        return 'failed', None, error
+    if upload.get('activity_id'):
+        return 'ready', upload['activity_id'], None
+    return 'processing', None, None
+
+# Returns (activity, error_text)
+def post_activity(access_token, name, activity_type, start_date, elapsed_time, description=None, client_id=None, max_wait=None):
+    activity, error, _ = send_activity(access_token, name, activity_type, start_date, elapsed_time, description, client_id, max_wait)
+    return activity, error
+
+# Create a custom activity
+def create_activity(access_token, name, activity_type, start_date, elapsed_time, description=None, debug=False):
+    if debug:
+        st.write("Debug - Create Activity Request:", {
+            "name": name,
+            "type": activity_type,
+            "start_date_local": start_date,
+            "elapsed_time": elapsed_time,
+            "description": description
+        })
+
+    activity, error = post_activity(access_token, name, activity_type, start_date, elapsed_time, description)
+    if activity:
         if debug:
-            st.write("Create Activity Response:", response.json())
-        return response.json()
+            st.write("Create Activity Response:", activity)
+        return activity
     else:
-        st.error(f"Error creating activity: {response.text}")
-        return None
\ No newline at end of file
+        st.error(f"Error creating activity: {error}")
+        return None
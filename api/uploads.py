@@ -0,0 +1,101 @@
+import os
+import time
+import heapq
+import threading
+from concurrent.futures import Future
+
+from api.starva_api import get_upload, upload_outcome
+from utils.metrics import increment
+
+# Strava turns an uploaded file into an activity asynchronously: the upload is polled until it
+# reports an activity id or an error. Polls start UPLOAD_POLL_SECONDS after the upload and back
+# off to UPLOAD_POLL_MAX_SECONDS; an upload still processing after UPLOAD_POLL_TIMEOUT fails.
+UPLOAD_POLL_SECONDS = float(os.getenv("UPLOAD_POLL_SECONDS", "1"))
+UPLOAD_POLL_MAX_SECONDS = float(os.getenv("UPLOAD_POLL_MAX_SECONDS", "8"))
+UPLOAD_POLL_TIMEOUT = float(os.getenv("UPLOAD_POLL_TIMEOUT", "300"))
+
+# Delay before the next poll of an upload started `elapsed` seconds ago
+def poll_delay(elapsed):
+    return min(UPLOAD_POLL_MAX_SECONDS, max(UPLOAD_POLL_SECONDS, elapsed / 2))
+
+class UploadPoller:
+    # One thread polling every pending upload, each at its own backoff. watch() returns a Future
+    # resolved with (status, activity_id, error) from upload_outcome, or ('failed', None, error)
+    # on timeout or a non-retryable polling error. Used by batch uploads, where many files are
+    # processing at once; the outbox polls from its own workers instead.
+    def __init__(self, get_access_token, timeout=UPLOAD_POLL_TIMEOUT, client_id=None):
+        self.get_access_token = get_access_token
+        self.timeout = timeout
+        self.client_id = client_id
+        self._cond = threading.Condition()
+        # (due, sequence, upload_id, started, future)
+        self._due = []
+        self._sequence = 0
+        self._thread = None
+        self._stopped = False
+
+    def watch(self, upload_id, started=None):
+        future = Future()
+        started = started or time.time()
+        with self._cond:
+            self._schedule(upload_id, started, future, started + UPLOAD_POLL_SECONDS)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="upload-poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    # Must hold the condition lock
+    def _schedule(self, upload_id, started, future, due):
+        self._sequence += 1
+        heapq.heappush(self._due, (due, self._sequence, upload_id, started, future))
+
+    def _poll(self, upload_id, started):
+        access_token = self.get_access_token()
+        if not access_token:
+            upload, error, retryable = None, "No valid access token", True
+        else:
+            upload, error, retryable = get_upload(access_token, upload_id, client_id=self.client_id)
+        if upload:
+            outcome = upload_outcome(upload)
+            if outcome[0] != 'processing':
+                return outcome
+        elif not retryable:
+            return 'failed', None, error
+        if time.time() - started > self.timeout:
+            increment('upload_poll_timeouts')
+            return 'failed', None, f"Upload {upload_id} still processing after {self.timeout:.0f} s"
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._due or self._due[0][0] > time.time()):
+                    self._cond.wait(self._due[0][0] - time.time() if self._due else None)
+                if self._stopped:
+                    return
+                _, _, upload_id, started, future = heapq.heappop(self._due)
+            try:
+                outcome = self._poll(upload_id, started)
+            except Exception as e:
+                outcome = ('failed', None, str(e))
+            if outcome is None:
+                with self._cond:
+                    self._schedule(upload_id, started, future, time.time() + poll_delay(time.time() - started))
+            else:
+                future.set_result(outcome)
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    # Stop polling; uploads still pending are resolved as failed
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            pending, self._due = self._due, []
+            self._cond.notify_all()
+        for _, _, upload_id, _, future in pending:
+            future.set_result(('failed', None, f"Upload {upload_id} was still processing when polling stopped"))
+        if self._thread:
+            self._thread.join(timeout=UPLOAD_POLL_MAX_SECONDS + 1)
@@ -0,0 +1,9 @@
+import os
+
+# Where Strava lives. Every OAuth, API and web link is built from this base, so the app can be
+# pointed at a local stand-in (python -m benchmarks.mock_strava) for development and load tests:
+#   STRAVA_BASE_URL=http://127.0.0.1:8111 streamlit run app.py
+STRAVA_BASE_URL = os.getenv("STRAVA_BASE_URL", "https://www.strava.com").rstrip('/')
+
+def strava_url(path):
+    return f"{STRAVA_BASE_URL}/{path.lstrip('/')}"
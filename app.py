@@ -1,14 +1,17 @@
 
 import streamlit as st
 import os
-import time
+import json
 from datetime import datetime
 
 from auth.credentials import get_credentials, save_credentials
-from auth.oauth import get_access_token, refresh_access_token
-from data.parser import parse_csv, generate_unique_name
-from api.starva_api import create_activity
-from utils.storage import load_temp_storage, save_temp_storage, clean_temp_storage
+from utils.storage import get_temp_entry, delete_temp_entry, clear_temp_storage, clean_temp_storage, temp_storage_stats
+from utils.startup import prewarm_imports, import_report
+from utils.metrics import start_run, current_run, export_json, export_prometheus
+from api.urls import strava_url
+
+# Modules needed only after authorization (requests, pandas, the auth/api/data tree) are
+# imported where they're used, and pre-warmed in the background during the OAuth flow.
 
 # Set page configuration
 st.set_page_config(
@@ -39,12 +42,12 @@ def init_session_state():
     query_params = st.query_params
     if "state" in query_params and "code" in query_params:
         state_param = query_params["state"]
-        temp_storage = load_temp_storage()  # Reload to get latest
-        if state_param in temp_storage:
+        entry = get_temp_entry(state_param)  # Reload to get latest
+        if entry:
             # Restore credentials from temp_storage using state parameter
             st.session_state.temp_key = state_param
-            st.session_state.client_id = temp_storage[state_param]['client_id']
-            st.session_state.client_secret = temp_storage[state_param]['client_secret']
+            st.session_state.client_id = entry['client_id']
+            st.session_state.client_secret = entry['client_secret']
             st.session_state.phase = 'authorization'  # Ensure we're in authorization phase
 
 # Function to handle page navigation
@@ -52,38 +55,82 @@ def set_phase(phase):
     st.session_state.phase = phase
 
 
-# Handle file upload
-def handle_upload():
+# Start background token management for freshly obtained tokens, replacing any previous manager
+def start_token_manager(token_data):
+    from auth.tokens import TokenManager
+    
+    previous = st.session_state.get('token_manager')
+    if previous:
+        previous.stop()
+    client_id, client_secret = get_credentials()
+    st.session_state.token_manager = TokenManager(client_id, client_secret, token_data)
+
+
+# Get the session's token manager, creating it from the stored token data if needed (None on failure)
+def get_token_manager():
+    from auth.tokens import TokenManager
+    
     if 'token_data' not in st.session_state or st.session_state.token_data is None:
         st.error("No token data available. Please authorize with Strava first.")
-        return
+        return None
     
-    token_data = st.session_state.token_data
-    current_time = int(time.time())
-    
-    # Check if token is expired and refresh if needed
-    if current_time >= token_data['expires_at']:
+    manager = st.session_state.get('token_manager')
+    if manager is None:
         client_id, client_secret = get_credentials()
         if not client_id or not client_secret:
             st.error("Credentials missing. Please re-enter them in the Credentials phase.")
             set_phase('credentials')
-            return
-        
-        new_token_data = refresh_access_token(
-            client_id,
-            client_secret,
-            token_data['refresh_token'],
-            debug=st.session_state.debug_mode
-        )
-        
-        if new_token_data:
-            st.session_state.token_data = new_token_data
-            access_token = new_token_data['access_token']
-        else:
-            st.error("Failed to refresh access token. Please re-authorize with Strava.")
-            return
-    else:
-        access_token = token_data['access_token']
+            return None
+        manager = TokenManager(client_id, client_secret, st.session_state.token_data)
+        st.session_state.token_manager = manager
+    return manager
+
+
+# Get a valid access token from the session's token manager (None on failure)
+def get_valid_access_token():
+    from api.rate_limit import INTERACTIVE_MAX_WAIT
+    
+    manager = get_token_manager()
+    if manager is None:
+        return None
+    
+    # Served from memory unless the token has already expired
+    access_token = manager.get_access_token(max_wait=INTERACTIVE_MAX_WAIT)
+    st.session_state.token_data = manager.token_data
+    if not access_token:
+        st.error(f"Failed to refresh access token. Please re-authorize with Strava. ({manager.last_error})")
+        return None
+    return access_token
+
+
+# The authorized athlete's Strava id, as a string (None on failure). Per-user state is keyed by it
+# rather than by the client id, since several athletes can authorize through the same Strava app.
+def current_athlete():
+    from api.starva_api import get_athlete
+    from api.rate_limit import INTERACTIVE_MAX_WAIT
+    
+    manager = get_token_manager()
+    if manager is None:
+        return None
+    if manager.athlete_id is None:
+        # Token responses name the athlete; look it up if this one didn't
+        access_token = get_valid_access_token()
+        if not access_token:
+            return None
+        athlete, error, _ = get_athlete(access_token, client_id=manager.client_id, max_wait=INTERACTIVE_MAX_WAIT)
+        if not athlete:
+            st.error(f"Could not look up your Strava athlete profile: {error}")
+            return None
+        manager.athlete_id = athlete['id']
+    return str(manager.athlete_id)
+
+
+# Handle file upload: parse, check for duplicates and enqueue the upload for the background workers
+def handle_upload():
+    from data.parser import parse_csv, generate_unique_name, archive_upload, get_sessions
+    from data.history import progress_notes, upload_stats, session_key
+    from data.upload_index import upload_fingerprints, find_duplicate, find_similar, activity_url
+    from api.outbox import outbox
     
     # Validate inputs
     if st.session_state.uploaded_file is None:
@@ -95,11 +142,56 @@ def handle_upload():
     if selected_exercise == "All Exercises":
         selected_exercise = None
     
-    # Parse CSV and create activity
+    athlete = current_athlete()
+    if athlete is None:
+        return
+    
+    # Timestamped exports become one activity per session, with real start and elapsed times
+    try:
+        sessions = get_sessions(st.session_state.uploaded_file) if st.session_state.get('split_sessions', True) else None
+    except Exception:
+        sessions = None
+    if sessions:
+        handle_session_uploads(athlete, sessions, selected_exercise)
+        try:
+            archive_upload(st.session_state.uploaded_file, athlete)
+        except Exception as e:
+            if st.session_state.debug_mode:
+                st.write(f"Debug: Could not archive workout: {str(e)}")
+        return
+    
+    # Check for a previous upload of the same workout before any network call
+    try:
+        fingerprints = upload_fingerprints(st.session_state.uploaded_file, selected_exercise)
+    except Exception:
+        # Malformed CSV; parse_csv below reports the error
+        fingerprints = None
+    if fingerprints and not st.session_state.get('allow_duplicates', False):
+        existing = find_duplicate(athlete, fingerprints)
+        if existing:
+            st.warning(f"Skipped: this workout was already uploaded as '{existing['name']}'.")
+            st.markdown(f"[View existing activity]({activity_url(existing['activity_id'])})", unsafe_allow_html=True)
+            return
+        pending = outbox.find_pending(athlete, fingerprints)
+        if pending:
+            st.warning(f"Skipped: this workout is already queued for upload as '{pending['name']}'.")
+            return
+        # Identical totals may just be a repeat session, so upload it and let the user decide
+        similar = find_similar(athlete, fingerprints)
+        if similar:
+            st.warning(f"A workout with identical totals was already uploaded as '{similar['name']}'. "
+                       "Uploading anyway; delete one of them on Strava if they are the same session.")
+            st.markdown(f"[View existing activity]({activity_url(similar['activity_id'])})", unsafe_allow_html=True)
+    
+    manager = get_token_manager()
+    
+    # Parse CSV and build the activity
     description, elapsed_time, total_weight, total_sets, total_reps, _ = parse_csv(
         st.session_state.uploaded_file, 
-        selected_exercise
+        selected_exercise,
+        description_format=st.session_state.get('description_format')
     )
+    description += progress_notes(athlete, st.session_state.uploaded_file, selected_exercise)
     
     # Check if we already have a name from the preview
     if st.session_state.get('activity_name') and st.session_state.activity_name:
@@ -108,26 +200,359 @@ def handle_upload():
         # Use appropriate naming strategy - pass None for base_name to use default
         unique_name = generate_unique_name(None, total_weight, total_sets, total_reps, selected_exercise)
     
-    current_time_str = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    # Already on Strava today under this name (e.g. uploaded from another device), as of the last
+    # activity sync. Names only carry the totals, so like identical totals this may be a repeat
+    # session: upload and let the user decide
+    if not st.session_state.get('allow_duplicates', False):
+        from api.activity_sync import activity_cache
+        existing = activity_cache.find_uploaded(athlete, unique_name, day=datetime.now())
+        if existing:
+            st.warning(f"An activity named '{unique_name}' is already on Strava today. "
+                       "Uploading anyway; delete one of them on Strava if they are the same session.")
+            st.markdown(f"[View existing activity]({activity_url(existing['id'])})", unsafe_allow_html=True)
     
-    result = create_activity(
-        access_token=access_token,
-        name=unique_name,
-        activity_type="WeightTraining",
-        start_date=current_time_str,
-        elapsed_time=elapsed_time,
-        description=description,
-        debug=st.session_state.debug_mode
-    )
+    # The workout is taken to have just finished
+    start_at = datetime.now().timestamp() - elapsed_time
+    if st.session_state.get('upload_format') == "FIT file":
+        from data.parser import get_workout
+        payload = fit_payload(get_workout(st.session_state.uploaded_file), unique_name, description, selected_exercise,
+                              start=start_at, elapsed_time=elapsed_time)
+    else:
+        current_time_str = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        payload = {
+            'name': unique_name,
+            'activity_type': "WeightTraining",
+            'start_date': current_time_str,
+            'elapsed_time': elapsed_time,
+            'description': description
+        }
+    if st.session_state.debug_mode:
+        st.write("Debug - Queued Activity:", {key: value for key, value in payload.items() if key != 'fit'})
+    
+    # Everything the worker needs after a successful upload, since the file may be gone by then
+    meta = {'fingerprints': fingerprints}
+    try:
+        stats = upload_stats(st.session_state.uploaded_file, selected_exercise)
+        if stats:
+            meta['history'] = {'key': session_key(st.session_state.uploaded_file, selected_exercise), 'stats': stats}
+    except Exception as e:
+        if st.session_state.debug_mode:
+            st.write(f"Debug: Could not prepare workout history: {str(e)}")
+    
+    # Written to disk before we acknowledge it; workers post it in the background
+    job_id = outbox.enqueue(athlete, payload, meta, start_at)
+    outbox.register_token_source(athlete, manager.get_access_token, manager.client_id)
+    st.session_state.upload_jobs = st.session_state.get('upload_jobs', []) + [job_id]
+    st.success(f"Activity '{unique_name}' queued for upload. Its status is shown below.")
+    
+    # Keep the parsed workout for re-analysis without re-uploading the CSV; archived once queued, since
+    # the workers no longer have the rows when the upload succeeds
+    try:
+        archive_upload(st.session_state.uploaded_file, athlete)
+    except Exception as e:
+        if st.session_state.debug_mode:
+            st.write(f"Debug: Could not archive workout: {str(e)}")
+
+
+# Outbox payload that uploads a workout as a FIT file (every set, with laps per exercise or set)
+# through Strava's uploads endpoint instead of creating a manual activity
+def fit_payload(workout, name, description, selected_exercise=None, start=None, elapsed_time=None):
+    import re
+    import base64
+    from data.fit import encode_fit, FIT_LAP_MODE, FIT_TIMEZONE
+    
+    data = encode_fit(workout, selected_exercise, st.session_state.get('fit_lap_mode', FIT_LAP_MODE), start, elapsed_time,
+                      st.session_state.get('fit_timezone', FIT_TIMEZONE))
+    return {
+        'name': name,
+        'description': description,
+        'fit': base64.b64encode(data).decode('ascii'),
+        'external_id': f"{re.sub(r'[^A-Za-z0-9._-]+', '_', name)[:80]}.fit"
+    }
+
+
+# Activity name, summary and description for each session that contains the selected exercise
+def session_activities(athlete, sessions, selected_exercise=None):
+    from data.parser import summarize_workout, generate_unique_name, render_description
+    from data.history import workout_progress_notes
+    
+    activities = []
+    for session in sessions:
+        if selected_exercise and selected_exercise not in session['exercises']:
+            continue
+        summary, _ = summarize_workout(session, selected_exercise)
+        name = generate_unique_name(None, summary['total_weight'], summary['total_sets'], summary['total_reps'], selected_exercise)
+        if len(sessions) > 1 and session['start']:
+            name = f"{name} ({session['start']:%b %d})"
+        description = render_description(summary, st.session_state.get('description_format'))
+        description += workout_progress_notes(athlete, session, selected_exercise)
+        activities.append((session, summary, name, description))
+    return activities
+
+
+# Enqueue one activity per session of a timestamped export, skipping sessions already uploaded
+def handle_session_uploads(athlete, sessions, selected_exercise=None):
+    from data.history import workout_stats, workout_key
+    from data.upload_index import workout_fingerprints, find_duplicate, find_similar
+    from api.outbox import outbox
+    
+    manager = get_token_manager()
+    
+    queued, skipped, similar = [], [], []
+    allow_duplicates = st.session_state.get('allow_duplicates', False)
+    for session, summary, name, description in session_activities(athlete, sessions, selected_exercise):
+        fingerprints = workout_fingerprints(session, summary)
+        if not allow_duplicates:
+            if find_duplicate(athlete, fingerprints) or outbox.find_pending(athlete, fingerprints):
+                skipped.append(name)
+                continue
+            if find_similar(athlete, fingerprints):
+                similar.append(name)
+        
+        start = session['start'] or datetime.now()
+        if st.session_state.get('upload_format') == "FIT file":
+            payload = fit_payload(session, name, description, selected_exercise)
+        else:
+            payload = {
+                'name': name,
+                'activity_type': "WeightTraining",
+                'start_date': start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'elapsed_time': summary['elapsed_time'],
+                'description': description
+            }
+        meta = {'fingerprints': fingerprints}
+        stats = workout_stats(session, selected_exercise)
+        if stats:
+            meta['history'] = {
+                'key': workout_key(session, selected_exercise),
+                'stats': stats,
+                'recorded_at': start.timestamp()
+            }
+        queued.append(outbox.enqueue(athlete, payload, meta, start.timestamp()))
     
-    if result:
-        st.success(f"Activity '{unique_name}' created successfully on Strava!")
-        st.markdown("[View on Strava](https://www.strava.com/dashboard)", unsafe_allow_html=True)
+    outbox.register_token_source(athlete, manager.get_access_token, manager.client_id)
+    st.session_state.upload_jobs = st.session_state.get('upload_jobs', []) + queued
+    if queued:
+        st.success(f"{len(queued)} activities queued for upload. Their status is shown below.")
+    if skipped:
+        st.warning(f"Skipped {len(skipped)} sessions that were already uploaded or queued: {', '.join(skipped)}")
+    if similar:
+        st.warning(f"{len(similar)} sessions have the same totals as an earlier upload and were queued anyway: {', '.join(similar)}")
+
+
+# Status of this session's queued uploads, read by primary key on each rerun
+def upload_jobs_panel():
+    from api.outbox import outbox
+    from data.upload_index import activity_url
+    
+    # Let workers pick up this user's jobs, including ones left over from before a restart
+    manager = st.session_state.get('token_manager')
+    if manager is not None and manager.athlete_id is not None:
+        outbox.register_token_source(str(manager.athlete_id), manager.get_access_token, manager.client_id)
+    
+    job_ids = st.session_state.get('upload_jobs', [])
+    if not job_ids:
+        return
+    
+    st.markdown("### Uploads")
+    for job in outbox.status(job_ids):
+        if job['status'] == 'done':
+            st.markdown(f"✅ [{job['name']}]({activity_url(job['activity_id'])}) uploaded")
+        elif job['status'] == 'failed':
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.error(f"{job['name']}: upload failed after {job['attempts']} attempts. {job['error'] or ''}")
+                if job['unconfirmed']:
+                    st.caption("It may have reached Strava anyway; Retry looks for it before posting again.")
+            with col2:
+                if st.button("Retry", key=f"retry_{job['id']}"):
+                    outbox.retry(job['id'])
+                    st.rerun()
+        elif job['status'] == 'running':
+            st.info(f"⏳ {job['name']}: uploading...")
+        elif job['status'] == 'processing':
+            st.info(f"⏳ {job['name']}: processing on Strava...")
+        else:
+            retry_note = f" (retrying after: {job['error']})" if job['error'] else ""
+            if job['unconfirmed']:
+                retry_note += ", checking Strava for it first"
+            st.info(f"🕒 {job['name']}: queued{retry_note}")
+    st.button("Refresh status", key="refresh_upload_jobs")
+
+
+# Handle bulk upload of several files, updating a per-file result table as uploads finish
+def handle_bulk_upload(files):
+    from api.bulk import bulk_upload
+    from api.rate_limit import INTERACTIVE_MAX_WAIT
+    
+    athlete = current_athlete()
+    if athlete is None:
+        return
+    manager = get_token_manager()
+    access_token = get_valid_access_token()
+    if not access_token:
+        return
+    
+    rows = [{'file': f.name, 'status': 'queued', 'activity': '', 'activity_id': None, 'seconds': None, 'error': ''} for f in files]
+    progress = st.progress(0.0, text=f"Uploading 0 of {len(files)} files...")
+    table = st.empty()
+    table.dataframe(rows, use_container_width=True)
+    
+    done = 0
+    for index, result in bulk_upload(athlete, access_token, files, client_id=manager.client_id, max_wait=INTERACTIVE_MAX_WAIT):
+        rows[index] = result
+        done += 1
+        progress.progress(done / len(files), text=f"Uploading {done} of {len(files)} files...")
+        table.dataframe(rows, use_container_width=True)
+    
+    uploaded = sum(1 for row in rows if row['status'] == 'uploaded')
+    duplicates = sum(1 for row in rows if row['status'] == 'duplicate')
+    if uploaded == len(files):
+        st.success(f"All {uploaded} activities created successfully on Strava!")
+    elif uploaded + duplicates == len(files):
+        st.success(f"{uploaded} activities created; {duplicates} files were already uploaded and were skipped.")
+    else:
+        st.warning(f"{uploaded} of {len(files)} activities created. See the table above for errors.")
+    st.markdown(f"[View on Strava]({strava_url('dashboard')})", unsafe_allow_html=True)
+
+
+# Bring the local copy of the athlete's Strava activities up to date (a delta sync unless full, or
+# a re-read of everything after `since`)
+def sync_activities(full=False, since=None):
+    from api.activity_sync import activity_cache
+    from api.rate_limit import INTERACTIVE_MAX_WAIT
+    
+    athlete = current_athlete()
+    if athlete is None:
+        return None
+    manager = get_token_manager()
+    access_token = get_valid_access_token()
+    if not access_token:
+        return None
+    result = activity_cache.sync(athlete, access_token, full=full, client_id=manager.client_id,
+                                 max_wait=INTERACTIVE_MAX_WAIT, since=since)
+    st.session_state.activity_sync = result
+    return result
+
+
+# Activities already on Strava, from the local cache; synced once per session and on demand
+def strava_activities_panel():
+    from api.activity_sync import activity_cache
+    from data.upload_index import activity_url
+    
+    if not st.session_state.get('token_data'):
+        return
+    athlete = current_athlete()
+    if athlete is None:
+        return
+    if 'activity_sync' not in st.session_state:
+        try:
+            sync_activities()
+        except Exception as e:
+            st.session_state.activity_sync = {'error': str(e)}
+    
+    with st.expander("Activities on Strava"):
+        result = st.session_state.get('activity_sync') or {}
+        if result.get('error'):
+            st.warning(f"Could not sync activities from Strava: {result['error']}")
+        stats = activity_cache.stats(athlete)
+        st.caption(f"{stats['activities']} activities cached, last synced {stats['last_sync'] or 'never'}.")
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            if st.button("Sync now", key="sync_activities"):
+                result = sync_activities()
+                if result and not result.get('error'):
+                    st.success(f"{result['fetched']} new or updated activities.")
+        with col2:
+            if st.button("Full resync", key="full_sync_activities"):
+                result = sync_activities(full=True)
+                if result and not result.get('error'):
+                    st.success(f"Re-read {result['fetched']} activities; {result.get('removed', 0)} deleted on Strava.")
+        # Verify this session's finished uploads against what Strava reported
+        from api.outbox import outbox
+        done = [job for job in outbox.status(st.session_state.get('upload_jobs', [])) if job['status'] == 'done']
+        uploaded = [job['activity_id'] for job in done]
+        if uploaded and stats['last_sync']:
+            missing = set(activity_cache.reconcile(athlete, uploaded)['missing'])
+            if missing:
+                st.info(f"{len(missing)} of {len(uploaded)} uploads from this session are not in the last sync.")
+                # A backfilled session starts before the newest cached activity, so a delta sync never
+                # sees it: re-read from a day before the earliest one (start dates may be local time)
+                earliest = min(job['start_at'] or job['created_at'] for job in done if job['activity_id'] in missing)
+                if st.button("Check again", key="resync_uploads"):
+                    result = sync_activities(since=earliest - 86400)
+                    if result and result.get('error'):
+                        st.warning(f"Could not sync activities from Strava: {result['error']}")
+                    elif result:
+                        st.rerun()
+            else:
+                st.caption(f"All {len(uploaded)} uploads from this session are on Strava.")
+        recent = activity_cache.search(athlete, limit=20)
+        if recent:
+            st.dataframe([
+                {'date': a['start_date_local'], 'name': a['name'], 'type': a['sport_type'], 'link': activity_url(a['id'])}
+                for a in recent
+            ], use_container_width=True)
+
+
+def bulk_upload_phase():
+    st.markdown("🏋️ Drag and drop your CSV files here or click to upload", unsafe_allow_html=True)
+    files = st.file_uploader("Upload CSV files", type=["csv"], key="bulk_files", accept_multiple_files=True, label_visibility="collapsed")
+    
+    if files:
+        st.success(f"{len(files)} files uploaded.")
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            if st.button("Upload All to Strava"):
+                handle_bulk_upload(files)
+        with col2:
+            if st.button("Back to Authorization"):
+                set_phase('authorization')
     else:
-        st.error("Error creating activity. Check your Strava API limits.")
+        st.info("Please upload one or more CSV files to continue.")
+
+
+# Re-analyse a previously uploaded session straight from the columnar archive
+def archive_phase():
+    from datetime import datetime as dt
+    from data.archive import list_archives, load_archived_workout
+    from data.parser import summarize_archive
+    
+    athlete = current_athlete()
+    if athlete is None:
+        return
+    
+    archives = list_archives(athlete)
+    if not archives:
+        st.info("No archived sessions yet. Sessions are archived when they are queued for upload.")
+        return
+    
+    labels = {a['key']: f"{a['name']} ({a['rows']} rows, {dt.fromtimestamp(a['archived_at']):%b %d %H:%M})" for a in archives}
+    key = st.selectbox("Archived session:", options=list(labels), format_func=labels.get, key="archive_key")
+    
+    try:
+        workout = load_archived_workout(athlete, key)
+        st.write("Preview:", workout['df'].head())
+        
+        exercise_options = ["All Exercises"] + workout['exercises'].tolist()
+        selected_exercise = st.selectbox("Select Exercise (or show all):", options=exercise_options, key="archive_exercise", index=0)
+        if selected_exercise == "All Exercises":
+            selected_exercise = None
+        
+        summary, _ = summarize_archive(athlete, key, selected_exercise)
+        st.text_area("Description:", value=summary['description'], height=300, disabled=True)
+    except Exception as e:
+        st.error(f"Error loading archived session: {str(e)}")
 
 
 def upload_phase():
+    from data.parser import parse_csv, generate_unique_name, preview_workout, summarize_csv, get_sessions
+    from data.history import progress_notes
+    from data.vbt import vbt_records
+    from data.templates import FORMATS, DESCRIPTION_FORMAT
+    from zoneinfo import available_timezones
+    from data.fit import LAP_MODES, FIT_LAP_MODE, FIT_TIMEZONE
+    
     st.markdown('### 3. Workout Details', unsafe_allow_html=True)
     st.info("You are already authorized with Strava. Your credentials are set and shown below for verification.")
     client_id, client_secret = get_credentials()
@@ -135,6 +560,14 @@ def upload_phase():
     st.write(f"**Strava Client Secret:** {'*' * len(client_secret)}")
     st.info(f"Token expires at: {datetime.fromtimestamp(st.session_state.token_data['expires_at']) if st.session_state.token_data else 'N/A'}")
     
+    upload_mode = st.radio("Upload mode:", ["Single file", "Bulk (multiple files)", "Archived session"], key="upload_mode", horizontal=True)
+    if upload_mode == "Bulk (multiple files)":
+        bulk_upload_phase()
+        return
+    if upload_mode == "Archived session":
+        archive_phase()
+        return
+    
     # Upload file first to get exercise options
     st.markdown("🏋️ Drag and drop your CSV file here or click to upload", unsafe_allow_html=True)
     uploaded_file = st.file_uploader("Upload CSV file", type=["csv"], key="uploaded_file", label_visibility="collapsed")
@@ -143,37 +576,72 @@ def upload_phase():
         st.success(f"File uploaded: {uploaded_file.name}")
         
         try:
-            # Get exercise options from the file
-            import pandas as pd
-            df = pd.read_csv(uploaded_file)
+            # Get exercise options from the file (parsed once per file content and cached)
+            preview_df, exercises = preview_workout(uploaded_file)
             
             # Preview the data
-            st.write("Preview:", df.head())
+            st.write("Preview:", preview_df)
             
             # Get unique exercises
-            exercises = df['Exercise'].unique().tolist()
+            exercises = exercises.tolist()
             exercise_options = ["All Exercises"] + exercises
             
-            # Reset file position for later use
-            uploaded_file.seek(0)
-            
             # Only show exercise selector
             st.selectbox("Select Exercise (or show all):", 
                          options=exercise_options, 
                          key="selected_exercise",
                          index=0)
+            st.selectbox("Description format:", options=list(FORMATS), key="description_format",
+                         index=list(FORMATS).index(DESCRIPTION_FORMAT) if DESCRIPTION_FORMAT in FORMATS else 0)
+            # A FIT file keeps every set (load, reps, velocity) as structured data on Strava
+            upload_format = st.radio("Upload as:", ["Manual activity", "FIT file"], key="upload_format", horizontal=True)
+            if upload_format == "FIT file":
+                st.selectbox("Laps:", options=list(LAP_MODES), key="fit_lap_mode",
+                             format_func=lambda mode: f"One per {mode}",
+                             index=LAP_MODES.index(FIT_LAP_MODE) if FIT_LAP_MODE in LAP_MODES else 0)
+                # The export's timestamps are the athlete's wall-clock time, wherever this app runs
+                timezones = sorted(available_timezones() | {FIT_TIMEZONE})
+                st.selectbox("Your time zone:", options=timezones, key="fit_timezone", index=timezones.index(FIT_TIMEZONE))
+            
+            # Multi-session exports can be split into one activity per session
+            sessions = get_sessions(uploaded_file)
+            if sessions and len(sessions) > 1:
+                st.info(f"{len(sessions)} training sessions found in this file (split at gaps in the timestamps).")
+                st.checkbox("Upload one activity per session", key="split_sessions", value=True)
+            if not st.session_state.get('split_sessions', True):
+                sessions = None
             
             # Show description preview
             if st.button("Generate Preview"):
                 selected_exercise = st.session_state.selected_exercise
                 if selected_exercise == "All Exercises":
                     selected_exercise = None
-                    
+                # Progress notes compare against this athlete's history (none without one)
+                athlete = current_athlete()
+                
+                if sessions:
+                    activities = session_activities(athlete, sessions, selected_exercise)
+                    st.markdown("### Activity Preview")
+                    st.dataframe([
+                        {'name': name, 'start': session['start'], 'minutes': round(summary['elapsed_time'] / 60), 'rows': len(session['df'])}
+                        for session, summary, name, _ in activities
+                    ], use_container_width=True)
+                    for session, summary, name, description in activities[:10]:
+                        with st.expander(name):
+                            st.text(description)
+                    if len(activities) > 10:
+                        st.caption(f"Showing the first 10 of {len(activities)} sessions.")
+                    st.session_state.preview_generated = True
+                
                 description, _, total_weight, total_sets, total_reps, _ = parse_csv(
                     uploaded_file, 
-                    selected_exercise
+                    selected_exercise,
+                    description_format=st.session_state.get('description_format')
                 )
-                uploaded_file.seek(0)  # Reset position again
+                description += progress_notes(athlete, uploaded_file, selected_exercise)
+                
+                if sessions:
+                    st.markdown("### Whole File")
                 
                 # Generate name for activity - just once
                 activity_name = generate_unique_name(None, total_weight, total_sets, total_reps, selected_exercise)
@@ -183,9 +651,24 @@ def upload_phase():
                 st.write(f"**Generated Name:** {activity_name}")
                 st.text_area("Description Preview:", value=description, height=300, disabled=True)
                 
+                # Structured velocity-based training results (cached alongside the summary)
+                summary, _ = summarize_csv(uploaded_file, selected_exercise)
+                if summary.get('vbt') is not None:
+                    with st.expander("Velocity-based training"):
+                        st.write("Per exercise:", summary['vbt']['exercises'])
+                        st.write("Per set:", summary['vbt']['sets'])
+                        st.download_button(
+                            "Download VBT JSON",
+                            json.dumps(vbt_records(summary['vbt']), default=str),
+                            file_name="vbt.json",
+                            mime="application/json"
+                        )
+                
                 # Reset preview when changing selection
                 st.session_state.preview_generated = True
             
+            st.checkbox("Upload even if this workout was uploaded before", key="allow_duplicates", value=False)
+            
             col1, col2 = st.columns([1, 1])
             with col1:
                 if st.button("Upload to Strava"):
@@ -199,9 +682,13 @@ def upload_phase():
             st.info("Please make sure your CSV file has an 'Exercise' column.")
     else:
         st.info("Please upload a CSV file to continue.")
+    
+    upload_jobs_panel()
+    strava_activities_panel()
 
         
 def main():
+    start_run()
     init_session_state()
     # Clean up old entries in temp_storage
     clean_temp_storage()
@@ -213,6 +700,7 @@ def main():
 
         query_params = st.query_params
         if "code" in query_params:
+            from auth.oauth import get_access_token
             client_id, client_secret = get_credentials()
             if not client_id or not client_secret:
                 st.error("Credentials could not be retrieved. Please re-enter them.")
@@ -223,28 +711,59 @@ def main():
                 if token_data:
                     st.session_state.token_data = token_data
                     st.session_state.auth_success = True
+                    start_token_manager(token_data)
                     
                     # Clean up temp_storage after successful token retrieval
                     temp_key = st.session_state.get('temp_key')
                     if temp_key:
-                        temp_storage = load_temp_storage()
-                        if temp_key in temp_storage:
-                            del temp_storage[temp_key]
-                            save_temp_storage(temp_storage)
+                        delete_temp_entry(temp_key)
                     
                     set_phase('upload')
                 else:
                     st.error("Failed to get access token. Please try authorizing again.")
     
     # Sidebar settings
+    stage_breakdown = None
     with st.sidebar:
         st.title("App Settings")
         st.session_state.debug_mode = st.toggle("Debug Mode", value=st.session_state.debug_mode)
         if st.session_state.debug_mode:
             st.info("Debug mode is enabled. Detailed request and response information will be shown.")
+            # Filled in once the rest of this run has finished
+            stage_breakdown = st.empty()
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                st.download_button("Metrics JSON", export_json(), file_name="metrics.json", mime="application/json")
+            with col2:
+                st.download_button("Prometheus", export_prometheus(), file_name="metrics.prom", mime="text/plain")
+            st.write("Import timings:", import_report())
+            st.write("Temp storage cache:", temp_storage_stats())
+            if st.session_state.phase == 'upload':
+                from data.cache import workout_cache
+                from data.history import history_stats
+                from data.upload_index import upload_index
+                from api.outbox import outbox
+                from api.activity_sync import activity_cache
+                from api.rate_limit import scheduler_for
+                from utils.http_client import http_client
+                st.write("Workout cache:", workout_cache.stats())
+                manager = st.session_state.get('token_manager')
+                if manager is not None and manager.athlete_id is not None:
+                    st.write("Workout history:", history_stats(manager.athlete_id))
+                st.write("Upload index:", upload_index.stats())
+                st.write("Upload queue:", outbox.stats())
+                st.write("Activity cache:", activity_cache.stats())
+                st.write("Strava API budget:", scheduler_for(st.session_state.client_id).usage())
+                st.write("Strava HTTP latency:", http_client.latency_stats())
+            if st.session_state.get('token_manager'):
+                st.write("Token manager:", st.session_state.token_manager.stats())
         st.divider()
         if st.button("Reset Application"):
             debug_mode = st.session_state.debug_mode
+            if st.session_state.get('token_manager'):
+                from api.outbox import outbox
+                outbox.unregister_token_source(str(st.session_state.token_manager.athlete_id))
+                st.session_state.token_manager.stop()
             for key in list(st.session_state.keys()):
                 if key != 'debug_mode':
                     del st.session_state[key]
@@ -256,9 +775,7 @@ def main():
             st.session_state.debug_mode = debug_mode
             
             # Clear temp_storage on reset
-            temp_storage = load_temp_storage()
-            temp_storage.clear()
-            save_temp_storage(temp_storage)
+            clear_temp_storage()
             
             st.success("Application has been reset.")
             st.rerun()
@@ -274,7 +791,7 @@ def main():
     elif st.session_state.phase == 'authorization':
         st.markdown('### 2. Authorize with Strava', unsafe_allow_html=True)
         temp_key = st.session_state.get('temp_key', '')
-        auth_url = f"https://www.strava.com/oauth/authorize?client_id={st.session_state.client_id}&response_type=code&redirect_uri={redirect_uri}&approval_prompt=force&scope=activity:write&state={temp_key}"
+        auth_url = f"{strava_url('oauth/authorize')}?client_id={st.session_state.client_id}&response_type=code&redirect_uri={redirect_uri}&approval_prompt=force&scope=activity:write,activity:read_all&state={temp_key}"
         st.info(f"""
         **Client ID:** {st.session_state.client_id}
         To authorize:
@@ -291,6 +808,7 @@ def main():
         with col1:
             if st.button("Verify & Continue"):
                 if st.session_state.manual_auth_code:
+                    from auth.oauth import get_access_token
                     client_id, client_secret = get_credentials()
                     if not client_id or not client_secret:
                         st.error("Credentials missing. Please re-enter them.")
@@ -300,14 +818,12 @@ def main():
                         if token_data:
                             st.session_state.token_data = token_data
                             st.session_state.auth_success = True
+                            start_token_manager(token_data)
                             
                             # Clean up temp_storage after successful token retrieval
                             temp_key = st.session_state.get('temp_key')
                             if temp_key:
-                                temp_storage = load_temp_storage()
-                                if temp_key in temp_storage:
-                                    del temp_storage[temp_key]
-                                    save_temp_storage(temp_storage)
+                                delete_temp_entry(temp_key)
                             
                             set_phase('upload')
                         else:
@@ -319,6 +835,13 @@ def main():
     # Upload phase
     elif st.session_state.phase == 'upload':
         upload_phase()
+    
+    # The page is on screen; warm up the upload phase imports while the user goes through OAuth
+    if st.session_state.phase != 'upload':
+        prewarm_imports()
+    
+    if stage_breakdown is not None:
+        stage_breakdown.write({"Stage timings (this run)": current_run()})
 
 if __name__ == "__main__":
     main()
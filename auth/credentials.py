@@ -1,7 +1,7 @@
 import uuid
 import time
 import streamlit as st
-from utils.storage import load_temp_storage, save_temp_storage
+from utils.storage import get_temp_entry, put_temp_entry
 
 # Save credentials and store in temp_storage
 def save_credentials():
@@ -24,14 +24,11 @@ def save_credentials():
     temp_key = str(uuid.uuid4())  # Unique identifier
     expiry_time = time.time() + 300  # 5 minutes expiry
     
-    # Load latest temp_storage
-    temp_storage = load_temp_storage()
-    temp_storage[temp_key] = {
+    put_temp_entry(temp_key, {
         'client_id': st.session_state.client_id,
         'client_secret': st.session_state.client_secret,
         'expires_at': expiry_time
-    }
-    save_temp_storage(temp_storage)
+    })
     
     st.session_state.temp_key = temp_key
     
@@ -53,11 +50,11 @@ def get_credentials():
             temp_key = st.query_params.get('state')
         
         if temp_key:
-            # Reload temp_storage to get latest
-            temp_storage = load_temp_storage()
-            if temp_key in temp_storage:
-                client_id = temp_storage[temp_key]['client_id']
-                client_secret = temp_storage[temp_key]['client_secret']
+            # Look up the latest entry for this key
+            entry = get_temp_entry(temp_key)
+            if entry:
+                client_id = entry['client_id']
+                client_secret = entry['client_secret']
                 # Restore to session_state
                 st.session_state.client_id = client_id
                 st.session_state.client_secret = client_secret
@@ -1,32 +1,52 @@
 import requests
 import streamlit as st
 
-# Get access token and refresh token
-def get_access_token(client_id, client_secret, code, debug=False):
-    url = "https://www.strava.com/oauth/token"
+from api.rate_limit import strava_request, RateLimitError, INTERACTIVE_MAX_WAIT
+from api.urls import strava_url
+from utils.metrics import timed, increment
+
+# Exchange an authorization code without touching the Streamlit UI. Returns (token_data, error_text).
+def request_token_exchange(client_id, client_secret, code, max_wait=None):
+    url = strava_url("oauth/token")
     payload = {
         "client_id": int(client_id),
         "client_secret": client_secret,
         "code": code,
         "grant_type": "authorization_code"
     }
-    if debug:
-        st.write("Debug - Token Exchange Request:", payload)
     
-    response = requests.post(url, data=payload)
+    try:
+        response = strava_request("POST", url, client_id=client_id, max_wait=max_wait, data=payload)
+    except (RateLimitError, requests.RequestException) as e:
+        return None, str(e)
     if response.status_code == 200:
-        token_data = response.json()
+        return response.json(), None
+    return None, response.text
+
+# Get access token and refresh token
+def get_access_token(client_id, client_secret, code, debug=False):
+    if debug:
+        st.write("Debug - Token Exchange Request:", {
+            "client_id": int(client_id),
+            "client_secret": client_secret,
+            "code": code,
+            "grant_type": "authorization_code"
+        })
+    
+    token_data, error = request_token_exchange(client_id, client_secret, code, max_wait=INTERACTIVE_MAX_WAIT)
+    if token_data:
         if debug:
             safe_token_data = {k: v if k != 'access_token' else v[:10] + '...' for k, v in token_data.items()}
             st.write("Token Exchange Successful:", safe_token_data)
         return token_data
     else:
-        st.error(f"Token Exchange Error: {response.text}")
+        st.error(f"Token Exchange Error: {error}")
         return None
 
-# Refresh access token
-def refresh_access_token(client_id, client_secret, refresh_token, debug=False):
-    url = "https://www.strava.com/oauth/token"
+# Exchange a refresh token without touching the Streamlit UI, so it is safe to call from
+# background threads. Returns (token_data, error_text).
+def request_token_refresh(client_id, client_secret, refresh_token, max_wait=None):
+    url = strava_url("oauth/token")
     payload = {
         "client_id": int(client_id),
         "client_secret": client_secret,
@@ -34,13 +54,25 @@ def refresh_access_token(client_id, client_secret, refresh_token, debug=False):
         "grant_type": "refresh_token"
     }
     
-    response = requests.post(url, data=payload)
+    try:
+        with timed('token_refresh'):
+            response = strava_request("POST", url, client_id=client_id, max_wait=max_wait, data=payload)
+    except (RateLimitError, requests.RequestException) as e:
+        increment('token_refresh_failures')
+        return None, str(e)
     if response.status_code == 200:
-        token_data = response.json()
+        return response.json(), None
+    increment('token_refresh_failures')
+    return None, response.text
+
+# Refresh access token
+def refresh_access_token(client_id, client_secret, refresh_token, debug=False):
+    token_data, error = request_token_refresh(client_id, client_secret, refresh_token, max_wait=INTERACTIVE_MAX_WAIT)
+    if token_data:
         if debug:
             safe_token_data = {k: v if k != 'access_token' else v[:10] + '...' for k, v in token_data.items()}
             st.write("Token Refresh Successful:", safe_token_data)
         return token_data
     else:
-        st.error(f"Token Refresh Error: {response.text}")
-        return None
\ No newline at end of file
+        st.error(f"Token Refresh Error: {error}")
+        return None
@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+from auth.oauth import request_token_refresh
+
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = int(os.getenv("STRAVA_TOKEN_REFRESH_MARGIN", "300"))
+# Wait before retrying a failed refresh in the background
+RETRY_DELAY = 30
+
+class TokenManager:
+    # Holds one user's Strava tokens and keeps them fresh while they are in use.
+    # get_access_token() is served from memory; within refresh_margin of expiry it also starts a
+    # background refresh, and only an already expired token makes the caller wait. Concurrent
+    # callers share a single in-flight refresh. Nothing runs between calls, so a session that is
+    # abandoned leaves no thread behind. on_refresh(token_data) is called after every successful
+    # refresh, e.g. to persist a rotated refresh token.
+    def __init__(self, client_id, client_secret, token_data, refresh_margin=REFRESH_MARGIN, athlete_id=None, on_refresh=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_data = token_data
+        # The athlete the tokens belong to, from the authorization response (None if it had none)
+        self.athlete_id = athlete_id or (token_data.get('athlete') or {}).get('id')
+        self.refresh_margin = refresh_margin
+        self.on_refresh = on_refresh
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._retry_at = 0.0
+        self._background = False
+        self._stopped = False
+        self.refreshes = 0
+        self.failures = 0
+        self.blocked_calls = 0
+        self.seconds_blocked = 0.0
+        self.last_error = None
+
+    # Start a refresh on its own thread, unless one is under way or the last one failed recently
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._stopped or self._background or self._inflight is not None or time.time() < self._retry_at:
+                return
+            self._background = True
+        threading.Thread(target=self._background_refresh, name="token-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._background = False
+
+    # Refresh the token, joining a refresh already in flight instead of starting another.
+    # Returns the new token data, or None if the refresh failed.
+    def refresh(self, max_wait=None):
+        with self._lock:
+            owner = self._inflight is None
+            if owner:
+                self._inflight = Future()
+            inflight = self._inflight
+
+        if not owner:
+            return inflight.result()
+
+        token_data = None
+        try:
+            token_data, error = request_token_refresh(self.client_id, self.client_secret, self.token_data['refresh_token'], max_wait)
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            if token_data:
+                # Refresh responses don't repeat the athlete
+                if 'athlete' not in token_data and 'athlete' in self.token_data:
+                    token_data['athlete'] = self.token_data['athlete']
+                self.token_data = token_data
+                self.refreshes += 1
+                self.last_error = None
+            else:
+                self.failures += 1
+                self.last_error = error
+                # Keep serving the current token while it lasts; try again after a pause
+                self._retry_at = time.time() + RETRY_DELAY
+            self._inflight = None
+        if token_data and self.on_refresh:
+            try:
+                self.on_refresh(token_data)
+            except Exception:
+                # Saving is the callback's business; the new token is good either way
+                pass
+        inflight.set_result(token_data)
+        return token_data
+
+    # Return a valid access token, blocking on a refresh only if the current one has expired
+    # (max_wait caps the refresh's wait for rate-limit budget, for interactive callers)
+    def get_access_token(self, max_wait=None):
+        token_data = self.token_data
+        now = time.time()
+        if now < token_data['expires_at']:
+            if now >= token_data['expires_at'] - self.refresh_margin:
+                self._refresh_in_background()
+            return token_data['access_token']
+
+        started = time.perf_counter()
+        token_data = self.refresh(max_wait)
+        with self._lock:
+            self.blocked_calls += 1
+            self.seconds_blocked += time.perf_counter() - started
+        return token_data['access_token'] if token_data else None
+
+    # Stop starting background refreshes (e.g. on reset or re-authorization)
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'expires_in': int(self.token_data['expires_at'] - time.time()),
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'blocked_calls': self.blocked_calls,
+                'seconds_blocked': round(self.seconds_blocked, 3),
+                'refresh_in_flight': self._inflight is not None,
+                'last_error': self.last_error
+            }
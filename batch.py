@@ -0,0 +1,363 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+from api.bulk import BULK_MAX_WORKERS
+from api.starva_api import get_athlete, post_activity, send_upload, upload_outcome
+from api.uploads import UploadPoller
+from auth.tokens import TokenManager
+from data.fit import FIT_TIMEZONE, write_fit
+from data.parser import CSV_CHUNKSIZE, parse_csv, generate_unique_name, get_workout
+from data.history import progress_notes, upload_stats, session_key, record_session
+from data.upload_index import upload_fingerprints, find_duplicate, remember_upload
+
+# Headless batch upload, e.g. for a nightly sync of device exports:
+#   python batch.py exports/ --token-file strava_tokens.json --report batch_report.jsonl
+# CSVs are parsed across a process pool (one worker per core by default) and uploaded by a
+# bounded thread pool as soon as each parse finishes. Every result is appended to a JSON-lines
+# report and flushed to disk, so an interrupted run picks up where it stopped: files already
+# uploaded (or found to be duplicates) are skipped unless they changed since.
+# The token file holds client_id, client_secret and refresh_token (plus the current access token
+# and the athlete id once known) and is rewritten as soon as Strava rotates the tokens. Without one, the
+# STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET and STRAVA_REFRESH_TOKEN variables are used.
+# With --fit each workout goes up as a FIT file with every set in it: parse workers write the
+# files straight to --fit-dir (only paths cross the process boundary), upload threads post them
+# to Strava's uploads endpoint, and one poller thread waits for all of them to be processed.
+BATCH_REPORT = os.getenv("BATCH_REPORT", "batch_report.jsonl")
+BATCH_FIT_DIR = os.getenv("BATCH_FIT_DIR", "batch_fit")
+# Statuses that mean a file needs no further work
+DONE_STATUSES = ('uploaded', 'duplicate')
+
+# CSV files matching the given files, directories (searched recursively) or glob patterns, sorted
+def find_csv_files(paths):
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)
+        elif glob.has_magic(path):
+            matches = glob.glob(path, recursive=True)
+        else:
+            matches = [path]
+        found.update(os.path.abspath(match) for match in matches if os.path.isfile(match))
+    return sorted(found)
+
+# A file counts as the same input while its size and modification time are unchanged
+def file_key(path):
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+# Keys of the files an earlier run already finished; a torn last line from a crash is ignored
+def finished_files(report_path):
+    finished = set()
+    if not os.path.exists(report_path):
+        return finished
+    with open(report_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            key = (row.get('path'), row.get('size'), row.get('mtime_ns'))
+            if row.get('status') in DONE_STATUSES:
+                finished.add(key)
+            else:
+                finished.discard(key)
+    return finished
+
+class BatchReport:
+    # Append-only JSON-lines report shared by the upload threads; each row is on disk before the next
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self.counts = {}
+
+    def write(self, row):
+        line = json.dumps(row, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.counts[row['status']] = self.counts.get(row['status'], 0) + 1
+        print(f"{row['status']:9s} {row['file']}" + (f" -> {row['activity']}" if row.get('activity') else "")
+              + (f" ({row['error']})" if row.get('error') else ""), file=sys.stderr)
+
+    def close(self):
+        self._file.close()
+
+# Parse one of an athlete's files into everything its upload needs (and its FIT file, with a
+# fit_dir, in the athlete's time zone tz). Runs in a worker process, so it returns plain data.
+def parse_file(path, selected_exercise=None, fit_dir=None, owner=None, tz=FIT_TIMEZONE):
+    started = time.perf_counter()
+    _, size, mtime_ns = file_key(path)
+    parsed = {
+        'file': os.path.basename(path), 'path': path, 'size': size, 'mtime_ns': mtime_ns,
+        'status': 'parsed', 'activity': '', 'activity_id': None, 'error': '', 'owner': owner
+    }
+    description, elapsed_time, total_weight, total_sets, total_reps, exercises = parse_csv(path, selected_exercise)
+    if len(exercises) == 0:
+        # parse_csv reports failures in place of the description
+        parsed.update(status='failed', error=description)
+    else:
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        stats = upload_stats(path, selected_exercise)
+        parsed.update(
+            activity=generate_unique_name(base_name, total_weight, total_sets, total_reps, selected_exercise),
+            description=description + progress_notes(owner, path, selected_exercise),
+            elapsed_time=elapsed_time,
+            fingerprints=upload_fingerprints(path, selected_exercise),
+            history={'key': session_key(path, selected_exercise), 'stats': stats} if stats is not None else None
+        )
+        if fit_dir:
+            fit_path = os.path.join(fit_dir, f"{base_name}-{parsed['fingerprints']['content'][:12]}.fit")
+            try:
+                with open(fit_path, 'wb') as out:
+                    # The workout is taken to have just finished, as for manual activities
+                    write_fit(get_workout(path), out, selected_exercise, start=time.time() - elapsed_time, elapsed_time=elapsed_time,
+                              tz=tz)
+                parsed['fit_path'] = fit_path
+            except Exception as e:
+                parsed.update(status='failed', error=f"Could not write FIT file: {e}")
+    parsed['parse_seconds'] = round(time.perf_counter() - started, 3)
+    return parsed
+
+# Result row for the report (the payload fields stay out of it)
+def report_row(parsed, **changes):
+    row = {key: parsed.get(key) for key in ('file', 'path', 'size', 'mtime_ns', 'status', 'activity', 'activity_id', 'error', 'parse_seconds')}
+    row.update(changes)
+    row['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    return row
+
+# Upload index and history bookkeeping for a file that is now on Strava; best effort
+def remember_parsed(parsed, activity):
+    try:
+        remember_upload(parsed['owner'], parsed['fingerprints'], activity, parsed['activity'])
+        if parsed['history']:
+            record_session(parsed['owner'], parsed['history']['key'], parsed['history']['stats'], parsed['activity'])
+    except Exception:
+        # The activity is already on Strava
+        pass
+
+# Report row for a FIT upload that Strava has finished processing
+def fit_result(parsed, outcome, started):
+    status, activity_id, error = outcome
+    if status in ('ready', 'duplicate'):
+        remember_parsed(parsed, {'id': activity_id})
+        return report_row(parsed, status='uploaded' if status == 'ready' else 'duplicate', activity_id=activity_id,
+                          error=error or '', upload_seconds=round(time.perf_counter() - started, 3))
+    return report_row(parsed, status='failed', error=error)
+
+# Post a parsed file's FIT file. Returns its report row, or a Future of it while Strava processes the file.
+def upload_fit(parsed, access_token, poller, started, client_id=None):
+    with open(parsed['fit_path'], 'rb') as f:
+        data = f.read()
+    upload, error, _ = send_upload(access_token, data, parsed['activity'], parsed['description'], os.path.basename(parsed['fit_path']),
+                                   client_id=client_id)
+    if not upload:
+        return report_row(parsed, status='failed', error=error)
+    outcome = upload_outcome(upload)
+    if outcome[0] != 'processing':
+        return fit_result(parsed, outcome, started)
+    row = Future()
+    poller.watch(upload['id']).add_done_callback(lambda done: row.set_result(fit_result(parsed, done.result(), started)))
+    return row
+
+# Post one parsed file. Never raises: failures are reported in the returned row (or the Future
+# of a row, for a FIT upload still processing).
+def upload_parsed(parsed, token_manager, allow_duplicates=False, poller=None):
+    started = time.perf_counter()
+    try:
+        existing = None if allow_duplicates else find_duplicate(parsed['owner'], parsed['fingerprints'])
+        if existing:
+            return report_row(parsed, status='duplicate', activity=existing['name'], activity_id=existing['activity_id'])
+        access_token = token_manager.get_access_token()
+        if not access_token:
+            return report_row(parsed, status='failed', error=f"No valid access token ({token_manager.last_error})")
+        if parsed.get('fit_path'):
+            return upload_fit(parsed, access_token, poller, started, token_manager.client_id)
+        activity, error = post_activity(
+            access_token=access_token,
+            name=parsed['activity'],
+            activity_type="WeightTraining",
+            start_date=datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            elapsed_time=parsed['elapsed_time'],
+            description=parsed['description'],
+            client_id=token_manager.client_id
+        )
+        if not activity:
+            return report_row(parsed, status='failed', error=error)
+        remember_parsed(parsed, activity)
+        return report_row(parsed, status='uploaded', activity_id=activity.get('id'),
+                          upload_seconds=round(time.perf_counter() - started, 3))
+    except Exception as e:
+        return report_row(parsed, status='failed', error=str(e))
+
+# Parse and upload every pending file; returns status -> count for this run
+def run_batch(paths, report_path=BATCH_REPORT, token_manager=None, selected_exercise=None, processes=None,
+              upload_workers=BULK_MAX_WORKERS, allow_duplicates=False, dry_run=False, fit_dir=None, tz=FIT_TIMEZONE):
+    files = find_csv_files(paths)
+    finished = finished_files(report_path)
+    pending = [path for path in files if file_key(path) not in finished]
+    print(f"{len(files)} files, {len(files) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+
+    # History and progress notes belong to the token's athlete (none on a dry run)
+    owner = str(token_manager.athlete_id) if token_manager else None
+    report = BatchReport(report_path)
+    # The same content twice in one run is uploaded once
+    seen = {}
+    # FIT uploads that Strava is still processing
+    processing = []
+    poller = UploadPoller(token_manager.get_access_token, client_id=token_manager.client_id) if fit_dir and token_manager else None
+    if fit_dir:
+        os.makedirs(fit_dir, exist_ok=True)
+
+    def finished(done):
+        result = done.result()
+        if isinstance(result, Future):
+            processing.append(result)
+            result.add_done_callback(lambda row: report.write(row.result()))
+        else:
+            report.write(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as parsers, \
+                ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix="batch-upload") as uploaders:
+            futures = {parsers.submit(parse_file, path, selected_exercise, fit_dir, owner, tz): path for path in pending}
+            for future in as_completed(futures):
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    path = futures[future]
+                    report.write(report_row({'file': os.path.basename(path), 'path': path}, status='failed', error=str(e)))
+                    continue
+                if parsed['status'] == 'failed' or dry_run:
+                    report.write(report_row(parsed))
+                    continue
+                content = parsed['fingerprints']['content']
+                if content in seen and not allow_duplicates:
+                    report.write(report_row(parsed, status='duplicate', error=f"Same workout as {seen[content]}"))
+                    continue
+                seen[content] = parsed['file']
+                upload = uploaders.submit(upload_parsed, parsed, token_manager, allow_duplicates, poller)
+                upload.add_done_callback(finished)
+        wait(processing)
+    finally:
+        if poller:
+            # Anything still processing is reported as failed and retried on the next run
+            poller.stop()
+        report.close()
+    return report.counts
+
+def load_tokens(token_file):
+    if token_file:
+        with open(token_file, 'r') as f:
+            return json.load(f)
+    return {
+        'client_id': os.getenv("STRAVA_CLIENT_ID"),
+        'client_secret': os.getenv("STRAVA_CLIENT_SECRET"),
+        'refresh_token': os.getenv("STRAVA_REFRESH_TOKEN")
+    }
+
+# Strava may rotate the refresh token on every refresh, so keep the latest one
+def save_tokens(token_file, tokens, token_data, athlete_id=None):
+    updated = dict(tokens, **{key: token_data[key] for key in ('access_token', 'refresh_token', 'expires_at') if key in token_data})
+    if athlete_id is not None:
+        updated['athlete_id'] = athlete_id
+    if updated == tokens:
+        return tokens
+    temp_path = f"{token_file}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(updated, f, indent=2)
+    os.replace(temp_path, token_file)
+    return updated
+
+class TokenFile:
+    # The token file, rewritten on every refresh rather than only at the end of a run: Strava may
+    # retire the old refresh token once it issues a new one, so an interrupted run must not lose it
+    def __init__(self, path, tokens):
+        self.path = path
+        self.tokens = tokens
+        self._lock = threading.Lock()
+
+    def save(self, token_data, athlete_id=None):
+        with self._lock:
+            self.tokens = save_tokens(self.path, self.tokens, token_data, athlete_id)
+
+def start_token_manager(tokens, on_refresh=None):
+    missing = [key for key in ('client_id', 'client_secret', 'refresh_token') if not tokens.get(key)]
+    if missing:
+        sys.exit(f"Missing Strava credentials: {', '.join(missing)}")
+    token_data = {
+        'access_token': tokens.get('access_token'),
+        'refresh_token': tokens['refresh_token'],
+        # Without a stored access token, refresh right away
+        'expires_at': tokens.get('expires_at', 0) if tokens.get('access_token') else 0
+    }
+    manager = TokenManager(tokens['client_id'], tokens['client_secret'], token_data, athlete_id=tokens.get('athlete_id'),
+                           on_refresh=on_refresh)
+    access_token = manager.get_access_token()
+    if not access_token:
+        manager.stop()
+        sys.exit(f"Could not get a Strava access token: {manager.last_error}")
+    # Refresh responses don't name the athlete, so look it up once and keep it in the token file
+    if manager.athlete_id is None:
+        athlete, error, _ = get_athlete(access_token, client_id=manager.client_id)
+        if not athlete:
+            manager.stop()
+            sys.exit(f"Could not look up the Strava athlete: {error}")
+        manager.athlete_id = athlete['id']
+    return manager
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload workout CSVs to Strava without the web UI")
+    parser.add_argument("paths", nargs='+', help="CSV files, directories or glob patterns")
+    parser.add_argument("--report", default=BATCH_REPORT, help="JSON-lines report, also used to resume (default: %(default)s)")
+    parser.add_argument("--token-file", help="JSON file with client_id, client_secret and refresh_token")
+    parser.add_argument("--exercise", help="upload only this exercise from each file")
+    parser.add_argument("--processes", type=int, help="parser processes (default: one per core)")
+    parser.add_argument("--upload-workers", type=int, default=BULK_MAX_WORKERS, help="concurrent uploads (default: %(default)s)")
+    parser.add_argument("--allow-duplicates", action="store_true", help="upload even if a workout was uploaded before")
+    parser.add_argument("--dry-run", action="store_true", help="parse and report without uploading")
+    parser.add_argument("--fit", action="store_true", help="upload FIT files with every set instead of manual activities")
+    parser.add_argument("--fit-dir", default=BATCH_FIT_DIR, help="where --fit writes the FIT files (default: %(default)s)")
+    parser.add_argument("--timezone", default=FIT_TIMEZONE, help="IANA time zone of the export timestamps, for --fit (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        ZoneInfo(args.timezone)
+    except (ValueError, ZoneInfoNotFoundError):
+        parser.error(f"unknown time zone: {args.timezone}")
+
+    if CSV_CHUNKSIZE:
+        print("Streaming mode (CSV_CHUNKSIZE) is on: history is not recorded for batch uploads", file=sys.stderr)
+
+    manager = token_file = None
+    if not args.dry_run:
+        tokens = load_tokens(args.token_file)
+        token_file = TokenFile(args.token_file, tokens) if args.token_file else None
+        manager = start_token_manager(tokens, token_file.save if token_file else None)
+        if token_file:
+            token_file.save(manager.token_data, manager.athlete_id)
+
+    started = time.perf_counter()
+    try:
+        counts = run_batch(args.paths, args.report, manager, args.exercise, args.processes,
+                           args.upload_workers, args.allow_duplicates, args.dry_run, args.fit_dir if args.fit else None, args.timezone)
+    finally:
+        if manager:
+            manager.stop()
+            if token_file:
+                token_file.save(manager.token_data, manager.athlete_id)
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"{total} files in {elapsed:.1f} s ({total / elapsed if elapsed else 0:.1f} files/s): "
+          + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())), file=sys.stderr)
+    if counts.get('failed'):
+        sys.exit(1)
@@ -0,0 +1,73 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic workout exports in both vendor dialects.
+#   'load':   Load ("80.0kg" strings), Reps, Average/Best velocity, power columns
+#   'weight': Weight (kg) numbers, Rep, Mean/Peak Velocity (m/s), power, height and distance
+# With sessions > 0 a Timestamp column spreads the rows over that many daily sessions.
+DIALECTS = ('load', 'weight')
+SESSION_START = pd.Timestamp('2024-01-01 18:00:00')
+# Seconds between consecutive rows within a session, squeezed so no session runs past SESSION_LENGTH
+ROW_INTERVAL = 15
+SESSION_LENGTH = 2 * 60 * 60
+
+# Build a workout DataFrame with the given shape; sparsity is the share of missing metric values
+def generate_workout(rows=1000, exercises=10, sets=5, sparsity=0.1, dialect='load', seed=0, sessions=0):
+    if dialect not in DIALECTS:
+        raise ValueError(f"Unknown dialect: {dialect}")
+    rng = np.random.default_rng(seed)
+
+    exercise_ids = rng.integers(0, exercises, rows)
+    load = np.round(rng.uniform(20, 200, rows) / 2.5) * 2.5
+    reps = rng.integers(1, 12, rows)
+    mean_velocity = rng.uniform(0.2, 1.4, rows)
+    peak_velocity = mean_velocity * rng.uniform(1.1, 1.6, rows)
+    mean_power = load * 9.81 * mean_velocity
+    peak_power = load * 9.81 * peak_velocity
+
+    def sparse(values):
+        return np.where(rng.random(rows) < sparsity, np.nan, np.round(values, 3))
+
+    data = {'Exercise': [f"Exercise {i}" for i in exercise_ids], 'Set': rng.integers(1, sets + 1, rows)}
+    if dialect == 'load':
+        data['Load'] = [f"{value:.1f}kg" for value in load]
+        data['Reps'] = reps
+        data['Average'] = sparse(mean_velocity)
+        data['Best'] = sparse(peak_velocity)
+        data['Mean Power (W)'] = sparse(mean_power)
+        data['Peak Power (W)'] = sparse(peak_power)
+    else:
+        data['Weight (kg)'] = load
+        data['Rep'] = reps
+        data['Mean Velocity (m/s)'] = sparse(mean_velocity)
+        data['Peak Velocity (m/s)'] = sparse(peak_velocity)
+        data['Mean Power (W)'] = sparse(mean_power)
+        data['Peak Power (W)'] = sparse(peak_power)
+        data['Height (cm)'] = sparse(rng.uniform(10, 60, rows))
+        data['Vertical Distance (cm)'] = sparse(rng.uniform(30, 90, rows))
+    if sessions:
+        session = np.arange(rows) * sessions // rows
+        first_row = np.searchsorted(session, session)
+        interval = min(ROW_INTERVAL, SESSION_LENGTH / max(1, -(-rows // sessions)))
+        offsets = pd.to_timedelta(session, unit='D') + pd.to_timedelta((np.arange(rows) - first_row) * interval, unit='s')
+        data['Timestamp'] = (SESSION_START + offsets).strftime('%Y-%m-%d %H:%M:%S')
+    return pd.DataFrame(data)
+
+# Same workout rendered as CSV bytes, as an upload would arrive
+def generate_csv(rows=1000, exercises=10, sets=5, sparsity=0.1, dialect='load', seed=0, sessions=0):
+    return generate_workout(rows, exercises, sets, sparsity, dialect, seed, sessions).to_csv(index=False).encode('utf-8')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic workout CSV")
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--exercises", type=int, default=10)
+    parser.add_argument("--sets", type=int, default=5)
+    parser.add_argument("--sparsity", type=float, default=0.1)
+    parser.add_argument("--dialect", choices=DIALECTS, default='load')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sessions", type=int, default=0, help="add a Timestamp column spanning this many sessions")
+    args = parser.parse_args()
+    with open(args.output, 'wb') as f:
+        f.write(generate_csv(args.rows, args.exercises, args.sets, args.sparsity, args.dialect, args.seed, args.sessions))
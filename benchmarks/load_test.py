@@ -0,0 +1,241 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.generate import generate_csv
+from benchmarks.mock_strava import start_server, add_server_arguments, server_options
+from api import urls
+from api.rate_limit import usage_totals
+from api.starva_api import post_activity
+from auth.oauth import request_token_exchange
+from auth.tokens import TokenManager
+from data.parser import parse_csv, generate_unique_name
+from utils import storage
+from utils.http_client import http_client
+
+# End-to-end load test of the upload path against a Strava stand-in:
+#   credentials - store and read back the client credentials in temp storage, as the credentials page does
+#   authorize   - GET /oauth/authorize and take the code from the redirect
+#   token       - exchange the code and start the user's TokenManager
+#   parse       - parse the user's workout CSV and build the activity name and description
+#   upload      - create the activity (once per --uploads-per-user)
+# Each simulated user runs those stages in order on a thread pool of --concurrency workers, the way
+# concurrent Streamlit sessions share one process. By default an embedded mock server is started
+# with a generous rate limit; pass --url to target a server started separately.
+# Run from the repository root:
+#   python -m benchmarks.load_test --users 500 --concurrency 50 --latency-ms 80 --error-rate 0.02
+STAGES = ('credentials', 'authorize', 'token', 'parse', 'upload')
+PERCENTILES = (50, 90, 95, 99)
+REDIRECT_URI = "http://localhost/"
+
+class LoadResults:
+    # Stage latencies, end-to-end latencies and errors collected from all worker threads
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {stage: [] for stage in STAGES}
+        self.users = []
+        self.errors = {}
+        self.completed = 0
+        self.failed = 0
+        self.uploads = 0
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages[stage].append(seconds)
+
+    def error(self, stage, message):
+        key = f"{stage}: {str(message)[:120]}"
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def finish(self, seconds, ok, uploads):
+        with self._lock:
+            self.users.append(seconds)
+            self.uploads += uploads
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+# Median, tail percentiles and max of a list of durations, in milliseconds
+def summarize(seconds):
+    if not seconds:
+        return {'count': 0}
+    values = np.asarray(seconds) * 1000
+    summary = {'count': len(values), 'mean_ms': round(float(values.mean()), 2)}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 2)
+    summary['max_ms'] = round(float(values.max()), 2)
+    return summary
+
+class Timer:
+    def __init__(self, results, stage):
+        self.results = results
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.results.record(self.stage, time.perf_counter() - self.started)
+        return False
+
+# One simulated user going through credentials -> token -> parse -> upload
+def simulate_user(n, data, results, uploads_per_user):
+    started = time.perf_counter()
+    uploads = 0
+    ok = False
+    manager = None
+    try:
+        with Timer(results, 'credentials'):
+            client_id, client_secret = str(100000 + n), uuid.uuid4().hex
+            temp_key = str(uuid.uuid4())
+            storage.put_temp_entry(temp_key, {'client_id': client_id, 'client_secret': client_secret, 'expires_at': time.time() + 300})
+            entry = storage.get_temp_entry(temp_key)
+        if not entry:
+            results.error('credentials', "Credentials not found in temp storage")
+            return
+
+        with Timer(results, 'authorize'):
+            query = urlencode({'client_id': client_id, 'response_type': 'code', 'redirect_uri': REDIRECT_URI,
+                               'approval_prompt': 'force', 'scope': 'activity:write', 'state': temp_key})
+            response = http_client.request("GET", f"{urls.strava_url('oauth/authorize')}?{query}", allow_redirects=False)
+        code = parse_qs(urlsplit(response.headers.get('Location', '')).query).get('code', [None])[0]
+        if not code:
+            results.error('authorize', f"HTTP {response.status_code}")
+            return
+
+        with Timer(results, 'token'):
+            token_data, error = request_token_exchange(entry['client_id'], entry['client_secret'], code)
+            if token_data:
+                manager = TokenManager(entry['client_id'], entry['client_secret'], token_data)
+                access_token = manager.get_access_token()
+        if not token_data:
+            results.error('token', error)
+            return
+
+        with Timer(results, 'parse'):
+            description, elapsed_time, total_weight, total_sets, total_reps, _ = parse_csv(io.BytesIO(data))
+            name = generate_unique_name(None, total_weight, total_sets, total_reps)
+
+        for _ in range(uploads_per_user):
+            with Timer(results, 'upload'):
+                activity, error = post_activity(
+                    manager.get_access_token() or access_token, name, "WeightTraining",
+                    datetime.now().isoformat(), elapsed_time, description, client_id=manager.client_id
+                )
+            if not activity:
+                results.error('upload', error)
+                return
+            uploads += 1
+        ok = True
+    except Exception as e:
+        results.error('exception', f"{type(e).__name__}: {e}")
+    finally:
+        if manager:
+            manager.stop()
+        results.finish(time.perf_counter() - started, ok, uploads)
+
+def run_load_test(base_url, users=100, concurrency=20, uploads_per_user=1, files=None, rows=1000, exercises=10):
+    saved = (urls.STRAVA_BASE_URL, storage.TEMP_STORAGE_DB, storage.LEGACY_STORAGE_FILE, storage._cache)
+    # Distinct workouts, so the parse cache only helps as much as repeat files would in production
+    workouts = [generate_csv(rows=rows, exercises=exercises, seed=n) for n in range(files or users)]
+    results = LoadResults()
+    with tempfile.TemporaryDirectory() as tmp:
+        urls.STRAVA_BASE_URL = base_url.rstrip('/')
+        storage.TEMP_STORAGE_DB = os.path.join(tmp, "load_test.db")
+        storage.LEGACY_STORAGE_FILE = os.path.join(tmp, "load_test.json")
+        storage._cache = storage.TempStorageCache()
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for n in range(users):
+                    pool.submit(simulate_user, n, workouts[n % len(workouts)], results, uploads_per_user)
+        finally:
+            elapsed = time.perf_counter() - started
+            storage._cache.close()
+            urls.STRAVA_BASE_URL, storage.TEMP_STORAGE_DB, storage.LEGACY_STORAGE_FILE, storage._cache = saved
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'base_url': base_url,
+            'users': users,
+            'concurrency': concurrency,
+            'uploads_per_user': uploads_per_user,
+            'rows': rows
+        },
+        'elapsed_s': round(elapsed, 3),
+        'throughput': {
+            'users_per_s': round(results.completed / elapsed, 2) if elapsed else 0.0,
+            'uploads_per_s': round(results.uploads / elapsed, 2) if elapsed else 0.0
+        },
+        'completed': results.completed,
+        'failed': results.failed,
+        'uploads': results.uploads,
+        'latency': dict({stage: summarize(results.stages[stage]) for stage in STAGES}, end_to_end=summarize(results.users)),
+        'errors': results.errors,
+        'http': http_client.latency_stats(),
+        'rate_limit': usage_totals()
+    }
+
+def print_report(report):
+    print(f"{report['completed']} of {report['meta']['users']} users completed in {report['elapsed_s']:.2f} s "
+          f"({report['throughput']['users_per_s']} users/s, {report['throughput']['uploads_per_s']} uploads/s)")
+    print(f"{'stage':14s} {'count':>7s} {'mean':>9s}" + ''.join(f"{'p' + str(p):>9s}" for p in PERCENTILES) + f"{'max':>9s}")
+    for stage, summary in report['latency'].items():
+        if not summary['count']:
+            continue
+        print(f"{stage:14s} {summary['count']:7d} {summary['mean_ms']:9.1f}"
+              + ''.join(f"{summary[f'p{p}_ms']:9.1f}" for p in PERCENTILES) + f"{summary['max_ms']:9.1f}")
+    for error, count in sorted(report['errors'].items(), key=lambda item: -item[1]):
+        print(f"{count:6d} x {error}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the credentials -> token -> parse -> upload path")
+    parser.add_argument("--url", help="base URL of a running Strava stand-in (default: start an embedded mock server)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--uploads-per-user", type=int, default=1)
+    parser.add_argument("--files", type=int, help="number of distinct workout files (default: one per user)")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--exercises", type=int, default=10)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    add_server_arguments(parser)
+    # Load tests measure the app, not Strava's quota; pass --rate-limit 200,2000 to exercise throttling
+    parser.set_defaults(rate_limit="1000000,10000000")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = start_server(**server_options(args))
+        base_url = server.base_url
+    try:
+        report = run_load_test(base_url, args.users, args.concurrency, args.uploads_per_user, args.files, args.rows, args.exercises)
+        if server:
+            report['server'] = server.strava.stats()
+    finally:
+        if server:
+            server.shutdown()
+
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['failed']:
+        sys.exit(1)
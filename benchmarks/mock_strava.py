@@ -0,0 +1,548 @@
+import json
+import time
+import random
+import struct
+import hashlib
+import secrets
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Local stand-in for the parts of Strava the app talks to, for development and load tests:
+#   GET  /oauth/authorize     - redirects straight back with a code (no login page)
+#   POST /oauth/token         - authorization_code and refresh_token grants
+#   POST /api/v3/activities   - create a manual activity
+#   GET  /api/v3/athlete      - the authenticated athlete
+#   GET  /api/v3/athlete/activities - list activities (page, per_page, before, after)
+#   POST /api/v3/uploads      - upload a FIT file (multipart); processed after --upload-delay-ms
+#   GET  /api/v3/uploads/{id} - upload status, with the activity id or error once processed
+#   GET  /_mock/stats         - request counts, status codes and rate-limit usage
+# Status codes and error bodies follow Strava's (400 bad request, 401 authorization error,
+# 429 rate limit exceeded), and every API response carries X-RateLimit-Limit and
+# X-RateLimit-Usage for a 15-minute window (reset on the quarter hour) and a daily window.
+# Latency and failures can be injected. Run from the repository root:
+#   python -m benchmarks.mock_strava --port 8111 --latency-ms 80 --error-rate 0.02
+#   STRAVA_BASE_URL=http://127.0.0.1:8111 streamlit run app.py
+SHORT_WINDOW = 15 * 60
+DAILY_WINDOW = 24 * 60 * 60
+TOKEN_TTL = 6 * 60 * 60
+ERROR_STATUSES = (500, 502, 503)
+FIT_EPOCH = 631065600
+UPLOAD_PROCESSING = "Your activity is still being processed."
+UPLOAD_READY = "Your activity is ready."
+UPLOAD_ERROR = "There was an error processing your activity."
+
+def _next_reset(now, window):
+    return (int(now) // window + 1) * window
+
+def _fault(resource, field, code):
+    return {'resource': resource, 'field': field, 'code': code}
+
+# Unix time of a Strava timestamp; naive values are taken as UTC
+def _timestamp(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _fit_crc(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+# Just enough of a FIT decoder to check a file and read its timing: header and file CRCs, then
+# definition and data messages (normal headers, developer fields skipped). Returns the session
+# start (Unix time), its elapsed seconds and the local time offset; raises ValueError.
+def read_fit_summary(data):
+    if len(data) < 14 or data[8:12] != b'.FIT':
+        raise ValueError("not a FIT file")
+    header_size = data[0]
+    data_size = struct.unpack_from('<I', data, 4)[0]
+    end = header_size + data_size
+    if len(data) < end + 2 or _fit_crc(data[:end]) != struct.unpack_from('<H', data, end)[0]:
+        raise ValueError("bad FIT CRC")
+    definitions = {}
+    summary = {}
+    pos = header_size
+    while pos < end:
+        header = data[pos]
+        pos += 1
+        if header & 0x80:
+            raise ValueError("compressed timestamp headers are not supported")
+        local = header & 0x0F
+        if header & 0x40:
+            big_endian = data[pos + 1] == 1
+            global_num = struct.unpack_from('>H' if big_endian else '<H', data, pos + 2)[0]
+            count = data[pos + 4]
+            pos += 5
+            fields = [tuple(data[pos + 3 * n:pos + 3 * n + 2]) for n in range(count)]
+            pos += 3 * count
+            dev_size = 0
+            if header & 0x20:
+                dev_count = data[pos]
+                dev_size = sum(data[pos + 1 + 3 * n + 1] for n in range(dev_count))
+                pos += 1 + 3 * dev_count
+            definitions[local] = (global_num, big_endian, fields, dev_size)
+            continue
+        if local not in definitions:
+            raise ValueError("data message without a definition")
+        global_num, big_endian, fields, dev_size = definitions[local]
+        values = {}
+        for number, size in fields:
+            if size == 4:
+                values[number] = struct.unpack_from('>I' if big_endian else '<I', data, pos)[0]
+            pos += size
+        pos += dev_size
+        if global_num == 18:
+            summary['start'] = values.get(2, values.get(253, 0)) + FIT_EPOCH
+            summary['elapsed_time'] = round(values.get(7, 0) / 1000)
+        elif global_num == 34 and 5 in values and 253 in values:
+            summary['utc_offset'] = values[5] - values[253]
+    if 'start' not in summary:
+        raise ValueError("no session message")
+    return summary
+
+class MockStrava:
+    # In-memory Strava state shared by all request threads
+    def __init__(self, short_limit=200, daily_limit=2000, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, stall_rate=0.0, stall_seconds=35.0, token_ttl=TOKEN_TTL, upload_delay_ms=1000.0, seed=None):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.token_ttl = token_ttl
+        self.upload_delay_ms = upload_delay_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._used_codes = set()
+        # access token -> (athlete id, expires_at); refresh token -> athlete id
+        self._access_tokens = {}
+        self._refresh_tokens = {}
+        self._athletes = {}
+        self._next_athlete = 1
+        self._next_activity = 1000000
+        self.activities = {}
+        self._start_ts = {}
+        self._next_upload = 5000000
+        self.uploads = {}
+        # (athlete id, file hash) -> activity id, for Strava's duplicate check
+        self._uploaded_files = {}
+        now = time.time()
+        self.short_used = 0
+        self.daily_used = 0
+        self.short_reset = _next_reset(now, SHORT_WINDOW)
+        self.daily_reset = _next_reset(now, DAILY_WINDOW)
+        self.requests = {}
+        self.statuses = {}
+        self.injected = {'errors': 0, 'stalls': 0}
+
+    # Sleep for the configured latency, then decide whether this request fails on purpose
+    def inject(self):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self._random.random()
+            stall = roll < self.stall_rate
+            error = None
+            if not stall and roll < self.stall_rate + self.error_rate:
+                error = self._random.choice(ERROR_STATUSES)
+            if stall:
+                self.injected['stalls'] += 1
+            elif error:
+                self.injected['errors'] += 1
+        time.sleep(self.stall_seconds if stall else delay)
+        return error
+
+    # Count one API request against both windows; returns (allowed, headers)
+    def take_rate_limit(self):
+        with self._lock:
+            now = time.time()
+            if now >= self.short_reset:
+                self.short_used = 0
+                self.short_reset = _next_reset(now, SHORT_WINDOW)
+            if now >= self.daily_reset:
+                self.daily_used = 0
+                self.daily_reset = _next_reset(now, DAILY_WINDOW)
+            # Rejected requests count too, as on Strava
+            self.short_used += 1
+            self.daily_used += 1
+            allowed = self.short_used <= self.short_limit and self.daily_used <= self.daily_limit
+            headers = {
+                'X-RateLimit-Limit': f"{self.short_limit},{self.daily_limit}",
+                'X-RateLimit-Usage': f"{self.short_used},{self.daily_used}"
+            }
+        return allowed, headers
+
+    def _issue_tokens(self, athlete_id):
+        access_token = secrets.token_hex(20)
+        refresh_token = secrets.token_hex(20)
+        expires_at = int(time.time() + self.token_ttl)
+        self._access_tokens[access_token] = (athlete_id, expires_at)
+        self._refresh_tokens[refresh_token] = athlete_id
+        return {
+            'token_type': 'Bearer',
+            'access_token': access_token,
+            'expires_at': expires_at,
+            'expires_in': self.token_ttl,
+            'refresh_token': refresh_token
+        }
+
+    # POST /oauth/token; returns (status, body)
+    def token(self, form):
+        grant_type = form.get('grant_type')
+        if not form.get('client_id') or not form.get('client_secret'):
+            return 401, {'message': 'Authorization Error', 'errors': [_fault('Application', 'client_id', 'invalid')]}
+        with self._lock:
+            if grant_type == 'authorization_code':
+                code = form.get('code')
+                # Codes are single use
+                if not code or code in self._used_codes:
+                    return 400, {'message': 'Bad Request', 'errors': [_fault('AuthorizationCode', 'code', 'invalid')]}
+                self._used_codes.add(code)
+                athlete_id = self._next_athlete
+                self._next_athlete += 1
+                self._athletes[athlete_id] = {'id': athlete_id, 'resource_state': 2, 'firstname': 'Mock', 'lastname': f"Athlete {athlete_id}"}
+                body = self._issue_tokens(athlete_id)
+                body['athlete'] = self._athletes[athlete_id]
+                return 200, body
+            if grant_type == 'refresh_token':
+                athlete_id = self._refresh_tokens.pop(form.get('refresh_token'), None)
+                if athlete_id is None:
+                    return 400, {'message': 'Bad Request', 'errors': [_fault('RefreshToken', 'refresh_token', 'invalid')]}
+                return 200, self._issue_tokens(athlete_id)
+        return 400, {'message': 'Bad Request', 'errors': [_fault('GrantType', 'grant_type', 'invalid')]}
+
+    # The athlete an Authorization header belongs to, or None
+    def authenticate(self, header):
+        if not header or not header.startswith('Bearer '):
+            return None
+        with self._lock:
+            entry = self._access_tokens.get(header[len('Bearer '):])
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    # POST /api/v3/activities; returns (status, body)
+    def create_activity(self, athlete_id, form):
+        missing = [field for field in ('name', 'start_date_local', 'elapsed_time') if not form.get(field)]
+        if not form.get('type') and not form.get('sport_type'):
+            missing.append('sport_type')
+        if missing:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Activity', field, 'missing') for field in missing]}
+        try:
+            elapsed_time = int(form['elapsed_time'])
+        except ValueError:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Activity', 'elapsed_time', 'invalid')]}
+        try:
+            start_ts = _timestamp(form['start_date_local'])
+        except ValueError:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Activity', 'start_date_local', 'invalid')]}
+        with self._lock:
+            activity_id = self._next_activity
+            self._next_activity += 1
+            activity = {
+                'id': activity_id,
+                'resource_state': 3,
+                'athlete': {'id': athlete_id, 'resource_state': 1},
+                'name': form['name'],
+                'type': form.get('type') or form.get('sport_type'),
+                'sport_type': form.get('sport_type') or form.get('type'),
+                'start_date': form['start_date_local'],
+                'start_date_local': form['start_date_local'],
+                'elapsed_time': elapsed_time,
+                'moving_time': elapsed_time,
+                'distance': 0.0,
+                'description': form.get('description'),
+                'manual': True,
+                'private': False,
+                'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            }
+            self.activities[activity_id] = activity
+            self._start_ts[activity_id] = start_ts
+        return 201, activity
+
+    # POST /api/v3/uploads; the file is processed when its status is first read after the delay
+    def create_upload(self, athlete_id, form, files):
+        if 'file' not in files:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Upload', 'file', 'missing')]}
+        if form.get('data_type') != 'fit':
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Upload', 'data_type', 'invalid')]}
+        with self._lock:
+            upload_id = self._next_upload
+            self._next_upload += 1
+            self.uploads[upload_id] = {
+                'athlete_id': athlete_id,
+                'form': form,
+                'data': files['file'],
+                'ready_at': time.time() + self.upload_delay_ms / 1000,
+                'body': {'id': upload_id, 'id_str': str(upload_id), 'external_id': form.get('external_id'),
+                         'error': None, 'status': UPLOAD_PROCESSING, 'activity_id': None}
+            }
+            body = dict(self.uploads[upload_id]['body'])
+        return 201, body
+
+    # Turn a processed upload into an activity, or an error; must hold the lock
+    def _process_upload(self, upload):
+        body = upload['body']
+        digest = hashlib.sha256(upload['data']).hexdigest()
+        duplicate = self._uploaded_files.get((upload['athlete_id'], digest))
+        if duplicate is not None:
+            body.update(error=f"{body['external_id'] or 'activity.fit'} duplicate of activity {duplicate}", status=UPLOAD_ERROR)
+            return
+        try:
+            summary = read_fit_summary(upload['data'])
+        except (ValueError, struct.error, IndexError) as e:
+            body.update(error=f"Error parsing file: {e}", status=UPLOAD_ERROR)
+            return
+        activity_id = self._next_activity
+        self._next_activity += 1
+        start = datetime.fromtimestamp(summary['start'], timezone.utc)
+        local = datetime.fromtimestamp(summary['start'] + summary.get('utc_offset', 0), timezone.utc)
+        form = upload['form']
+        self.activities[activity_id] = {
+            'id': activity_id,
+            'resource_state': 3,
+            'athlete': {'id': upload['athlete_id'], 'resource_state': 1},
+            'name': form.get('name') or 'Weight Training',
+            'type': 'WeightTraining',
+            'sport_type': 'WeightTraining',
+            'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'start_date_local': local.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'elapsed_time': summary['elapsed_time'],
+            'moving_time': summary['elapsed_time'],
+            'distance': 0.0,
+            'description': form.get('description'),
+            'external_id': body['external_id'],
+            'upload_id': body['id'],
+            'manual': False,
+            'private': False,
+            'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+        self._start_ts[activity_id] = summary['start']
+        self._uploaded_files[(upload['athlete_id'], digest)] = activity_id
+        body.update(activity_id=activity_id, status=UPLOAD_READY)
+
+    # GET /api/v3/uploads/{id}
+    def get_upload(self, athlete_id, upload_id):
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None or upload['athlete_id'] != athlete_id:
+                return 404, {'message': 'Record Not Found', 'errors': [_fault('Upload', 'id', 'not found')]}
+            if upload['body']['status'] == UPLOAD_PROCESSING and time.time() >= upload['ready_at']:
+                self._process_upload(upload)
+            return 200, dict(upload['body'])
+
+    # GET /api/v3/athlete
+    def get_athlete(self, athlete_id):
+        with self._lock:
+            return 200, dict(self._athletes[athlete_id])
+
+    # GET /api/v3/athlete/activities: newest first, or oldest first when `after` is given
+    def list_activities(self, athlete_id, query):
+        try:
+            page = int(query.get('page', 1))
+            per_page = min(200, int(query.get('per_page', 30)))
+            before = float(query['before']) if query.get('before') else None
+            after = float(query['after']) if query.get('after') else None
+        except ValueError:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Activity', 'query', 'invalid')]}
+        if page < 1 or per_page < 1:
+            return 400, {'message': 'Bad Request', 'errors': [_fault('Activity', 'page', 'invalid')]}
+        with self._lock:
+            matches = [
+                (self._start_ts[activity_id], activity) for activity_id, activity in self.activities.items()
+                if activity['athlete']['id'] == athlete_id
+                and (after is None or self._start_ts[activity_id] > after)
+                and (before is None or self._start_ts[activity_id] < before)
+            ]
+        matches.sort(key=lambda match: (match[0], match[1]['id']), reverse=after is None)
+        start = (page - 1) * per_page
+        return 200, [dict(activity, resource_state=2) for _, activity in matches[start:start + per_page]]
+
+    def count(self, route, status):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'statuses': dict(self.statuses),
+                'injected': dict(self.injected),
+                'activities': len(self.activities),
+                'uploads': len(self.uploads),
+                'athletes': len(self._athletes),
+                'rate_limit': {'short_used': self.short_used, 'short_limit': self.short_limit,
+                               'daily_used': self.daily_used, 'daily_limit': self.daily_limit}
+            }
+
+class MockStravaHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the app's pooled connections are reused as they would be against Strava
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockStrava/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or '{}')
+        return {key: values[-1] for key, values in parse_qs(body, keep_blank_values=True).items()}
+
+    # multipart/form-data body as (form fields, {name: file bytes})
+    def _multipart(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('latin-1') + body
+        )
+        form, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is not None:
+                files[name] = part.get_payload(decode=True)
+            else:
+                form[name] = part.get_payload(decode=True).decode('utf-8')
+        return form, files
+
+    def _send(self, route, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.strava.count(route, status)
+
+    # Rate limit, authenticate and inject faults for an API call, then answer with handle(athlete_id)
+    def _api(self, route, handle):
+        strava = self.server.strava
+        allowed, headers = strava.take_rate_limit()
+        if not allowed:
+            self._send(route, 429, {'message': 'Rate Limit Exceeded', 'errors': [_fault('Application', 'rate limit', 'exceeded')]}, headers)
+            return
+        athlete_id = strava.authenticate(self.headers.get('Authorization'))
+        if athlete_id is None:
+            self._send(route, 401, {'message': 'Authorization Error', 'errors': [_fault('Athlete', 'access_token', 'invalid')]}, headers)
+            return
+        error = strava.inject()
+        if error:
+            self._send(route, error, {'message': 'Error', 'errors': []}, headers)
+            return
+        status, body = handle(athlete_id)
+        self._send(route, status, body, headers)
+
+    def do_GET(self):
+        strava = self.server.strava
+        url = urlsplit(self.path)
+        if url.path == '/api/v3/athlete':
+            self._api('athlete', strava.get_athlete)
+        elif url.path == '/api/v3/athlete/activities':
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self._api('list_activities', lambda athlete_id: strava.list_activities(athlete_id, query))
+        elif url.path.startswith('/api/v3/uploads/') and url.path.rsplit('/', 1)[1].isdigit():
+            upload_id = int(url.path.rsplit('/', 1)[1])
+            self._api('upload_status', lambda athlete_id: strava.get_upload(athlete_id, upload_id))
+        elif url.path == '/_mock/stats':
+            self._send('stats', 200, strava.stats())
+        elif url.path == '/oauth/authorize':
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if not query.get('redirect_uri'):
+                self._send('authorize', 400, {'message': 'Bad Request', 'errors': [_fault('Application', 'redirect_uri', 'invalid')]})
+                return
+            params = {'state': query.get('state', ''), 'code': secrets.token_hex(20), 'scope': query.get('scope', 'read')}
+            self.send_response(302)
+            self.send_header('Location', f"{query['redirect_uri']}?{urlencode(params)}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            strava.count('authorize', 302)
+        else:
+            self._send('other', 404, {'message': 'Record Not Found', 'errors': [_fault('resource', 'path', 'invalid')]})
+
+    def do_POST(self):
+        strava = self.server.strava
+        path = urlsplit(self.path).path
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            form, files = self._multipart()
+        else:
+            form, files = self._form(), {}
+        if path == '/oauth/token':
+            error = strava.inject()
+            if error:
+                self._send('token', error, {'message': 'Error', 'errors': []})
+                return
+            self._send('token', *strava.token(form))
+        elif path == '/api/v3/activities':
+            self._api('activities', lambda athlete_id: strava.create_activity(athlete_id, form))
+        elif path == '/api/v3/uploads':
+            self._api('uploads', lambda athlete_id: strava.create_upload(athlete_id, form, files))
+        else:
+            self._send('other', 404, {'message': 'Record Not Found', 'errors': [_fault('resource', 'path', 'invalid')]})
+
+# Start a server in a daemon thread; port 0 picks a free port. Returns the server (server.base_url,
+# server.strava, server.shutdown()).
+def start_server(host='127.0.0.1', port=0, verbose=False, **options):
+    server = ThreadingHTTPServer((host, port), MockStravaHandler)
+    server.daemon_threads = True
+    server.strava = MockStrava(**options)
+    server.verbose = verbose
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="mock-strava", daemon=True).start()
+    return server
+
+def add_server_arguments(parser):
+    parser.add_argument("--rate-limit", default="200,2000", help="15-minute and daily request limits, e.g. 200,2000")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added latency per token and API request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500/502/503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of requests that hang for --stall-seconds")
+    parser.add_argument("--stall-seconds", type=float, default=35.0)
+    parser.add_argument("--token-ttl", type=int, default=TOKEN_TTL, help="access token lifetime in seconds")
+    parser.add_argument("--upload-delay-ms", type=float, default=1000.0, help="time Strava takes to process an uploaded file")
+    parser.add_argument("--seed", type=int, default=None)
+
+def server_options(args):
+    short_limit, daily_limit = (int(part) for part in args.rate_limit.split(','))
+    return {
+        'short_limit': short_limit,
+        'daily_limit': daily_limit,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+        'stall_rate': args.stall_rate,
+        'stall_seconds': args.stall_seconds,
+        'token_ttl': args.token_ttl,
+        'upload_delay_ms': args.upload_delay_ms,
+        'seed': args.seed
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Strava stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8111)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, args.verbose, **server_options(args))
+    print(f"Mock Strava listening on {server.base_url} (STRAVA_BASE_URL={server.base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,174 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from benchmarks.generate import generate_csv, DIALECTS
+from data.parser import render_description, get_workout, stream_workout
+from data.aggregate import aggregate_workout
+from data.vbt import analyze_workout
+from data.templates import FORMATS
+from data.sessions import split_sessions
+from data.cache import workout_cache
+from utils import storage
+
+# Benchmark suite for the parser, aggregation, VBT analytics, session segmentation, description
+# rendering and temp storage.
+# Run from the repository root:
+#   python -m benchmarks.run --save benchmarks/baseline.json
+#   python -m benchmarks.run --compare benchmarks/baseline.json
+SIZES = {
+    'small': {'rows': 1000, 'exercises': 10, 'sets': 5},
+    'large': {'rows': 100000, 'exercises': 200, 'sets': 8}
+}
+QUICK_SIZES = {
+    'small': {'rows': 500, 'exercises': 5, 'sets': 3},
+    'large': {'rows': 10000, 'exercises': 50, 'sets': 5}
+}
+
+# Run fn repeatedly and summarize wall-clock times in milliseconds
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(times), 3), 'min_ms': round(min(times), 3), 'runs': repeat}
+
+def parser_benchmarks(sizes, sparsity):
+    benchmarks = {}
+    for dialect in DIALECTS:
+        for size, shape in sizes.items():
+            data = generate_csv(sparsity=sparsity, dialect=dialect, seed=1, **shape)
+            prefix = f"{dialect}/{size}"
+
+            def parse(data=data):
+                workout_cache.clear()
+                get_workout(io.BytesIO(data))
+
+            def parse_streaming(data=data):
+                workout_cache.clear()
+                stream_workout(io.BytesIO(data), chunksize=10000)
+
+            workout_cache.clear()
+            workout = get_workout(io.BytesIO(data))
+            df, weight_col, metrics = workout['df'], workout['weight_col'], workout['metrics']
+            single = workout['exercises'][0]
+            single_df = df[df['Exercise'] == single]
+            multi_summary = aggregate_workout(df, weight_col, metrics)
+            multi_summary['vbt'] = analyze_workout(df, weight_col)
+
+            benchmarks[f"parse/{prefix}"] = parse
+            benchmarks[f"parse_streaming/{prefix}"] = parse_streaming
+            benchmarks[f"aggregate_single/{prefix}"] = lambda d=single_df, w=weight_col, m=metrics, s=single: aggregate_workout(d, w, m, s)
+            benchmarks[f"aggregate_multi/{prefix}"] = lambda d=df, w=weight_col, m=metrics: aggregate_workout(d, w, m)
+            benchmarks[f"render/{prefix}"] = lambda s=multi_summary: render_description(s)
+            for fmt in FORMATS:
+                benchmarks[f"render_{fmt}/{prefix}"] = lambda s=multi_summary, f=fmt: render_description(s, f)
+            benchmarks[f"vbt/{prefix}"] = lambda d=df, w=weight_col: analyze_workout(d, w)
+    return benchmarks
+
+# Session segmentation of timestamped multi-session exports
+def segmentation_benchmarks(sizes, sparsity, sessions=30):
+    benchmarks = {}
+    for size, shape in sizes.items():
+        data = generate_csv(sparsity=sparsity, seed=1, sessions=sessions, **shape)
+        workout_cache.clear()
+        df = get_workout(io.BytesIO(data))['df']
+        benchmarks[f"segment/{size}"] = lambda df=df: split_sessions(df, df['Timestamp'])
+    return benchmarks
+
+# Concurrent put/get/delete traffic against a throwaway temp storage database
+def storage_benchmark(threads, operations):
+    def run():
+        saved = (storage.TEMP_STORAGE_DB, storage.LEGACY_STORAGE_FILE, storage._cache)
+        with tempfile.TemporaryDirectory() as tmp:
+            storage.TEMP_STORAGE_DB = os.path.join(tmp, "bench.db")
+            storage.LEGACY_STORAGE_FILE = os.path.join(tmp, "bench.json")
+            storage._cache = storage.TempStorageCache()
+
+            def worker(n):
+                for i in range(operations):
+                    key = f"{n}-{i}"
+                    storage.put_temp_entry(key, {'client_id': str(n), 'client_secret': 'x', 'expires_at': time.time() + 300})
+                    storage.get_temp_entry(key)
+                    storage.load_temp_storage()
+                    storage.delete_temp_entry(key)
+
+            try:
+                workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+                for t in workers:
+                    t.start()
+                for t in workers:
+                    t.join()
+            finally:
+                storage._cache.close()
+                storage.TEMP_STORAGE_DB, storage.LEGACY_STORAGE_FILE, storage._cache = saved
+    return {f"storage_contention/{threads}x{operations}": run}
+
+def run_benchmarks(quick=False, repeat=5, sparsity=0.1):
+    sizes = QUICK_SIZES if quick else SIZES
+    benchmarks = parser_benchmarks(sizes, sparsity)
+    benchmarks.update(segmentation_benchmarks(sizes, sparsity))
+    benchmarks.update(storage_benchmark(threads=8, operations=25 if quick else 100))
+
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = measure(fn, repeat)
+        print(f"{name:45s} {results[name]['median_ms']:10.3f} ms", file=sys.stderr)
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'quick': quick,
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+# Compare medians against a baseline; returns the names of benchmarks that got slower than threshold
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            continue
+        change = result['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:45s} {previous['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms {change:+7.1%} {flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the workout parser and storage benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs for a fast smoke run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sparsity", type=float, default=0.1)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.quick, args.repeat, args.sparsity)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+    if not args.save and not args.compare:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,196 @@
+import pandas as pd
+
+# Resolve which column holds the rep count (exports use either 'Reps' or 'Rep')
+def get_reps_col(df):
+    if 'Reps' in df.columns:
+        return 'Reps'
+    if 'Rep' in df.columns:
+        return 'Rep'
+    return None
+
+# Turn a row of metric means into (name, unit, decimals, value) entries, skipping empty metrics
+def _metric_entries(means, metrics):
+    entries = []
+    for col, (name, unit, decimals) in metrics.items():
+        if col in means and not pd.isna(means[col]):
+            entries.append((name, unit, decimals, means[col]))
+    return entries
+
+# Aggregate a normalized workout DataFrame into a structured summary.
+# All per-exercise figures are computed in a single grouped pass instead of one slice per exercise.
+def aggregate_workout(working_df, weight_col, metrics, selected_exercise=None):
+    reps_col = get_reps_col(working_df)
+    metric_cols = [col for col in metrics if col in working_df.columns]
+
+    summary = {
+        'selected_exercise': selected_exercise,
+        'total_weight': working_df[weight_col].sum() if weight_col else 0,
+        'total_sets': working_df['Set'].nunique() if 'Set' in working_df.columns else len(working_df),
+        'total_reps': working_df[reps_col].sum() if reps_col else 0,
+        'metrics': [],
+        'exercises': []
+    }
+
+    if selected_exercise:
+        # Single exercise mode - the frame is already filtered, one reduction per metric column
+        summary['total_exercises'] = 1
+        means = working_df[metric_cols].mean() if metric_cols else {}
+        summary['metrics'] = _metric_entries(means, metrics)
+        return summary
+
+    exercises_in_df = working_df['Exercise'].unique()
+    summary['total_exercises'] = len(exercises_in_df)
+
+    # One groupby covering sets, reps, load and every metric mean
+    grouped = working_df.groupby('Exercise', sort=False, observed=True)
+    spec = {col: (col, 'mean') for col in metric_cols}
+    if 'Set' in working_df.columns:
+        spec['_sets'] = ('Set', 'nunique')
+    if reps_col:
+        spec['_reps'] = (reps_col, 'sum')
+    if weight_col:
+        spec['_weight'] = (weight_col, 'sum')
+    stats = grouped.agg(**spec) if spec else pd.DataFrame(index=grouped.size().index)
+    if '_sets' not in stats.columns:
+        stats['_sets'] = grouped.size()
+
+    # Column-wise extraction keeps each column's own dtype (int reps stay int)
+    columns = {col: dict(zip(stats.index, stats[col].tolist())) for col in stats.columns}
+    empty_reps = working_df[reps_col].iloc[:0].sum() if reps_col else 0
+    empty_weight = working_df[weight_col].iloc[:0].sum() if weight_col else 0
+
+    for exercise in exercises_in_df:
+        # Exercises without a group (e.g. a missing name) report zeros, as a boolean mask would
+        found = exercise in columns['_sets']
+        means = {col: columns[col][exercise] for col in metric_cols if found}
+        summary['exercises'].append({
+            'exercise': exercise,
+            'sets': columns['_sets'][exercise] if found else 0,
+            'reps': columns['_reps'][exercise] if found and reps_col else empty_reps,
+            'weight': columns['_weight'][exercise] if found and weight_col else empty_weight,
+            'metrics': _metric_entries(means, metrics)
+        })
+
+    return summary
+
+class WorkoutAccumulator:
+    # Running per-exercise aggregates folded in chunk by chunk. Memory grows with the number
+    # of exercises and distinct sets, not with the number of rows in the file.
+    def __init__(self, weight_col, metrics):
+        self.weight_col = weight_col
+        self.metrics = metrics
+        self.reps_col = None
+        self.reps_is_float = False
+        self.rows = 0
+        self.total_weight = 0
+        self.total_reps = 0
+        self.has_set_col = False
+        self.sets = set()
+        self.exercises = {}
+        # Order of first appearance, including a missing exercise name if one shows up
+        self.order = []
+        self.has_missing_exercise = False
+
+    def _new_exercise(self):
+        return {'rows': 0, 'reps': 0, 'weight': 0, 'sets': set(), 'sums': {}, 'counts': {}}
+
+    # Fold one normalized chunk into the running aggregates
+    def add_chunk(self, chunk):
+        if chunk.empty:
+            return
+        weight_col = self.weight_col
+        reps_col = get_reps_col(chunk)
+        metric_cols = [col for col in self.metrics if col in chunk.columns]
+        self.reps_col = reps_col
+
+        self.rows += len(chunk)
+        if weight_col:
+            self.total_weight += chunk[weight_col].sum()
+        if reps_col:
+            self.total_reps += chunk[reps_col].sum()
+            self.reps_is_float = self.reps_is_float or chunk[reps_col].dtype.kind == 'f'
+        if 'Set' in chunk.columns:
+            self.has_set_col = True
+            self.sets.update(chunk['Set'].dropna().unique().tolist())
+
+        for exercise in chunk['Exercise'].unique():
+            if pd.isna(exercise):
+                if not self.has_missing_exercise:
+                    self.has_missing_exercise = True
+                    self.order.append(exercise)
+            elif exercise not in self.exercises:
+                self.exercises[exercise] = self._new_exercise()
+                self.order.append(exercise)
+
+        # Same grouped pass as aggregate_workout, but keeping sums and counts so means can be merged
+        grouped = chunk.groupby('Exercise', sort=False, observed=True)
+        spec = {'_rows': ('Exercise', 'size')}
+        for col in metric_cols:
+            spec[f'{col}_sum'] = (col, 'sum')
+            spec[f'{col}_count'] = (col, 'count')
+        if reps_col:
+            spec['_reps'] = (reps_col, 'sum')
+        if weight_col:
+            spec['_weight'] = (weight_col, 'sum')
+        stats = grouped.agg(**spec)
+        columns = {col: stats[col].tolist() for col in stats.columns}
+        set_values = grouped['Set'].unique() if 'Set' in chunk.columns else None
+
+        for i, exercise in enumerate(stats.index):
+            acc = self.exercises[exercise]
+            acc['rows'] += columns['_rows'][i]
+            if reps_col:
+                acc['reps'] += columns['_reps'][i]
+            if weight_col:
+                acc['weight'] += columns['_weight'][i]
+            for col in metric_cols:
+                acc['sums'][col] = acc['sums'].get(col, 0) + columns[f'{col}_sum'][i]
+                acc['counts'][col] = acc['counts'].get(col, 0) + columns[f'{col}_count'][i]
+            if set_values is not None:
+                acc['sets'].update(v for v in set_values[exercise] if not pd.isna(v))
+
+    def _reps(self, value):
+        return float(value) if self.reps_is_float else value
+
+    def _sets(self, acc):
+        return len(acc['sets']) if self.has_set_col else acc['rows']
+
+    def _means(self, acc):
+        return {col: acc['sums'][col] / count for col, count in acc['counts'].items() if count}
+
+    # Build the same structured summary aggregate_workout produces for the whole file
+    def summary(self, selected_exercise=None):
+        if selected_exercise:
+            acc = self.exercises[selected_exercise]
+            return {
+                'selected_exercise': selected_exercise,
+                'total_weight': acc['weight'] if self.weight_col else 0,
+                'total_sets': self._sets(acc),
+                'total_reps': self._reps(acc['reps']) if self.reps_col else 0,
+                'total_exercises': 1,
+                'metrics': _metric_entries(self._means(acc), self.metrics),
+                'exercises': []
+            }
+
+        exercises = []
+        for exercise in self.order:
+            acc = self.exercises.get(exercise) if not pd.isna(exercise) else None
+            if acc is None:
+                acc = self._new_exercise()
+            exercises.append({
+                'exercise': exercise,
+                'sets': self._sets(acc),
+                'reps': self._reps(acc['reps']) if self.reps_col else 0,
+                'weight': acc['weight'] if self.weight_col else 0,
+                'metrics': _metric_entries(self._means(acc), self.metrics)
+            })
+
+        return {
+            'selected_exercise': None,
+            'total_weight': self.total_weight if self.weight_col else 0,
+            'total_sets': len(self.sets) if self.has_set_col else self.rows,
+            'total_reps': self._reps(self.total_reps) if self.reps_col else 0,
+            'total_exercises': len(self.order),
+            'metrics': [],
+            'exercises': exercises
+        }
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import tempfile
+import numpy as np
+import pyarrow as pa
+
+from data.cache import workout_cache
+from data.dialects import VBT_METRICS
+
+# Columnar archive of parsed, normalized workouts, kept per athlete.
+# Each workout is one uncompressed Arrow IPC file under its owner's directory, named after its
+# content key, with the exercise column dictionary-encoded. Files are memory-mapped on read, so
+# numeric columns come back without copying and re-analysis skips CSV parsing entirely.
+ARCHIVE_DIR = os.getenv("WORKOUT_ARCHIVE_DIR", os.path.join(tempfile.gettempdir(), "strava_uploader_archive"))
+
+def _owner_dir(owner):
+    return os.path.join(ARCHIVE_DIR, str(owner))
+
+def _archive_path(owner, key):
+    return os.path.join(_owner_dir(owner), f"{key}.arrow")
+
+# Convert a workout DataFrame to an Arrow table, keeping NaN as values (not nulls) so
+# float columns can later be read back zero-copy
+def _to_arrow(df):
+    arrays = {}
+    for col in df.columns:
+        series = df[col]
+        if col == 'Exercise':
+            arrays[col] = pa.array(series.astype('category'))
+        elif series.dtype.kind in 'fiub':
+            arrays[col] = pa.array(series.to_numpy(), from_pandas=False)
+        else:
+            arrays[col] = pa.array(series, from_pandas=True)
+    return pa.table(arrays)
+
+# Save a parsed workout (as returned by get_workout) to an athlete's archive, returning its path
+def archive_workout(workout, owner, name=None):
+    path = _archive_path(owner, workout['key'])
+    if os.path.exists(path):
+        return path
+    os.makedirs(_owner_dir(owner), exist_ok=True)
+
+    table = _to_arrow(workout['df'])
+    table = table.replace_schema_metadata({
+        'name': name or '',
+        'weight_col': workout['weight_col'] or '',
+        'metrics': json.dumps(workout['metrics']),
+        'archived_at': str(time.time())
+    })
+    # Write to a temporary file first so readers never see a partial archive
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+# Memory-mapped Arrow table for an archived workout
+def open_archive(owner, key):
+    source = pa.memory_map(_archive_path(owner, key), 'r')
+    return pa.ipc.open_file(source).read_all()
+
+# An athlete's archived workouts, newest first, read from file metadata only
+def list_archives(owner):
+    directory = _owner_dir(owner)
+    if not os.path.isdir(directory):
+        return []
+    archives = []
+    for file_name in os.listdir(directory):
+        if not file_name.endswith('.arrow'):
+            continue
+        key = file_name[:-len('.arrow')]
+        try:
+            with pa.memory_map(_archive_path(owner, key), 'r') as source:
+                reader = pa.ipc.open_file(source)
+                metadata = reader.schema.metadata or {}
+                rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        except (OSError, pa.ArrowInvalid):
+            continue
+        archives.append({
+            'key': key,
+            'name': metadata.get(b'name', b'').decode() or key[:12],
+            'rows': rows,
+            'archived_at': float(metadata.get(b'archived_at', b'0'))
+        })
+    return sorted(archives, key=lambda a: a['archived_at'], reverse=True)
+
+# Load one of an athlete's archived workouts in the same shape get_workout returns, without
+# touching any CSV
+def load_archived_workout(owner, key):
+    # The cache is shared by content key, so check this athlete archived it before using it
+    if not os.path.exists(_archive_path(owner, key)):
+        raise FileNotFoundError(f"No archived workout {key}")
+    workout = workout_cache.get(('workout', key))
+    if workout is None:
+        table = open_archive(owner, key)
+        metadata = table.schema.metadata or {}
+        df = table.to_pandas(split_blocks=True)
+        # Archives from before metrics were kept per dialect: every built-in dialect had the VBT metrics
+        metrics = json.loads(metadata[b'metrics']) if b'metrics' in metadata else VBT_METRICS
+        workout = {
+            'key': key,
+            'df': df,
+            'weight_col': metadata.get(b'weight_col', b'').decode() or None,
+            'metrics': {col: tuple(metric) for col, metric in metrics.items()},
+            'exercises': np.asarray(df['Exercise'].unique(), dtype=object)
+        }
+        workout_cache.put(('workout', key), workout, int(df.memory_usage(deep=True).sum()))
+    return workout
@@ -0,0 +1,75 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# In-process cache for parsed workouts, shared by every session and rerun.
+# Entries are keyed by a hash of the file content, so the same upload is parsed once
+# no matter how many widgets trigger a rerun.
+DEFAULT_MAX_ENTRIES = int(os.getenv("WORKOUT_CACHE_ENTRIES", "32"))
+DEFAULT_MAX_BYTES = int(os.getenv("WORKOUT_CACHE_MB", "128")) * 1024 * 1024
+
+# Hash raw file content into a cache key
+def content_key(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+class WorkoutCache:
+    # LRU cache bounded by both entry count and an approximate memory budget
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Return the cached value for key (marking it most recently used) or None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Store a value with its approximate size in bytes, evicting least recently used entries
+    def put(self, key, value, nbytes=0):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            # Values larger than the whole budget are not worth caching
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    # Drop every entry (counters are kept)
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # Hit/miss counters and current footprint
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+workout_cache = WorkoutCache()
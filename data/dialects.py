@@ -0,0 +1,149 @@
+import io
+import os
+import csv
+from functools import lru_cache
+
+from data.sessions import timestamp_columns
+
+# Registry of vendor CSV dialects. Each dialect declares:
+#   signature - normalized header names that identify it (all must be present)
+#   columns   - normalized header name -> frame column, for every column the summary uses
+#   weight    - (frame column, unit) of the load column; values may carry a unit suffix
+#               ("80.0kg", "175lbs") and are converted from `unit` to kg
+#   scale     - frame column -> factor, for metrics exported in other units
+#   metrics   - frame column -> (metric name, unit, decimals)
+# The most specific matching dialect wins (longest signature, then priority), and its metrics
+# travel with the layout: two dialects may use one frame column for different metrics. A file is
+# recognized from its header line alone, read from the first SNIFF_BYTES of the file, and the
+# resolved layout is cached per header, so recognition costs the same whatever the file size.
+# Add a device with register_dialect; nothing on the parsing path changes.
+SNIFF_BYTES = int(os.getenv("CSV_SNIFF_BYTES", "4096"))
+UNIT_FACTORS = {'kg': 1.0, 'lb': 0.45359237, 'lbs': 0.45359237}
+
+DIALECTS = {}
+
+# Normalize a raw header name (remove spaces, standardize)
+def normalize_column(col):
+    return col.strip().replace(' ', '').replace('(kg)', 'kg')
+
+def register_dialect(name, signature, columns, weight=None, scale=None, metrics=None, priority=0):
+    if weight and weight[1] not in UNIT_FACTORS:
+        raise ValueError(f"Unknown weight unit: {weight[1]}")
+    DIALECTS[name] = {
+        'name': name,
+        'signature': frozenset(signature),
+        'columns': dict(columns),
+        'weight': weight,
+        'scale': dict(scale or {}),
+        'metrics': dict(metrics or {}),
+        'priority': priority
+    }
+    resolve_layout.cache_clear()
+
+# The header line of a CSV source (bytes or path) as pandas will name the columns; reads
+# SNIFF_BYTES at a time until the first non-blank line is complete
+def read_header(source):
+    if isinstance(source, bytes):
+        chunk, more = source[:SNIFF_BYTES], len(source) > SNIFF_BYTES
+        while more and not chunk.lstrip(b'\r\n').count(b'\n'):
+            chunk = source[:len(chunk) * 2]
+            more = len(source) > len(chunk)
+    else:
+        with open(source, 'rb') as f:
+            chunk = f.read(SNIFF_BYTES)
+            while not chunk.lstrip(b'\r\n').count(b'\n'):
+                block = f.read(len(chunk))
+                if not block:
+                    break
+                chunk += block
+    text = chunk.decode('utf-8-sig', errors='replace').lstrip('\r\n')
+    row = next(csv.reader(io.StringIO(text.split('\n', 1)[0].rstrip('\r'))), [])
+    if not row:
+        raise ValueError("No columns to parse from file")
+    # pandas names blank headers "Unnamed: i" and numbers repeats "name.1", "name.2", ...
+    names, seen = [], {}
+    for i, raw in enumerate(row):
+        name = raw or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return tuple(names)
+
+# The registered dialect that best matches a set of normalized header names, or None
+def match_dialect(present):
+    matches = [dialect for dialect in DIALECTS.values() if dialect['signature'] <= present]
+    if not matches:
+        return None
+    return max(matches, key=lambda dialect: (len(dialect['signature']), dialect['priority']))
+
+# Columns to load, their dtypes and names, weight conversion, metrics and timestamp columns for a
+# header (a tuple of raw names). Cached: the layout is shared and must be treated as read-only.
+@lru_cache(maxsize=256)
+def resolve_layout(header):
+    normalized = {raw: normalize_column(raw) for raw in header}
+    present = set(normalized.values())
+    dialect = match_dialect(present)
+    if dialect is None:
+        raise ValueError(f"Unrecognized workout export (columns: {', '.join(header)})")
+    columns = dialect['columns']
+    weight_col, unit = dialect['weight'] or (None, 'kg')
+    time_cols = timestamp_columns(present)
+
+    usecols = []
+    dtype = {}
+    names = {}
+    for raw, col in normalized.items():
+        target = columns.get(col)
+        if target is None and col not in time_cols:
+            continue
+        if target == 'Exercise':
+            dtype[raw] = 'category'
+        elif target is not None and target == weight_col:
+            # Loads repeat a lot, so read them as categories and strip the unit once per distinct value
+            dtype[raw] = 'category'
+        elif target in dialect['metrics']:
+            dtype[raw] = 'float64'
+        usecols.append(raw)
+        names[raw] = target or col
+    return {
+        'dialect': dialect['name'],
+        'usecols': usecols,
+        'dtype': dtype,
+        'names': names,
+        'weight_col': weight_col if weight_col in names.values() else None,
+        'weight_factor': UNIT_FACTORS[unit],
+        'scale': {col: factor for col, factor in dialect['scale'].items() if col in names.values()},
+        'metrics': {col: metric for col, metric in dialect['metrics'].items() if col in names.values()},
+        'time_cols': time_cols
+    }
+
+# Recognize a CSV source (bytes or path) from its header line
+def sniff_layout(source):
+    return resolve_layout(read_header(source))
+
+# Built-in dialects. Both device exports share their metric columns; only the load column differs.
+VBT_METRICS = {
+    'Average': ('Mean Velocity', 'm/s', 2),
+    'MeanVelocity(m/s)': ('Mean Velocity', 'm/s', 2),
+    'Best': ('Peak Velocity', 'm/s', 2),
+    'PeakVelocity(m/s)': ('Peak Velocity', 'm/s', 2),
+    'MeanPower(W)': ('Mean Power', 'W', 0),
+    'PeakPower(W)': ('Peak Power', 'W', 0),
+    'Height(cm)': ('Height', 'cm', 2),
+    'VerticalDistance(cm)': ('Vertical Distance', 'cm', 2)
+}
+_WORKOUT_COLUMNS = {col: col for col in ('Exercise', 'Set', 'Reps', 'Rep', *VBT_METRICS)}
+
+# 'Load' holds strings like "80.0kg"
+register_dialect('load', ('Exercise', 'Load'), dict(_WORKOUT_COLUMNS, Load='Load'), weight=('Load', 'kg'), metrics=VBT_METRICS)
+# 'Weight (kg)' holds plain numbers
+register_dialect('weight', ('Exercise', 'Weightkg'), dict(_WORKOUT_COLUMNS, Weightkg='Weightkg'), weight=('Weightkg', 'kg'), metrics=VBT_METRICS)
+# Any other export with an Exercise column: no load, whatever known columns it has
+register_dialect('generic', ('Exercise',), _WORKOUT_COLUMNS, metrics=VBT_METRICS, priority=-1)
+# Loads in pounds, e.g. 'Weight (lbs)'; stored as kg like the 'weight' dialect
+for header in ('Weight(lb)', 'Weight(lbs)'):
+    register_dialect(f"weight_{header[7:-1]}", ('Exercise', header), dict(_WORKOUT_COLUMNS, **{header: 'Weightkg'}),
+                     weight=('Weightkg', 'lb'), metrics=VBT_METRICS)
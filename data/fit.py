@@ -0,0 +1,396 @@
+import io
+import os
+import time
+import struct
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from data.aggregate import get_reps_col
+from data.vbt import velocity_column
+
+# Binary FIT encoding of a parsed workout, so a whole session goes to Strava's uploads endpoint in
+# one request with its per-set detail intact instead of as a text description.
+# Layout ("summary last", as devices write it): file_id, the developer field descriptions, timer
+# start, one set message per (exercise, set), one lap per exercise (each run of consecutive sets of
+# the same exercise) or per set, timer stop, session and activity.
+# Sets carry the standard repetitions and weight fields; velocities, best and total load and exercise
+# names go in developer fields. Every message type is packed as one numpy structured array, and the
+# file is written to its output as it is built (only the 14-byte header is patched at the end).
+FIT_LAP_MODE = os.getenv("FIT_LAP_MODE", "exercise")
+LAP_MODES = ('exercise', 'set')
+# Set timing when the export has no timestamps: the workout is spread evenly over its elapsed time
+DEFAULT_ELAPSED_TIME = 600
+# The athlete's IANA time zone. Export timestamps are wall-clock time there, and the activity's
+# local time is written in it; the zone of the machine doing the encoding says nothing about either.
+FIT_TIMEZONE = os.getenv("FIT_TIMEZONE", "UTC")
+
+HEADER_SIZE = 14
+PROTOCOL_VERSION = 0x20
+PROFILE_VERSION = 2132
+# FIT timestamps count seconds from 1989-12-31T00:00:00Z
+FIT_EPOCH = 631065600
+# Identifies this app's developer fields
+APPLICATION_ID = bytes.fromhex('5b1d0c9e7a4f4c2e9d3a6f0b8e21c47d')
+MAX_NAME_BYTES = 64
+
+# Base types: (id, numpy dtype, invalid value)
+ENUM = (0x00, 'u1', 0xFF)
+UINT8 = (0x02, 'u1', 0xFF)
+UINT16 = (0x84, '<u2', 0xFFFF)
+UINT32 = (0x86, '<u4', 0xFFFFFFFF)
+UINT32Z = (0x8C, '<u4', 0)
+# Float fields are stored by bit pattern so missing values can carry FIT's invalid marker
+FLOAT32 = (0x88, '<u4', 0xFFFFFFFF)
+BYTE = (0x0D, 'u1', 0xFF)
+STRING = (0x07, 'u1', 0)
+
+# Profile values
+FILE_ACTIVITY = 4
+MANUFACTURER_DEVELOPMENT = 255
+EVENT_TIMER, EVENT_SESSION, EVENT_LAP, EVENT_ACTIVITY = 0, 8, 9, 26
+EVENT_TYPE_START, EVENT_TYPE_STOP, EVENT_TYPE_STOP_ALL = 0, 1, 4
+SPORT_TRAINING = 10
+SUB_SPORT_STRENGTH_TRAINING = 20
+SET_TYPE_ACTIVE = 1
+ACTIVITY_MANUAL = 0
+
+MESG_FILE_ID = 0
+MESG_SESSION = 18
+MESG_LAP = 19
+MESG_EVENT = 21
+MESG_ACTIVITY = 34
+MESG_FIELD_DESCRIPTION = 206
+MESG_DEVELOPER_DATA_ID = 207
+MESG_SET = 225
+
+# Developer fields: name -> (field number, base type, units)
+DEVELOPER_FIELDS = {
+    'exercise': (0, STRING, ''),
+    'best_load': (1, FLOAT32, 'kg'),
+    'mean_velocity': (2, FLOAT32, 'm/s'),
+    'peak_velocity': (3, FLOAT32, 'm/s'),
+    'total_load': (4, FLOAT32, 'kg')
+}
+PEAK_VELOCITY_COLUMNS = ('PeakVelocity(m/s)', 'Best')
+
+# CRC-16 used by FIT (reflected polynomial 0xA001), one table lookup per byte
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _crc_table()
+
+def fit_crc(data, crc=0):
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+def fit_time(seconds):
+    return np.asarray(np.asarray(seconds, dtype='float64') - FIT_EPOCH, dtype='int64').clip(0, 0xFFFFFFFE).astype('<u4')
+
+# float values -> FIT float32 bit patterns, NaN -> invalid
+def _float_bits(values):
+    values = np.asarray(values, dtype='float32')
+    return np.where(np.isnan(values), np.uint32(0xFFFFFFFF), values.view('<u4')).astype('<u4')
+
+def _scaled(values, scale, base):
+    values = np.asarray(values, dtype='float64') * scale
+    limit = base[2]
+    return np.where(np.isnan(values), limit, np.round(values).clip(0, limit - 1)).astype(base[1])
+
+def _strings(values, size):
+    encoded = [str(value).encode('utf-8')[:size - 1] for value in values]
+    return np.array(encoded, dtype=f'S{size}').view(('u1', size)).reshape(len(encoded), size)
+
+class FitWriter:
+    # Writes FIT records to a seekable binary stream, keeping the running data size and CRC.
+    # Each message type is defined once (field list -> local message number) and its rows are
+    # written as one packed block.
+    def __init__(self, out):
+        self.out = out
+        self._start = out.tell()
+        out.write(b'\0' * HEADER_SIZE)
+        self._crc = 0
+        self._size = 0
+        self._local = {}
+
+    def _write(self, data):
+        self._crc = fit_crc(data, self._crc)
+        self._size += len(data)
+        self.out.write(data)
+
+    # fields: [(field number, base type, size)]; dev_fields: [(field number, size, developer index)]
+    def define(self, name, global_num, fields, dev_fields=()):
+        local = len(self._local)
+        if local > 15:
+            raise ValueError("A FIT file can hold at most 16 local message types")
+        header = 0x40 | (0x20 if dev_fields else 0) | local
+        data = bytearray(struct.pack('<BBBHB', header, 0, 0, global_num, len(fields)))
+        for number, base, size in fields:
+            data += struct.pack('<BBB', number, size, base[0])
+        if dev_fields:
+            data.append(len(dev_fields))
+            for number, size, index in dev_fields:
+                data += struct.pack('<BBB', number, size, index)
+        self._write(bytes(data))
+        self._local[name] = local
+        return local
+
+    # columns: {field key: array} in definition order, all of the same length
+    def write_rows(self, name, columns):
+        local = self._local[name]
+        arrays = list(columns.values())
+        rows = len(arrays[0]) if arrays else 0
+        dtype = [('header', 'u1')]
+        for key, array in columns.items():
+            array = np.asarray(array)
+            dtype.append((key, array.dtype.str, array.shape[1:]) if array.ndim > 1 else (key, array.dtype.str))
+        block = np.zeros(rows, dtype=np.dtype(dtype))
+        block['header'] = local
+        for key, array in columns.items():
+            block[key] = array
+        self._write(block.tobytes())
+
+    # Append the file CRC and fill in the header; returns the total size. The file CRC is defined
+    # over header and data, but a header ending in its own CRC leaves the running CRC at 0.
+    def close(self):
+        self.out.write(struct.pack('<H', self._crc))
+        end = self.out.tell()
+        header = struct.pack('<BBHI4s', HEADER_SIZE, PROTOCOL_VERSION, PROFILE_VERSION, self._size, b'.FIT')
+        header += struct.pack('<H', fit_crc(header))
+        self.out.seek(self._start)
+        self.out.write(header)
+        self.out.seek(end)
+        return end - self._start
+
+# Per-set rows of a workout in time order: exercise, reps, load, velocities, start and end (Unix time).
+# With a Timestamp column the sets keep their real times; otherwise they are laid out back to back,
+# grouped by exercise in order of appearance, over elapsed_time seconds from start. Timestamps are
+# read as wall-clock time in tz.
+def workout_sets(workout, selected_exercise=None, start=None, elapsed_time=None, tz=FIT_TIMEZONE):
+    df = workout['df']
+    if selected_exercise:
+        df = df[df['Exercise'] == selected_exercise]
+    weight_col = workout['weight_col']
+    reps_col = get_reps_col(df)
+    vel_col = velocity_column(df)
+    peak_col = next((col for col in PEAK_VELOCITY_COLUMNS if col in df.columns), None)
+    timestamps = df['Timestamp'] if 'Timestamp' in df.columns and df['Timestamp'].notna().any() else None
+
+    frame = pd.DataFrame({
+        'exercise': df['Exercise'].astype(str),
+        # Without a Set column every row is a set, as in the summary
+        'set': df['Set'] if 'Set' in df.columns else np.arange(len(df)),
+        'reps': df[reps_col].astype('float64') if reps_col else 0.0,
+        'load': df[weight_col].astype('float64') if weight_col else np.nan,
+        'mean_velocity': df[vel_col].astype('float64') if vel_col else np.nan,
+        'peak_velocity': df[peak_col].astype('float64') if peak_col else np.nan
+    })
+    spec = {
+        'reps': ('reps', 'sum'),
+        'load': ('load', 'max'),
+        'total_load': ('load', 'sum'),
+        'mean_velocity': ('mean_velocity', 'mean'),
+        'peak_velocity': ('peak_velocity', 'max')
+    }
+    if timestamps is not None:
+        # Rows without a timestamp belong to the set around them
+        frame['ts'] = (timestamps.ffill().bfill() - pd.Timestamp(0)).dt.total_seconds()
+        spec['start'] = ('ts', 'min')
+        spec['end'] = ('ts', 'max')
+    sets = frame.groupby(['exercise', 'set'], sort=False).agg(**spec).reset_index()
+
+    if timestamps is not None:
+        # Parsed timestamps are naive local wall-clock time
+        offset = utc_offset(sets['start'].min(), tz)
+        sets['start'] -= offset
+        sets['end'] -= offset
+        sets = sets.sort_values(['start', 'end'], kind='stable').reset_index(drop=True)
+        sets['end'] = np.maximum(sets['end'], sets['start'] + 1)
+    else:
+        order = {name: n for n, name in enumerate(dict.fromkeys(sets['exercise']))}
+        sets = sets.iloc[np.argsort(sets['exercise'].map(order).to_numpy(), kind='stable')].reset_index(drop=True)
+        elapsed_time = elapsed_time or DEFAULT_ELAPSED_TIME
+        start = start if start is not None else time.time() - elapsed_time
+        slot = elapsed_time / max(1, len(sets))
+        sets['start'] = start + slot * np.arange(len(sets))
+        sets['end'] = sets['start'] + slot
+    return sets
+
+# The UTC offset of time zone tz, in seconds, at a naive local time given as if it were Unix time
+def utc_offset(local_seconds, tz=FIT_TIMEZONE):
+    local = datetime.fromtimestamp(local_seconds, timezone.utc).replace(tzinfo=ZoneInfo(tz))
+    return local.utcoffset().total_seconds()
+
+# Laps from sets: runs of consecutive sets of the same exercise, or one lap per set
+def workout_laps(sets, lap_mode=FIT_LAP_MODE):
+    if lap_mode not in LAP_MODES:
+        raise ValueError(f"Unknown lap mode: {lap_mode}")
+    if lap_mode == 'set':
+        runs = np.arange(len(sets))
+    else:
+        names = sets['exercise'].to_numpy()
+        runs = np.concatenate(([0], np.cumsum(names[1:] != names[:-1]))) if len(names) else np.array([], dtype=int)
+    return sets.groupby(runs, sort=True).agg(
+        exercise=('exercise', 'first'),
+        start=('start', 'min'),
+        end=('end', 'max'),
+        reps=('reps', 'sum'),
+        best_load=('load', 'max'),
+        total_load=('total_load', 'sum'),
+        mean_velocity=('mean_velocity', 'mean'),
+        peak_velocity=('peak_velocity', 'max')
+    ).reset_index(drop=True)
+
+def _developer_fields(writer):
+    writer.define('developer_data_id', MESG_DEVELOPER_DATA_ID, [(1, BYTE, 16), (3, UINT8, 1)])
+    writer.write_rows('developer_data_id', {
+        'application_id': np.frombuffer(APPLICATION_ID, dtype='u1').reshape(1, 16),
+        'developer_data_index': np.array([0], dtype='u1')
+    })
+    writer.define('field_description', MESG_FIELD_DESCRIPTION, [(0, UINT8, 1), (1, UINT8, 1), (2, UINT8, 1), (3, STRING, 32), (8, STRING, 16)])
+    names = list(DEVELOPER_FIELDS)
+    writer.write_rows('field_description', {
+        'developer_data_index': np.zeros(len(names), dtype='u1'),
+        'field_definition_number': np.array([DEVELOPER_FIELDS[n][0] for n in names], dtype='u1'),
+        'fit_base_type_id': np.array([DEVELOPER_FIELDS[n][1][0] for n in names], dtype='u1'),
+        'field_name': _strings(names, 32),
+        'units': _strings([DEVELOPER_FIELDS[n][2] for n in names], 16)
+    })
+
+def _dev(name, size=4):
+    return (DEVELOPER_FIELDS[name][0], size, 0)
+
+# Write a workout as a FIT activity file to a seekable binary stream; returns the number of bytes written.
+# start / elapsed_time (Unix time, seconds) place a workout that has no timestamps of its own;
+# tz is the athlete's time zone.
+def write_fit(workout, out, selected_exercise=None, lap_mode=FIT_LAP_MODE, start=None, elapsed_time=None, tz=FIT_TIMEZONE):
+    if start is None and workout.get('start') is not None:
+        start = pd.Timestamp(workout['start']).to_pydatetime().replace(tzinfo=ZoneInfo(tz)).timestamp()
+    sets = workout_sets(workout, selected_exercise, start, elapsed_time or workout.get('elapsed_time'), tz)
+    if sets.empty:
+        raise ValueError("No sets to encode")
+    laps = workout_laps(sets, lap_mode)
+    first, last = float(sets['start'].min()), float(sets['end'].max())
+    elapsed_ms = int(round((last - first) * 1000))
+    name_size = min(MAX_NAME_BYTES, max(len(str(name).encode('utf-8')) for name in laps['exercise']) + 1)
+
+    writer = FitWriter(out)
+    writer.define('file_id', MESG_FILE_ID, [(0, ENUM, 1), (1, UINT16, 2), (2, UINT16, 2), (3, UINT32Z, 4), (4, UINT32, 4)])
+    writer.write_rows('file_id', {
+        'type': np.array([FILE_ACTIVITY], dtype='u1'),
+        'manufacturer': np.array([MANUFACTURER_DEVELOPMENT], dtype='<u2'),
+        'product': np.array([0], dtype='<u2'),
+        'serial_number': np.array([int(first) & 0xFFFFFFFF or 1], dtype='<u4'),
+        'time_created': fit_time([last])
+    })
+    _developer_fields(writer)
+
+    writer.define('event', MESG_EVENT, [(253, UINT32, 4), (0, ENUM, 1), (1, ENUM, 1)])
+    writer.write_rows('event', {
+        'timestamp': fit_time([first]),
+        'event': np.array([EVENT_TIMER], dtype='u1'),
+        'event_type': np.array([EVENT_TYPE_START], dtype='u1')
+    })
+
+    writer.define('set', MESG_SET,
+                  [(254, UINT32, 4), (0, UINT32, 4), (3, UINT16, 2), (4, UINT16, 2), (5, UINT8, 1), (6, UINT32, 4), (10, UINT16, 2)],
+                  [_dev('exercise', name_size), _dev('mean_velocity'), _dev('peak_velocity')])
+    writer.write_rows('set', {
+        'timestamp': fit_time(sets['end']),
+        'duration': _scaled(sets['end'] - sets['start'], 1000, UINT32),
+        'repetitions': _scaled(sets['reps'], 1, UINT16),
+        'weight': _scaled(sets['load'], 16, UINT16),
+        'set_type': np.full(len(sets), SET_TYPE_ACTIVE, dtype='u1'),
+        'start_time': fit_time(sets['start']),
+        'message_index': np.arange(len(sets), dtype='<u2'),
+        'exercise': _strings(sets['exercise'], name_size),
+        'mean_velocity': _float_bits(sets['mean_velocity']),
+        'peak_velocity': _float_bits(sets['peak_velocity'])
+    })
+
+    lap_elapsed = _scaled(laps['end'] - laps['start'], 1000, UINT32)
+    writer.define('lap', MESG_LAP,
+                  [(254, UINT16, 2), (253, UINT32, 4), (0, ENUM, 1), (1, ENUM, 1), (2, UINT32, 4), (7, UINT32, 4),
+                   (8, UINT32, 4), (10, UINT32, 4), (25, ENUM, 1), (39, ENUM, 1)],
+                  [_dev('exercise', name_size), _dev('best_load'), _dev('total_load'), _dev('mean_velocity'), _dev('peak_velocity')])
+    writer.write_rows('lap', {
+        'message_index': np.arange(len(laps), dtype='<u2'),
+        'timestamp': fit_time(laps['end']),
+        'event': np.full(len(laps), EVENT_LAP, dtype='u1'),
+        'event_type': np.full(len(laps), EVENT_TYPE_STOP, dtype='u1'),
+        'start_time': fit_time(laps['start']),
+        'total_elapsed_time': lap_elapsed,
+        'total_timer_time': lap_elapsed,
+        'total_cycles': _scaled(laps['reps'], 1, UINT32),
+        'sport': np.full(len(laps), SPORT_TRAINING, dtype='u1'),
+        'sub_sport': np.full(len(laps), SUB_SPORT_STRENGTH_TRAINING, dtype='u1'),
+        'exercise': _strings(laps['exercise'], name_size),
+        'best_load': _float_bits(laps['best_load']),
+        'total_load': _float_bits(laps['total_load']),
+        'mean_velocity': _float_bits(laps['mean_velocity']),
+        'peak_velocity': _float_bits(laps['peak_velocity'])
+    })
+
+    writer.write_rows('event', {
+        'timestamp': fit_time([last]),
+        'event': np.array([EVENT_TIMER], dtype='u1'),
+        'event_type': np.array([EVENT_TYPE_STOP_ALL], dtype='u1')
+    })
+
+    writer.define('session', MESG_SESSION,
+                  [(254, UINT16, 2), (253, UINT32, 4), (0, ENUM, 1), (1, ENUM, 1), (2, UINT32, 4), (5, ENUM, 1), (6, ENUM, 1),
+                   (7, UINT32, 4), (8, UINT32, 4), (10, UINT32, 4), (25, UINT16, 2), (26, UINT16, 2)],
+                  [_dev('total_load')])
+    writer.write_rows('session', {
+        'message_index': np.array([0], dtype='<u2'),
+        'timestamp': fit_time([last]),
+        'event': np.array([EVENT_SESSION], dtype='u1'),
+        'event_type': np.array([EVENT_TYPE_STOP], dtype='u1'),
+        'start_time': fit_time([first]),
+        'sport': np.array([SPORT_TRAINING], dtype='u1'),
+        'sub_sport': np.array([SUB_SPORT_STRENGTH_TRAINING], dtype='u1'),
+        'total_elapsed_time': np.array([elapsed_ms], dtype='<u4'),
+        'total_timer_time': np.array([elapsed_ms], dtype='<u4'),
+        'total_cycles': _scaled([sets['reps'].sum()], 1, UINT32),
+        'first_lap_index': np.array([0], dtype='<u2'),
+        'num_laps': np.array([len(laps)], dtype='<u2'),
+        'total_load': _float_bits([sets['total_load'].sum()])
+    })
+
+    writer.define('activity', MESG_ACTIVITY, [(253, UINT32, 4), (0, UINT32, 4), (1, UINT16, 2), (2, ENUM, 1), (3, ENUM, 1), (4, ENUM, 1), (5, UINT32, 4)])
+    writer.write_rows('activity', {
+        'timestamp': fit_time([last]),
+        'total_timer_time': np.array([elapsed_ms], dtype='<u4'),
+        'num_sessions': np.array([1], dtype='<u2'),
+        'type': np.array([ACTIVITY_MANUAL], dtype='u1'),
+        'event': np.array([EVENT_ACTIVITY], dtype='u1'),
+        'event_type': np.array([EVENT_TYPE_STOP], dtype='u1'),
+        'local_timestamp': fit_time([last + datetime.fromtimestamp(last, ZoneInfo(tz)).utcoffset().total_seconds()])
+    })
+    return writer.close()
+
+# FIT file contents for a workout
+def encode_fit(workout, selected_exercise=None, lap_mode=FIT_LAP_MODE, start=None, elapsed_time=None, tz=FIT_TIMEZONE):
+    out = io.BytesIO()
+    write_fit(workout, out, selected_exercise, lap_mode, start, elapsed_time, tz)
+    return out.getvalue()
+
+# Write one FIT file per (name, workout) into directory as each is encoded, yielding
+# (name, path, size); nothing is held in memory beyond the workout being encoded
+def write_fit_files(workouts, directory, selected_exercise=None, lap_mode=FIT_LAP_MODE, tz=FIT_TIMEZONE):
+    os.makedirs(directory, exist_ok=True)
+    for name, workout in workouts:
+        path = os.path.join(directory, f"{name}.fit")
+        with open(path, 'wb') as out:
+            size = write_fit(workout, out, selected_exercise, lap_mode, tz=tz)
+        yield name, path, size
@@ -0,0 +1,319 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import pandas as pd
+
+from data.aggregate import get_reps_col
+from data.parser import CSV_CHUNKSIZE, get_workout
+from utils.metrics import timed
+
+# Local history of uploaded sessions with incrementally maintained per-exercise rollups, kept per
+# athlete (owner). Each upload adds one row per exercise to session_exercises and folds that row
+# into the athlete's rollup for the exercise, so recording a session costs O(rows in that session)
+# no matter how much history there is, and trend lines are read from the rollups without
+# rescanning anything.
+HISTORY_DB = os.getenv("WORKOUT_HISTORY_DB", os.path.join(tempfile.gettempdir(), "strava_uploader_history.db"))
+# Length of the rolling volume window, in days
+HISTORY_WINDOW_DAYS = float(os.getenv("HISTORY_WINDOW_DAYS", "28"))
+
+# Per-session figures kept for every exercise, and which ones can set a personal record
+SESSION_FIELDS = ('sets', 'reps', 'volume', 'best_load', 'mean_velocity', 'peak_velocity', 'peak_power')
+RECORD_FIELDS = {
+    'best_load': ('Best Load', 'kg', 1),
+    'mean_velocity': ('Best Mean Velocity', 'm/s', 2),
+    'peak_velocity': ('Peak Velocity', 'm/s', 2),
+    'peak_power': ('Peak Power', 'W', 0)
+}
+
+_lock = threading.Lock()
+_conn = None
+
+def _open_connection():
+    conn = sqlite3.connect(HISTORY_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # History written before it was kept per athlete can't be attributed to anyone
+    if 'owner' not in {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}:
+        for table in ('sessions', 'session_exercises', 'rollups'):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        "owner TEXT NOT NULL, key TEXT NOT NULL, name TEXT, recorded_at REAL NOT NULL, "
+        "PRIMARY KEY (owner, key))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS session_exercises ("
+        "owner TEXT NOT NULL, session_key TEXT NOT NULL, exercise TEXT NOT NULL, recorded_at REAL NOT NULL, "
+        "sets INTEGER, reps REAL, volume REAL, best_load REAL, "
+        "mean_velocity REAL, peak_velocity REAL, peak_power REAL, "
+        "PRIMARY KEY (owner, session_key, exercise))"
+    )
+    # Range scans by exercise and time for aging the rolling window and finding the last session
+    conn.execute("CREATE INDEX IF NOT EXISTS session_exercises_by_time ON session_exercises (owner, exercise, recorded_at)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS rollups ("
+        "owner TEXT NOT NULL, exercise TEXT NOT NULL, sessions INTEGER NOT NULL, lifetime_volume REAL NOT NULL, "
+        "window_volume REAL NOT NULL, window_start REAL NOT NULL, "
+        "best_load REAL, mean_velocity REAL, peak_velocity REAL, peak_power REAL, "
+        "last_session_key TEXT, last_recorded_at REAL, "
+        "PRIMARY KEY (owner, exercise))"
+    )
+    return conn
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = _open_connection()
+    return _conn
+
+# Source columns for each velocity/power figure, resolved from the metric names of the workout's dialect
+def _metric_columns(df, metrics, name):
+    return [col for col, (metric, _, _) in metrics.items() if metric == name and col in df.columns]
+
+def _none_if_nan(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+# Per-exercise session figures from a normalized workout frame and its dialect's metrics, in one
+# grouped pass
+def session_stats(df, weight_col, metrics):
+    reps_col = get_reps_col(df)
+    grouped = df.groupby('Exercise', sort=False, observed=True)
+    spec = {'_rows': ('Exercise', 'size')}
+    if 'Set' in df.columns:
+        spec['sets'] = ('Set', 'nunique')
+    if reps_col:
+        spec['reps'] = (reps_col, 'sum')
+    if weight_col:
+        spec['volume'] = (weight_col, 'sum')
+        spec['best_load'] = (weight_col, 'max')
+    for field, metric, how in (
+        ('mean_velocity', 'Mean Velocity', 'max'),
+        ('peak_velocity', 'Peak Velocity', 'max'),
+        ('peak_power', 'Peak Power', 'max')
+    ):
+        # Any column the dialect names this metric works; the first one present wins
+        columns = _metric_columns(df, metrics, metric)
+        if columns:
+            spec[field] = (columns[0], how)
+    stats = grouped.agg(**spec)
+
+    sessions = {}
+    for exercise, row in stats.iterrows():
+        sessions[str(exercise)] = {
+            'sets': int(row['sets']) if 'sets' in row else int(row['_rows']),
+            'reps': float(row['reps']) if 'reps' in row else 0.0,
+            'volume': float(row['volume']) if 'volume' in row else 0.0,
+            'best_load': _none_if_nan(row.get('best_load')),
+            'mean_velocity': _none_if_nan(row.get('mean_velocity')),
+            'peak_velocity': _none_if_nan(row.get('peak_velocity')),
+            'peak_power': _none_if_nan(row.get('peak_power'))
+        }
+    return sessions
+
+# Per-exercise figures for a loaded workout (optionally just the exercise that was uploaded)
+def workout_stats(workout, selected_exercise=None):
+    df = workout['df']
+    if selected_exercise and selected_exercise in workout['exercises']:
+        df = df[df['Exercise'] == selected_exercise]
+    return session_stats(df, workout['weight_col'], workout['metrics'])
+
+# Per-exercise figures for an uploaded file. Needs the rows, so it returns None in streaming mode.
+def upload_stats(file, selected_exercise=None):
+    if CSV_CHUNKSIZE:
+        return None
+    return workout_stats(get_workout(file), selected_exercise)
+
+def _best(current, value):
+    if value is None:
+        return current
+    return value if current is None else max(current, value)
+
+# Volume still inside the rolling window at `now`, subtracting sessions that have aged out since
+# window_start. Each session ages out once, so the range scan is amortized O(1) per session.
+def _aged_window(conn, rollup, now):
+    cutoff = now - HISTORY_WINDOW_DAYS * 86400
+    if rollup['window_start'] >= cutoff:
+        return rollup['window_volume'], rollup['window_start']
+    expired = conn.execute(
+        "SELECT COALESCE(SUM(volume), 0) FROM session_exercises "
+        "WHERE owner = ? AND exercise = ? AND recorded_at >= ? AND recorded_at < ?",
+        (rollup['owner'], rollup['exercise'], rollup['window_start'], cutoff)
+    ).fetchone()[0]
+    return rollup['window_volume'] - expired, cutoff
+
+def _rollup_row(conn, owner, exercise):
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM rollups WHERE owner = ? AND exercise = ?", (owner, exercise)).fetchone()
+    finally:
+        conn.row_factory = None
+    return dict(row) if row else None
+
+def _session_row(conn, owner, session_key, exercise):
+    if not session_key:
+        return None
+    row = conn.execute(
+        f"SELECT {', '.join(SESSION_FIELDS)} FROM session_exercises WHERE owner = ? AND session_key = ? AND exercise = ?",
+        (owner, session_key, exercise)
+    ).fetchone()
+    return dict(zip(SESSION_FIELDS, row)) if row else None
+
+# Fold one session into an athlete's history. Recording the same content key twice is a no-op.
+# Returns True if the session was new.
+def record_session(owner, key, stats, name=None, recorded_at=None):
+    owner = str(owner)
+    recorded_at = time.time() if recorded_at is None else recorded_at
+    with _lock, timed('storage_io'):
+        conn = _connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO sessions (owner, key, name, recorded_at) VALUES (?, ?, ?, ?)",
+                (owner, key, name, recorded_at)
+            ).rowcount
+            if not inserted:
+                conn.execute("ROLLBACK")
+                return False
+
+            for exercise, session in stats.items():
+                rollup = _rollup_row(conn, owner, exercise) or {
+                    'owner': owner, 'exercise': exercise, 'sessions': 0, 'lifetime_volume': 0.0,
+                    'window_volume': 0.0, 'window_start': recorded_at,
+                    'best_load': None, 'mean_velocity': None, 'peak_velocity': None, 'peak_power': None,
+                    'last_session_key': None, 'last_recorded_at': None
+                }
+                # Age the window up to the newest session seen, then add this one if it falls inside
+                newest = max(recorded_at, rollup['last_recorded_at'] or recorded_at)
+                window_volume, window_start = _aged_window(conn, rollup, newest)
+                # A backfilled session only counts if it is still inside the window
+                if recorded_at >= newest - HISTORY_WINDOW_DAYS * 86400:
+                    window_volume += session['volume']
+                    window_start = min(window_start, recorded_at)
+
+                # Inserted after aging so the range scan above never sees this session
+                conn.execute(
+                    "INSERT INTO session_exercises (owner, session_key, exercise, recorded_at, "
+                    f"{', '.join(SESSION_FIELDS)}) VALUES (?, ?, ?, ?, {', '.join('?' * len(SESSION_FIELDS))})",
+                    (owner, key, exercise, recorded_at, *(session[f] for f in SESSION_FIELDS))
+                )
+                is_latest = rollup['last_recorded_at'] is None or recorded_at >= rollup['last_recorded_at']
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollups (owner, exercise, sessions, lifetime_volume, window_volume, window_start, "
+                    "best_load, mean_velocity, peak_velocity, peak_power, last_session_key, last_recorded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        owner,
+                        exercise,
+                        rollup['sessions'] + 1,
+                        rollup['lifetime_volume'] + session['volume'],
+                        window_volume,
+                        window_start,
+                        *(_best(rollup[f], session[f]) for f in RECORD_FIELDS),
+                        key if is_latest else rollup['last_session_key'],
+                        recorded_at if is_latest else rollup['last_recorded_at']
+                    )
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return True
+
+# A single-exercise upload is a different session from uploading the whole file
+def workout_key(workout, selected_exercise=None):
+    key = workout['key']
+    return f"{key}:{selected_exercise}" if selected_exercise else key
+
+def session_key(file, selected_exercise=None):
+    return workout_key(get_workout(file), selected_exercise)
+
+# Record a file an athlete successfully uploaded (no-op in streaming mode)
+def record_upload(owner, file, name=None, selected_exercise=None):
+    stats = upload_stats(file, selected_exercise)
+    if stats is None:
+        return False
+    return record_session(owner, session_key(file, selected_exercise), stats, name)
+
+# An athlete's current rollups, with the rolling window aged to now: exercise -> rollup dict
+def get_rollups(owner, exercises=None):
+    owner = str(owner)
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            if exercises is None:
+                rows = conn.execute("SELECT * FROM rollups WHERE owner = ?", (owner,)).fetchall()
+            else:
+                rows = [conn.execute("SELECT * FROM rollups WHERE owner = ? AND exercise = ?", (owner, e)).fetchone()
+                        for e in exercises]
+        finally:
+            conn.row_factory = None
+        rollups = {}
+        for row in rows:
+            if row is None:
+                continue
+            rollup = dict(row)
+            rollup['window_volume'], _ = _aged_window(conn, rollup, now)
+            rollups[rollup['exercise']] = rollup
+    return rollups
+
+# "vs. last session / PR" lines for a session an athlete is about to upload.
+# Only reads one rollup and one previous session per exercise.
+def progress_lines(owner, key, stats):
+    owner = str(owner)
+    lines = []
+    with _lock:
+        conn = _connection()
+        for exercise, session in stats.items():
+            rollup = _rollup_row(conn, owner, exercise)
+            # Nothing to compare against, or this exact session is already the latest one recorded
+            if rollup is None or rollup['last_session_key'] == key:
+                continue
+            previous = _session_row(conn, owner, rollup['last_session_key'], exercise)
+            notes = []
+            if previous and previous['volume']:
+                change = session['volume'] / previous['volume'] - 1
+                notes.append(f"Volume {change:+.0%} vs. last session")
+            for field, (label, unit, decimals) in RECORD_FIELDS.items():
+                best = rollup[field]
+                if session[field] is not None and best is not None and session[field] > best:
+                    notes.append(f"New PR: {label} {session[field]:.{decimals}f} {unit} (was {best:.{decimals}f} {unit})")
+            if notes:
+                lines.append(f"## {exercise}")
+                lines.extend(f"- {note}" for note in notes)
+    if not lines:
+        return ""
+    return "\n".join(["", "Progress"] + lines) + "\n"
+
+# Progress section for an athlete's file ("" when there is no history to compare against, or
+# no athlete)
+def progress_notes(owner, file, selected_exercise=None):
+    if CSV_CHUNKSIZE or owner is None:
+        return ""
+    return workout_progress_notes(owner, get_workout(file), selected_exercise)
+
+# Progress section for a loaded workout, e.g. one session of a multi-session export
+def workout_progress_notes(owner, workout, selected_exercise=None):
+    if owner is None:
+        return ""
+    stats = workout_stats(workout, selected_exercise)
+    if not stats:
+        return ""
+    try:
+        return progress_lines(owner, workout_key(workout, selected_exercise), stats)
+    except sqlite3.Error:
+        # History is a nice-to-have; never block an upload on it
+        return ""
+
+def history_stats(owner):
+    owner = str(owner)
+    with _lock:
+        conn = _connection()
+        return {
+            'sessions': conn.execute("SELECT COUNT(*) FROM sessions WHERE owner = ?", (owner,)).fetchone()[0],
+            'exercises': conn.execute("SELECT COUNT(*) FROM rollups WHERE owner = ?", (owner,)).fetchone()[0],
+            'window_days': HISTORY_WINDOW_DAYS
+        }
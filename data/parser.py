@@ -1,104 +1,282 @@
+import io
+import os
+import time
+import string
+import hashlib
+import numpy as np
 import pandas as pd
 
-def parse_csv(file, selected_exercise=None):
-    try:
-        
-        # Load the CSV
-        df = pd.read_csv(file)
-        
-        # Normalize column names (remove spaces, standardize)
-        df.columns = [col.strip().replace(' ', '').replace('(kg)', 'kg') for col in df.columns]
-
-        # Handle weight column (could be 'Load' or 'Weightkg')
-        weight_col = None
-        if 'Load' in df.columns:
-            weight_col = 'Load'
-        elif 'Weightkg' in df.columns:
-            weight_col = 'Weightkg'
-        
-        # Convert weight column to numeric if it exists
-        if weight_col:
-            df[weight_col] = df[weight_col].astype(str).str.replace('kg', '', regex=False).astype(float)
-        
-        # Get unique exercises for potential selection
-        all_exercises = df['Exercise'].unique()
-        
-        # Filter by specific exercise if selected
-        if selected_exercise and selected_exercise in all_exercises:
-            working_df = df[df['Exercise'] == selected_exercise]
-            is_single_exercise = True
-        else:
-            working_df = df
-            is_single_exercise = False
-        
-        # Calculate totals based on filtered dataframe
-        total_weight = working_df[weight_col].sum() if weight_col else 0
-        total_sets = working_df['Set'].nunique() if 'Set' in working_df.columns else len(working_df)
-        total_reps = working_df['Reps'].sum() if 'Reps' in working_df.columns else working_df['Rep'].sum() if 'Rep' in working_df.columns else 0
-        
-        # Define possible metrics based on column names in both CSVs
-        metrics = {
-            'Average': ('Mean Velocity', 'm/s', 2),          
-            'MeanVelocity(m/s)': ('Mean Velocity', 'm/s', 2), 
-            'Best': ('Peak Velocity', 'm/s', 2),              
-            'PeakVelocity(m/s)': ('Peak Velocity', 'm/s', 2), 
-            'MeanPower(W)': ('Mean Power', 'W', 0),           
-            'PeakPower(W)': ('Peak Power', 'W', 0),           
-            'Height(cm)': ('Height', 'cm', 2),                
-            'VerticalDistance(cm)': ('Vertical Distance', 'cm', 2)
+from data.aggregate import aggregate_workout, WorkoutAccumulator
+from data.cache import workout_cache, content_key
+from data.archive import archive_workout, load_archived_workout
+from data.vbt import analyze_workout
+from data.templates import render_summary
+from data.dialects import sniff_layout
+from data.sessions import parse_timestamps, split_sessions
+from utils.metrics import timed, record
+
+# Rows per chunk for the streaming parser (0 reads the whole file into memory)
+CSV_CHUNKSIZE = int(os.getenv("CSV_CHUNKSIZE", "0"))
+
+# Build the activity description from an aggregated workout summary (see data/templates.py for formats)
+def render_description(summary, fmt=None):
+    return render_summary(summary, fmt)
+
+# Read the raw content of an uploaded file, a path or any file-like object
+def read_file_bytes(file):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    if hasattr(file, 'getvalue'):
+        data = file.getvalue()
+    else:
+        data = file.read()
+        file.seek(0)
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+# Unit suffixes stripped from load values ("80.0kg", "175 lbs")
+WEIGHT_SUFFIX_CHARS = string.ascii_letters + ' '
+
+# Recognize the export dialect of a CSV source (bytes or path) from its header line and get the
+# columns to load, their dtypes and conversions (see data/dialects.py); anything else is skipped
+def sniff_workout(source):
+    return sniff_layout(source)
+
+# pandas read_csv arguments for a sniffed layout
+def _read_options(layout):
+    return {'usecols': layout['usecols'], 'dtype': layout['dtype']}
+
+# Rename columns, turn the categorical weight column into kg floats, apply the dialect's unit
+# scaling and merge any timestamp columns into a single datetime 'Timestamp' column, in place.
+# Returns the name of the weight column, if any.
+def finish_workout(df, layout):
+    df.columns = [layout['names'][col] for col in df.columns]
+    time_cols = layout.get('time_cols')
+    if time_cols:
+        timestamps = parse_timestamps([df[col] for col in time_cols])
+        df.drop(columns=[col for col in time_cols if col != 'Timestamp'], inplace=True)
+        df['Timestamp'] = timestamps
+    weight_col = layout['weight_col']
+    if weight_col:
+        weights = df[weight_col].cat
+        # Strip a unit suffix such as "kg" or "lbs"
+        values = weights.categories.astype(str).str.rstrip(WEIGHT_SUFFIX_CHARS).astype(float).to_numpy()
+        if layout['weight_factor'] != 1.0:
+            values = values * layout['weight_factor']
+        codes = weights.codes.to_numpy()
+        df[weight_col] = np.where(codes >= 0, values[codes] if len(values) else np.nan, np.nan)
+    for col, factor in layout['scale'].items():
+        df[col] *= factor
+    return weight_col
+
+# Parse raw CSV content into a compact frame: only the needed columns, categorical exercise names,
+# float64 metrics (so displayed figures round as the export's decimals do) and a float weight column.
+# Returns the frame, its weight column and its dialect's metric definitions.
+def load_workout(data):
+    with timed('csv_read'):
+        layout = sniff_workout(data)
+        df = pd.read_csv(io.BytesIO(data), **_read_options(layout))
+    with timed('normalize'):
+        weight_col = finish_workout(df, layout)
+    return df, weight_col, layout['metrics']
+
+# Unique exercise names in order of appearance, as a plain object array
+def _exercise_names(df):
+    return np.asarray(df['Exercise'].unique(), dtype=object)
+
+# Get the parsed workout for a file, parsing it only the first time its content is seen.
+# The returned DataFrame is shared between callers and must be treated as read-only.
+def get_workout(file):
+    data = read_file_bytes(file)
+    key = content_key(data)
+    workout = workout_cache.get(('workout', key))
+    if workout is None:
+        df, weight_col, metrics = load_workout(data)
+        workout = {
+            'key': key,
+            'df': df,
+            'weight_col': weight_col,
+            'metrics': metrics,
+            # Get unique exercises for potential selection
+            'exercises': _exercise_names(df)
         }
+        workout_cache.put(('workout', key), workout, int(df.memory_usage(deep=True).sum()))
+    return workout
+
+# Resolve a file into (content key, CSV source) without loading paths into memory
+def _stream_source(file):
+    if isinstance(file, (str, os.PathLike)):
+        digest = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest(), file
+    data = read_file_bytes(file)
+    return content_key(data), data
 
-        # Generate description with appropriate details
-        description = "Workout Summary\n\n"
-        
-        if is_single_exercise:
-            # Single exercise mode
-            description += f"- Exercise: {selected_exercise}\n"
-            description += f"- Sets: {total_sets}\n"
-            description += f"- Reps: {total_reps}\n"
-            description += f"- Total Weight: {total_weight:.2f} kg\n\n"
-            
-            # Add performance metrics for this exercise
-            description += "Performance Metrics\n"
-            for col, (name, unit, decimals) in metrics.items():
-                if col in working_df.columns and not working_df[col].isnull().all():
-                    avg_value = working_df[col].mean()
-                    description += f"- {name}: {avg_value:.{decimals}f} {unit}\n"
+def _csv_input(source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+# Streaming counterpart of get_workout: reads the CSV in chunks and folds each normalized chunk
+# into running per-exercise aggregates, so peak memory stays bounded by the chunk size.
+def stream_workout(file, chunksize=CSV_CHUNKSIZE):
+    key, source = _stream_source(file)
+    workout = workout_cache.get(('stream', key))
+    if workout is None:
+        accumulator = None
+        layout = sniff_workout(source)
+        reader = pd.read_csv(_csv_input(source), chunksize=chunksize, **_read_options(layout))
+        while True:
+            started = time.perf_counter()
+            chunk = next(reader, None)
+            record('csv_read', time.perf_counter() - started)
+            if chunk is None:
+                break
+            with timed('normalize'):
+                weight_col = finish_workout(chunk, layout)
+            if accumulator is None:
+                accumulator = WorkoutAccumulator(weight_col, layout['metrics'])
+            with timed('aggregate'):
+                accumulator.add_chunk(chunk)
+        if accumulator is None:
+            accumulator = WorkoutAccumulator(None, layout['metrics'])
+        workout = {
+            'key': key,
+            'metrics': layout['metrics'],
+            'source': source if isinstance(source, bytes) else None,
+            'accumulator': accumulator,
+            'exercises': np.array(accumulator.order, dtype=object)
+        }
+        # Roughly a few hundred bytes per exercise plus the distinct set values, and the raw bytes of
+        # an in-memory upload, kept so the preview can re-read its first rows
+        nbytes = 512 * len(accumulator.order) + 64 * sum(len(acc['sets']) for acc in accumulator.exercises.values())
+        if workout['source'] is not None:
+            nbytes += len(source)
+        workout_cache.put(('stream', key), workout, nbytes)
+    return workout
+
+# First rows of a workout and its exercise list, for the upload preview
+def preview_workout(file, rows=5, chunksize=None):
+    chunksize = CSV_CHUNKSIZE if chunksize is None else chunksize
+    if not chunksize:
+        workout = get_workout(file)
+        return workout['df'].head(rows), workout['exercises']
+
+    workout = stream_workout(file, chunksize)
+    source = workout['source'] or file
+    layout = sniff_workout(source)
+    head = pd.read_csv(_csv_input(source), nrows=rows, **_read_options(layout))
+    finish_workout(head, layout)
+    return head, workout['exercises']
+
+# Parse a workout file into its aggregated summary (with rendered description) and exercise list.
+# Raises on malformed input; parse_csv is the forgiving wrapper used by the UI.
+def summarize_csv(file, selected_exercise=None, chunksize=None):
+    chunksize = CSV_CHUNKSIZE if chunksize is None else chunksize
+    if chunksize:
+        workout = stream_workout(file, chunksize)
+    else:
+        workout = get_workout(file)
+    return summarize_workout(workout, selected_exercise)
+
+# Split a timestamped workout file into one workout per session (in-memory mode only).
+# Returns None when the file has no usable timestamps. Each session has the same shape as
+# get_workout's result plus its number, start time and elapsed seconds.
+def get_sessions(file):
+    if CSV_CHUNKSIZE:
+        return None
+    workout = get_workout(file)
+    df = workout['df']
+    if 'Timestamp' not in df.columns:
+        return None
+    sessions = workout_cache.get(('sessions', workout['key']))
+    if sessions is None:
+        with timed('segment'):
+            parts = split_sessions(df, df['Timestamp'])
+        sessions = []
+        for number, (bounds, frame) in enumerate(parts or [], start=1):
+            sessions.append({
+                'key': f"{workout['key']}:session{number}",
+                'df': frame,
+                'weight_col': workout['weight_col'],
+                'metrics': workout['metrics'],
+                'exercises': _exercise_names(frame),
+                'session': number,
+                'start': bounds['start'].to_pydatetime() if not pd.isna(bounds['start']) else None,
+                'elapsed_time': int(bounds['elapsed_time'])
+            })
+        # Slices share the parent's memory; only copied (out-of-order) sessions cost extra
+        workout_cache.put(('sessions', workout['key']), sessions, 256 * len(sessions))
+    return sessions or None
+
+# Archive a parsed upload in an athlete's archive for later re-analysis. Only the in-memory mode
+# keeps the rows to archive.
+def archive_upload(file, owner):
+    if CSV_CHUNKSIZE:
+        return None
+    name = getattr(file, 'name', None) or os.path.basename(str(file))
+    return archive_workout(get_workout(file), owner, name)
+
+# Summarize one of an athlete's archived workouts without reading any CSV
+def summarize_archive(owner, key, selected_exercise=None):
+    return summarize_workout(load_archived_workout(owner, key), selected_exercise)
+
+# Aggregate and render a loaded workout (from get_workout, stream_workout or the archive)
+def summarize_workout(workout, selected_exercise=None):
+    all_exercises = workout['exercises']
+
+    # Filter by specific exercise if selected
+    is_single_exercise = bool(selected_exercise and selected_exercise in all_exercises)
+    # Only a workout with its rows has a velocity section, so the streamed and in-memory summaries
+    # of the same content are cached separately
+    mode = 'stream' if 'accumulator' in workout else 'rows'
+    summary_key = ('summary', mode, workout['key'], selected_exercise if is_single_exercise else None)
+    summary = workout_cache.get(summary_key)
+
+    if summary is None:
+        if mode == 'stream':
+            with timed('aggregate'):
+                summary = workout['accumulator'].summary(selected_exercise if is_single_exercise else None)
         else:
-            # Multiple exercises mode
-            exercises_in_df = working_df['Exercise'].unique()
-            description += f"- Total Exercises: {len(exercises_in_df)}\n"
-            description += f"- Total Sets: {total_sets}\n"
-            description += f"- Total Reps: {total_reps}\n"
-            description += f"- Total Weight: {total_weight:.2f} kg\n\n"
-            
-            # Add details for each exercise
-            description += "Exercise Details\n"
-            
-            for exercise in exercises_in_df:
-                exercise_df = working_df[working_df['Exercise'] == exercise]
-                
-                # Calculate exercise-specific totals
-                ex_sets = exercise_df['Set'].nunique() if 'Set' in exercise_df.columns else len(exercise_df)
-                ex_reps = exercise_df['Reps'].sum() if 'Reps' in exercise_df.columns else exercise_df['Rep'].sum() if 'Rep' in exercise_df.columns else 0
-                ex_weight = exercise_df[weight_col].sum() if weight_col else 0
-                
-                description += f"\n## {exercise}\n"
-                description += f"- Sets: {ex_sets}\n"
-                description += f"- Reps: {ex_reps}\n"
-                description += f"- Total Weight: {ex_weight:.2f} kg\n"
-                
-                # Add performance metrics for this exercise
-                description += "- Performance Metrics:\n"
-                for col, (name, unit, decimals) in metrics.items():
-                    if col in exercise_df.columns and not exercise_df[col].isnull().all():
-                        avg_value = exercise_df[col].mean()
-                        description += f"  • {name}: {avg_value:.{decimals}f} {unit}\n"
-
-        # Default elapsed time (could be improved with actual time calculation if data is available)
-        elapsed_time = 600  # Default to 10 minutes
-
-        return description, elapsed_time, total_weight, total_sets, total_reps, all_exercises
+            df = workout['df']
+            working_df = df[df['Exercise'] == selected_exercise] if is_single_exercise else df
+
+            # Aggregate totals and per-exercise figures in one pass
+            with timed('aggregate'):
+                summary = aggregate_workout(
+                    working_df,
+                    workout['weight_col'],
+                    workout['metrics'],
+                    selected_exercise if is_single_exercise else None
+                )
+            with timed('vbt'):
+                summary['vbt'] = analyze_workout(working_df, workout['weight_col'])
+        with timed('render'):
+            summary['description'] = render_description(summary)
+
+        # Sessions split from a timestamped export carry their real start and duration
+        summary['elapsed_time'] = workout.get('elapsed_time', 600)  # Default to 10 minutes
+        summary['start_time'] = workout.get('start')
+        nbytes = len(summary['description']) * 4
+        if summary.get('vbt') is not None:
+            nbytes += int(summary['vbt']['sets'].memory_usage(deep=True).sum())
+        workout_cache.put(summary_key, summary, nbytes)
+
+    return summary, all_exercises
+
+def parse_csv(file, selected_exercise=None, chunksize=None, description_format=None):
+    try:
+        summary, all_exercises = summarize_csv(file, selected_exercise, chunksize)
+        # The cached description uses the default format; others are rendered on demand
+        description = render_description(summary, description_format) if description_format else summary['description']
+        return (
+            description,
+            summary['elapsed_time'],
+            summary['total_weight'],
+            summary['total_sets'],
+            summary['total_reps'],
+            all_exercises
+        )
 
     except Exception as e:
         # Add print statement for debugging
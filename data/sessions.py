@@ -0,0 +1,109 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Session segmentation for exports that span several workouts.
+# Rows are split wherever the gap between consecutive timestamps exceeds SESSION_GAP_MINUTES.
+# Everything is a vectorized pass over the timestamp column: linear for the usual chronological
+# export, plus one stable sort when the rows are out of order.
+SESSION_GAP_MINUTES = float(os.getenv("SESSION_GAP_MINUTES", "90"))
+# Strava needs a positive elapsed time. A session with no time span (a single timestamp, or a
+# date-only export) gets the usual 10 minutes; a short but real span is raised to the minimum.
+DEFAULT_SESSION_SECONDS = 600
+MIN_SESSION_SECONDS = 60
+
+# Header names (normalized) that carry a full timestamp, in order of preference
+TIMESTAMP_COLUMNS = ('Timestamp', 'DateTime', 'Date/Time', 'StartTime', 'Created')
+# Fallback: separate date and time-of-day columns
+DATE_COLUMN = 'Date'
+TIME_COLUMN = 'Time'
+# UTC offset ending a timestamp, after its time of day: "10:00:00+02:00", "10:00-0500"
+UTC_OFFSET = r'\d:\d{2}(?::\d{2}(?:\.\d+)?)?\s*([+-])(\d{2}):?(\d{2})$'
+
+# Which columns of a header make up the timestamp (empty if none)
+def timestamp_columns(columns):
+    for col in TIMESTAMP_COLUMNS:
+        if col in columns:
+            return [col]
+    if DATE_COLUMN in columns and TIME_COLUMN in columns:
+        return [DATE_COLUMN, TIME_COLUMN]
+    if DATE_COLUMN in columns:
+        return [DATE_COLUMN]
+    return []
+
+# Parse the timestamp column(s) into naive datetime64 values; unparseable entries become NaT.
+# Numbers are taken as Unix epoch seconds, or milliseconds when they are too large for seconds.
+# Times with a UTC offset keep their wall-clock time, even when the offset changes within the
+# file (a multi-day export across a DST change). Columns that aren't timestamps at all come back
+# as NaT, so the workout is simply not split into sessions.
+def parse_timestamps(parts):
+    if len(parts) == 2:
+        values = parts[0].astype(str) + ' ' + parts[1].astype(str)
+    else:
+        values = parts[0]
+    try:
+        if values.dtype.kind in 'iuf':
+            unit = 'ms' if values.abs().max() > 1e11 else 's'
+            return pd.to_datetime(values, unit=unit, errors='coerce')
+        # In UTC, rows with different offsets still make one datetime column
+        timestamps = pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None)
+    except (ValueError, TypeError, OverflowError):
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    # Back to wall-clock time, each row by its own offset (Strava takes start_date_local)
+    first = values.dropna()
+    if len(first) and re.search(UTC_OFFSET, str(first.iloc[0])):
+        offsets = values.astype(str).str.extract(UTC_OFFSET)
+        sign = offsets[0].map({'+': 1, '-': -1})
+        seconds = (sign * (offsets[1].astype(float) * 3600 + offsets[2].astype(float) * 60)).fillna(0)
+        timestamps = timestamps + pd.to_timedelta(seconds, unit='s')
+    return timestamps
+
+# Session number (0, 1, ...) for every row, or None if there are no usable timestamps.
+# Rows without a timestamp stay with the session of the row before them.
+def session_ids(timestamps, gap_minutes=SESSION_GAP_MINUTES):
+    filled = timestamps.ffill().bfill()
+    if filled.isna().all():
+        return None
+    ns = filled.to_numpy(dtype='datetime64[ns]').view('int64')
+    steps = np.diff(ns)
+
+    order = None
+    if (steps < 0).any():
+        order = np.argsort(ns, kind='stable')
+        steps = np.diff(ns[order])
+    boundaries = steps > int(gap_minutes * 60 * 1e9)
+    ids = np.concatenate(([0], np.cumsum(boundaries)))
+    if order is None:
+        return ids
+    unsorted = np.empty_like(ids)
+    unsorted[order] = ids
+    return unsorted
+
+# Start, end, row count and elapsed seconds of each session
+def session_bounds(timestamps, ids):
+    bounds = pd.DataFrame({'session': ids, 'timestamp': timestamps}).groupby('session', sort=True)['timestamp'].agg(
+        start='min', end='max', rows='size'
+    )
+    elapsed = (bounds['end'] - bounds['start']).dt.total_seconds().fillna(0)
+    elapsed = elapsed.where(elapsed > 0, DEFAULT_SESSION_SECONDS)
+    bounds['elapsed_time'] = elapsed.clip(lower=MIN_SESSION_SECONDS).astype(int)
+    return bounds
+
+# Split a frame into per-session frames: [(bounds row, frame)], in chronological order.
+# Sessions that occupy a contiguous block of rows are returned as slices rather than copies.
+def split_sessions(df, timestamps, gap_minutes=SESSION_GAP_MINUTES):
+    ids = session_ids(timestamps, gap_minutes)
+    if ids is None:
+        return None
+    bounds = session_bounds(timestamps, ids)
+    positions = pd.Series(ids).groupby(ids).indices
+    sessions = []
+    for session, row in bounds.iterrows():
+        rows = positions[session]
+        if rows[-1] - rows[0] + 1 == len(rows):
+            frame = df.iloc[rows[0]:rows[-1] + 1]
+        else:
+            frame = df.take(rows)
+        sessions.append((row, frame))
+    return sessions
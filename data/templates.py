@@ -0,0 +1,152 @@
+import os
+from string import Formatter
+from functools import lru_cache
+
+from data.vbt import vbt_entries
+
+# Template-driven activity descriptions.
+# A format is a set of str.format-style templates: one for the whole description (single or
+# multiple exercise mode), one per exercise, one per metric and, optionally, the velocity-based
+# training section. Each template is parsed once into its literal and field parts, and the
+# description is built by joining the rendered pieces in a single pass.
+DESCRIPTION_FORMAT = os.getenv("DESCRIPTION_FORMAT", "detailed")
+
+FORMATS = {
+    # The original layout
+    'detailed': {
+        'single': (
+            "Workout Summary\n\n"
+            "- Exercise: {selected_exercise}\n"
+            "- Sets: {total_sets}\n"
+            "- Reps: {total_reps}\n"
+            "- Total Weight: {total_weight:.2f} kg\n\n"
+            "Performance Metrics\n"
+            "{metrics}{vbt}"
+        ),
+        'multi': (
+            "Workout Summary\n\n"
+            "- Total Exercises: {total_exercises}\n"
+            "- Total Sets: {total_sets}\n"
+            "- Total Reps: {total_reps}\n"
+            "- Total Weight: {total_weight:.2f} kg\n\n"
+            "Exercise Details\n"
+            "{exercises}{vbt}"
+        ),
+        'metric': "- {name}: {value} {unit}\n",
+        'exercise': (
+            "\n## {exercise}\n"
+            "- Sets: {sets}\n"
+            "- Reps: {reps}\n"
+            "- Total Weight: {weight:.2f} kg\n"
+            "- Performance Metrics:\n"
+            "{metrics}"
+        ),
+        'exercise_metric': "  • {name}: {value} {unit}\n",
+        'vbt': "\nVelocity-Based Training\n{entries}",
+        'vbt_single': "{lines}",
+        'vbt_exercise': "\n## {exercise}\n{lines}",
+        'vbt_line': "- {line}\n"
+    },
+    # One line per exercise, for short Strava descriptions
+    'compact': {
+        'single': "{selected_exercise}: {total_sets} sets, {total_reps} reps, {total_weight:.0f} kg{metrics}\n",
+        'multi': "{total_exercises} exercises, {total_sets} sets, {total_reps} reps, {total_weight:.0f} kg\n{exercises}",
+        'metric': " | {name} {value} {unit}",
+        'exercise': "{exercise}: {sets}x{reps} {weight:.0f} kg{metrics}\n",
+        'exercise_metric': " | {name} {value} {unit}",
+        'vbt': None
+    },
+    # Headings, bold labels and lists, for pasting into notes or docs
+    'markdown': {
+        'single': (
+            "# Workout Summary\n\n"
+            "**Exercise:** {selected_exercise}  \n"
+            "**Sets:** {total_sets} · **Reps:** {total_reps} · **Total Weight:** {total_weight:.2f} kg\n\n"
+            "## Performance Metrics\n\n"
+            "{metrics}{vbt}"
+        ),
+        'multi': (
+            "# Workout Summary\n\n"
+            "**Exercises:** {total_exercises} · **Sets:** {total_sets} · **Reps:** {total_reps} · "
+            "**Total Weight:** {total_weight:.2f} kg\n\n"
+            "## Exercise Details\n"
+            "{exercises}{vbt}"
+        ),
+        'metric': "- **{name}:** {value} {unit}\n",
+        'exercise': (
+            "\n### {exercise}\n\n"
+            "- **Sets:** {sets}\n"
+            "- **Reps:** {reps}\n"
+            "- **Total Weight:** {weight:.2f} kg\n"
+            "{metrics}"
+        ),
+        'exercise_metric': "- **{name}:** {value} {unit}\n",
+        'vbt': "\n## Velocity-Based Training\n{entries}",
+        'vbt_single': "\n{lines}",
+        'vbt_exercise': "\n### {exercise}\n\n{lines}",
+        'vbt_line': "- {line}\n"
+    }
+}
+
+# Conversions a template field may ask for ("{name!r}", "{name!s}")
+CONVERSIONS = {None: None, 'r': repr, 's': str}
+
+# Compile a str.format-style template (plain field names only) into a function of one mapping.
+# Cached per template text, so each template is parsed once per process.
+@lru_cache(maxsize=128)
+def compile_template(template):
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and not field.isidentifier():
+            raise ValueError(f"Unsupported template field: {field!r}")
+        if conversion not in CONVERSIONS:
+            raise ValueError(f"Unsupported template conversion: {conversion!r}")
+        parts.append((literal, field, spec, CONVERSIONS[conversion]))
+    parts = tuple(parts)
+
+    def render(values):
+        pieces = []
+        for literal, field, spec, convert in parts:
+            pieces.append(literal)
+            if field is not None:
+                value = values[field]
+                pieces.append(format(convert(value) if convert else value, spec))
+        return ''.join(pieces)
+    return render
+
+def _metrics(render, entries):
+    return ''.join([
+        render({'name': name, 'unit': unit, 'value': f"{value:.{decimals}f}"})
+        for name, unit, decimals, value in entries
+    ])
+
+# Description for an aggregated summary in the given format
+def render_summary(summary, fmt=None):
+    fmt = fmt or DESCRIPTION_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown description format: {fmt}")
+    templates = FORMATS[fmt]
+    selected_exercise = summary['selected_exercise']
+
+    vbt = ''
+    entries = vbt_entries(summary.get('vbt'), selected_exercise) if templates['vbt'] else []
+    if entries:
+        render_line = compile_template(templates['vbt_line'])
+        render_entry = compile_template(templates['vbt_single'] if selected_exercise else templates['vbt_exercise'])
+        vbt = compile_template(templates['vbt'])({'entries': ''.join([
+            render_entry({'exercise': exercise, 'lines': ''.join([render_line({'line': line}) for line in lines])})
+            for exercise, lines in entries
+        ])})
+
+    context = dict(summary, vbt=vbt)
+    if selected_exercise:
+        context['metrics'] = _metrics(compile_template(templates['metric']), summary['metrics'])
+        return compile_template(templates['single'])(context)
+
+    render_exercise = compile_template(templates['exercise'])
+    render_metric = compile_template(templates['exercise_metric'])
+    context['exercises'] = ''.join([
+        render_exercise(dict(exercise, metrics=_metrics(render_metric, exercise['metrics'])))
+        for exercise in summary['exercises']
+    ])
+    return compile_template(templates['multi'])(context)
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from data.parser import CSV_CHUNKSIZE, get_workout, stream_workout, summarize_csv
+from utils.metrics import timed, increment
+from api.urls import strava_url
+
+# Fingerprint index of each athlete's uploaded workouts, so a double click or a re-uploaded export
+# returns the activity that already exists instead of posting a new one.
+# Two fingerprints are kept per upload, both including the selected exercise:
+#   content - hash of the normalized rows, so whitespace, line endings or column order don't matter
+#   summary - hash of the rounded per-exercise totals and metrics, catching re-exports that differ
+#             only in float formatting or extra columns. Two sessions on different days can have
+#             the same totals, so a summary match is only reported, never skipped.
+# Lookups are served from an in-memory LRU mirror of the SQLite table.
+UPLOAD_INDEX_DB = os.getenv("UPLOAD_INDEX_DB", os.path.join(tempfile.gettempdir(), "strava_uploader_upload_index.db"))
+UPLOAD_INDEX_MAX_ENTRIES = int(os.getenv("UPLOAD_INDEX_MAX_ENTRIES", "5000"))
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+# Hash of the normalized rows, independent of column order and of how the CSV was formatted
+def content_fingerprint(df, selected_exercise=None):
+    if selected_exercise:
+        df = df[df['Exercise'] == selected_exercise]
+    columns = sorted(df.columns)
+    frame = df[columns]
+    row_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return _hash('content', selected_exercise or '', ','.join(columns), hashlib.sha256(row_hashes.tobytes()).hexdigest())
+
+# Hash of the summary figures that end up in the activity, rounded to what the description shows
+def summary_fingerprint(summary):
+    if summary['selected_exercise']:
+        figures = [(summary['selected_exercise'], summary['total_sets'], round(float(summary['total_reps'])),
+                    round(float(summary['total_weight']), 1))]
+        figures += [(name, round(float(value), decimals)) for name, _, decimals, value in summary['metrics']]
+    else:
+        figures = [(str(e['exercise']), e['sets'], round(float(e['reps'])), round(float(e['weight']), 1),
+                    [(name, round(float(value), decimals)) for name, _, decimals, value in e['metrics']])
+                   for e in summary['exercises']]
+    return _hash('summary', summary['selected_exercise'] or '', json.dumps(figures, default=str))
+
+# Both fingerprints for a loaded workout and its summary (e.g. one session of an export)
+def workout_fingerprints(workout, summary):
+    return {
+        'content': content_fingerprint(workout['df'], summary['selected_exercise']),
+        'summary': summary_fingerprint(summary)
+    }
+
+# Both fingerprints for an uploaded file. In streaming mode the rows aren't kept, so the raw
+# content hash stands in for the normalized one.
+def upload_fingerprints(file, selected_exercise=None):
+    summary, _ = summarize_csv(file, selected_exercise)
+    if CSV_CHUNKSIZE:
+        content = _hash('raw', selected_exercise or '', stream_workout(file, CSV_CHUNKSIZE)['key'])
+    else:
+        content = content_fingerprint(get_workout(file)['df'], summary['selected_exercise'])
+    return {'content': content, 'summary': summary_fingerprint(summary)}
+
+def _open_connection():
+    conn = sqlite3.connect(UPLOAD_INDEX_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Entries written before the index was kept per athlete can't be attributed to anyone
+    if 'owner' not in {row[1] for row in conn.execute("PRAGMA table_info(upload_index)")}:
+        conn.execute("DROP TABLE IF EXISTS upload_index")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS upload_index ("
+        "owner TEXT NOT NULL, fingerprint TEXT NOT NULL, kind TEXT NOT NULL, activity_id INTEGER, "
+        "name TEXT, created_at REAL NOT NULL, last_seen REAL NOT NULL, "
+        "PRIMARY KEY (owner, fingerprint))"
+    )
+    # Eviction order
+    conn.execute("CREATE INDEX IF NOT EXISTS upload_index_last_seen ON upload_index (last_seen)")
+    return conn
+
+class UploadIndex:
+    # Write-through LRU mirror of the upload_index table keyed by (owner, fingerprint), reloaded when
+    # another process commits (PRAGMA data_version, as in the temp storage cache). Bounded to
+    # max_entries, oldest first out.
+    def __init__(self, max_entries=UPLOAD_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _sync(self):
+        if self._conn is None:
+            self._conn = _open_connection()
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            with timed('storage_io'):
+                rows = self._conn.execute(
+                    "SELECT owner, fingerprint, kind, activity_id, name, created_at FROM upload_index ORDER BY last_seen"
+                ).fetchall()
+            self._entries = OrderedDict(
+                ((owner, fp), {'kind': kind, 'activity_id': activity_id, 'name': name, 'created_at': created_at})
+                for owner, fp, kind, activity_id, name, created_at in rows
+            )
+            self._version = version
+        return self._conn
+
+    # The activity an athlete previously created with the same fingerprint of this kind, or None.
+    # A hit is stored as seen, so eviction stays least-recently-seen after a reload.
+    def lookup(self, owner, fingerprints, kind='content'):
+        key = (str(owner), fingerprints.get(kind))
+        with self._lock:
+            conn = self._sync()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            try:
+                with timed('storage_io'):
+                    conn.execute("UPDATE upload_index SET last_seen = ? WHERE owner = ? AND fingerprint = ?", (time.time(), *key))
+            except sqlite3.Error:
+                # Only the eviction order suffers; the duplicate is still reported
+                pass
+            return dict(entry, match=kind)
+
+    # Remember the activity created for an athlete's upload, evicting the least recently seen entries
+    def add(self, owner, fingerprints, activity_id, name):
+        owner = str(owner)
+        now = time.time()
+        with self._lock:
+            conn = self._sync()
+            with timed('storage_io'):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for kind, fingerprint in fingerprints.items():
+                        conn.execute(
+                            "INSERT OR REPLACE INTO upload_index (owner, fingerprint, kind, activity_id, name, created_at, last_seen) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (owner, fingerprint, kind, activity_id, name, now, now)
+                        )
+                        self._entries[(owner, fingerprint)] = {'kind': kind, 'activity_id': activity_id, 'name': name, 'created_at': now}
+                        self._entries.move_to_end((owner, fingerprint))
+                    evicted = []
+                    while len(self._entries) > self.max_entries:
+                        key, _ = self._entries.popitem(last=False)
+                        evicted.append(key)
+                    if evicted:
+                        conn.executemany("DELETE FROM upload_index WHERE owner = ? AND fingerprint = ?", evicted)
+                        self.evictions += len(evicted)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    self._version = None
+                    raise
+            self._version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            conn = self._sync()
+            conn.execute("DELETE FROM upload_index")
+            self._entries.clear()
+            self._version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'duplicates_found': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+upload_index = UploadIndex()
+
+# The athlete's existing activity for an upload, if the same workout content was uploaded before
+def find_duplicate(owner, fingerprints):
+    entry = upload_index.lookup(owner, fingerprints, 'content')
+    if entry is not None:
+        increment('duplicate_uploads_skipped')
+    return entry
+
+# The athlete's existing activity with the same totals, if any: possibly a re-export of the same
+# workout, possibly another session that happened to match. Callers warn; they don't skip.
+def find_similar(owner, fingerprints):
+    return upload_index.lookup(owner, fingerprints, 'summary')
+
+def remember_upload(owner, fingerprints, activity, name):
+    upload_index.add(owner, fingerprints, activity.get('id'), name)
+
+def activity_url(activity_id):
+    return strava_url(f"activities/{activity_id}")
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Velocity-based training analytics over every rep of a workout, computed with grouped
+# vectorized operations (no per-set or per-exercise Python loops over rows).
+#   velocity loss  - per set, drop from the fastest to the last rep, as a share of the fastest
+#   fatigue index  - per set, mean rep-to-rep relative velocity drop
+#   L-V profile    - per exercise, least-squares line through the best velocity at each load,
+#                    with the estimated 1RM where it crosses the minimum velocity threshold
+# Rows are taken as reps in file order within each (exercise, set).
+
+# Minimum velocity threshold (m/s) used to estimate 1RM from the load-velocity profile
+VBT_MVT = float(os.getenv("VBT_MVT", "0.3"))
+# Profiles that fit worse than this are too noisy to quote an estimated 1RM in the description
+VBT_MIN_R2 = float(os.getenv("VBT_MIN_R2", "0.8"))
+# Mean velocity column in either dialect
+VELOCITY_COLUMNS = ('MeanVelocity(m/s)', 'Average')
+
+def velocity_column(df):
+    return next((col for col in VELOCITY_COLUMNS if col in df.columns), None)
+
+# Per-set velocity loss and fatigue index
+def _set_stats(frame):
+    grouped = frame.groupby(['exercise', 'set'], sort=False, observed=True)['velocity']
+    previous = grouped.shift()
+    frame = frame.assign(drop=(previous - frame['velocity']) / previous)
+    sets = frame.groupby(['exercise', 'set'], sort=False, observed=True).agg(
+        reps=('velocity', 'size'),
+        load=('load', 'max'),
+        best_velocity=('velocity', 'max'),
+        last_velocity=('velocity', 'last'),
+        fatigue_index=('drop', 'mean')
+    )
+    sets['velocity_loss_pct'] = 100 * (sets['best_velocity'] - sets['last_velocity']) / sets['best_velocity']
+    sets['fatigue_index_pct'] = 100 * sets.pop('fatigue_index')
+    return sets
+
+# Per-exercise load-velocity regression from closed-form grouped sums
+def _profiles(frame, mvt):
+    points = frame.dropna(subset=['load']).groupby(['exercise', 'load'], sort=False, observed=True)['velocity'].max()
+    points = points.reset_index()
+    x = points['load']
+    y = points['velocity']
+    sums = points.assign(xy=x * y, xx=x * x, yy=y * y).groupby('exercise', sort=False, observed=True).agg(
+        n=('load', 'size'), sx=('load', 'sum'), sy=('velocity', 'sum'),
+        sxy=('xy', 'sum'), sxx=('xx', 'sum'), syy=('yy', 'sum')
+    )
+    n = sums['n']
+    cov = n * sums['sxy'] - sums['sx'] * sums['sy']
+    var_x = n * sums['sxx'] - sums['sx'] ** 2
+    var_y = n * sums['syy'] - sums['sy'] ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where((n >= 2) & (var_x > 0), cov / var_x, np.nan)
+        intercept = (sums['sy'] - slope * sums['sx']) / n
+        r2 = np.where(var_y > 0, cov ** 2 / (var_x * var_y), np.nan)
+        # Only a falling profile crosses the threshold at a meaningful load
+        e1rm = np.where(slope < 0, (mvt - intercept) / slope, np.nan)
+    return pd.DataFrame(
+        {'profile_points': n, 'intercept': intercept, 'slope': slope, 'r2': r2, 'e1rm': e1rm},
+        index=sums.index
+    )
+
+# Analyze a normalized workout frame. Returns None when there is no mean velocity column, otherwise
+# {'mvt', 'sets': DataFrame per (exercise, set), 'exercises': DataFrame per exercise}.
+def analyze_workout(df, weight_col, mvt=VBT_MVT):
+    vel_col = velocity_column(df)
+    if vel_col is None:
+        return None
+    frame = pd.DataFrame({
+        'exercise': df['Exercise'],
+        'set': df['Set'] if 'Set' in df.columns else 1,
+        'load': df[weight_col] if weight_col else np.nan,
+        'velocity': df[vel_col].astype('float64')
+    })
+    frame = frame[frame['velocity'] > 0]
+    if frame.empty:
+        return None
+
+    sets = _set_stats(frame)
+    per_exercise = sets.groupby(level='exercise', sort=False, observed=True).agg(
+        sets=('reps', 'size'),
+        velocity_loss_pct=('velocity_loss_pct', 'mean'),
+        fatigue_index_pct=('fatigue_index_pct', 'mean')
+    )
+    exercises = per_exercise.join(_profiles(frame, mvt))
+    return {'mvt': mvt, 'sets': sets.reset_index(), 'exercises': exercises}
+
+# Structured form of an analysis (plain Python values), e.g. for JSON export
+def vbt_records(analysis):
+    if analysis is None:
+        return None
+    exercises = analysis['exercises'].reset_index()
+    return {
+        'mvt': analysis['mvt'],
+        'exercises': exercises.astype(object).where(exercises.notna(), None).to_dict('records'),
+        'sets': analysis['sets'].astype(object).where(analysis['sets'].notna(), None).to_dict('records')
+    }
+
+def _exercise_lines(row, mvt):
+    lines = []
+    if not pd.isna(row['velocity_loss_pct']):
+        lines.append(f"Velocity Loss: {row['velocity_loss_pct']:.1f}% per set")
+    if not pd.isna(row['fatigue_index_pct']):
+        lines.append(f"Fatigue Index: {row['fatigue_index_pct']:.1f}% per rep")
+    if not pd.isna(row['e1rm']) and row['e1rm'] > 0 and row['r2'] >= VBT_MIN_R2:
+        lines.append(f"Est. 1RM: {row['e1rm']:.1f} kg (R² {row['r2']:.2f}, MVT {mvt:.2f} m/s)")
+    return lines
+
+# Figures for the description: [(exercise, lines)], with exercise None in single exercise mode
+def vbt_entries(analysis, selected_exercise=None):
+    if analysis is None or analysis['exercises'].empty:
+        return []
+    if selected_exercise:
+        return [(None, _exercise_lines(analysis['exercises'].iloc[0], analysis['mvt']))]
+    return [(exercise, _exercise_lines(row, analysis['mvt'])) for exercise, row in analysis['exercises'].iterrows()]
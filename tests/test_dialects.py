@@ -0,0 +1,26 @@
+import io
+
+from data import dialects
+from data.cache import workout_cache
+from data.history import workout_stats
+from data.parser import get_workout, parse_csv
+
+# A device whose 'Average' column is mean power, where the built-in dialects have mean velocity
+def test_metrics_follow_the_matched_dialect():
+    dialects.register_dialect(
+        'power_meter', ('Exercise', 'Load', 'DeviceId'),
+        {'Exercise': 'Exercise', 'Load': 'Load', 'Reps': 'Reps', 'Average': 'Average'},
+        weight=('Load', 'kg'), metrics={'Average': ('Mean Power', 'W', 0)}
+    )
+    try:
+        workout_cache.clear()
+        power = b"Exercise,Load,Reps,Average,DeviceId\nSquat,100kg,5,250,x\n"
+        velocity = b"Exercise,Load,Reps,Average\nSquat,100kg,5,0.45\n"
+        assert 'Mean Power: 250 W' in parse_csv(io.BytesIO(power))[0]
+        assert 'Mean Velocity: 0.45 m/s' in parse_csv(io.BytesIO(velocity))[0]
+        assert workout_stats(get_workout(io.BytesIO(power)))['Squat']['mean_velocity'] is None
+        assert workout_stats(get_workout(io.BytesIO(velocity)))['Squat']['mean_velocity'] == 0.45
+    finally:
+        dialects.DIALECTS.pop('power_meter')
+        dialects.resolve_layout.cache_clear()
+        workout_cache.clear()
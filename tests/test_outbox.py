@@ -0,0 +1,86 @@
+import time
+
+from api import outbox as outbox_module
+
+def _payload(name):
+    return {'name': name, 'activity_type': 'WeightTraining', 'start_date': '2024-04-01T10:00:00', 'elapsed_time': 600, 'description': None}
+
+def _wait(box, job_ids, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = box.status(job_ids)
+        if all(job['status'] in ('done', 'failed') for job in jobs):
+            return jobs
+        time.sleep(0.05)
+    return box.status(job_ids)
+
+# A POST that fails with a 5xx after Strava created the activity is not posted again
+def test_unconfirmed_post_is_looked_for_before_reposting(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, 'OUTBOX_DB', str(tmp_path / 'outbox.db'))
+    monkeypatch.setattr(outbox_module, 'RETRY_BASE_SECONDS', 0.05)
+    posts, strava = [], []
+
+    def send_activity(access_token, client_id=None, **payload):
+        posts.append(payload['name'])
+        strava.append({'id': len(posts), 'name': payload['name'], 'elapsed_time': payload['elapsed_time']})
+        if payload['name'] == 'created' and len(posts) == 1:
+            return None, '502 Bad Gateway', None
+        return strava[-1], None, False
+
+    def list_activities(access_token, after=None, before=None, client_id=None, **kwargs):
+        return list(strava), None, False
+
+    monkeypatch.setattr(outbox_module, 'send_activity', send_activity)
+    monkeypatch.setattr(outbox_module, 'list_activities', list_activities)
+    box = outbox_module.UploadOutbox(workers=1)
+    try:
+        job_id = box.enqueue('athlete', _payload('created'), start_at=time.time())
+        box.register_token_source('athlete', lambda: 'token')
+        jobs = _wait(box, [job_id])
+    finally:
+        box.stop()
+    assert [(job['status'], job['activity_id']) for job in jobs] == [('done', 1)]
+    assert posts == ['created']
+
+# A throttled POST never reached Strava, so it is simply posted again
+def test_throttled_post_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, 'OUTBOX_DB', str(tmp_path / 'outbox.db'))
+    monkeypatch.setattr(outbox_module, 'RETRY_BASE_SECONDS', 0.05)
+    posts = []
+
+    def send_activity(access_token, client_id=None, **payload):
+        posts.append(payload['name'])
+        if len(posts) == 1:
+            return None, 'Rate Limit Exceeded', True
+        return {'id': 42, 'name': payload['name']}, None, False
+
+    def list_activities(*args, **kwargs):
+        raise AssertionError("a throttled post needs no lookup")
+
+    monkeypatch.setattr(outbox_module, 'send_activity', send_activity)
+    monkeypatch.setattr(outbox_module, 'list_activities', list_activities)
+    box = outbox_module.UploadOutbox(workers=1)
+    try:
+        job_id = box.enqueue('athlete', _payload('throttled'), start_at=time.time())
+        box.register_token_source('athlete', lambda: 'token')
+        jobs = _wait(box, [job_id])
+    finally:
+        box.stop()
+    assert [(job['status'], job['activity_id']) for job in jobs] == [('done', 42)]
+    assert posts == ['throttled', 'throttled']
+
+# Enqueueing wakes an idle worker rather than the lease renewer
+def test_enqueue_wakes_a_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, 'OUTBOX_DB', str(tmp_path / 'outbox.db'))
+    monkeypatch.setattr(outbox_module, 'send_activity', lambda access_token, client_id=None, **payload: ({'id': 7}, None, False))
+    box = outbox_module.UploadOutbox(workers=1)
+    try:
+        box.register_token_source('athlete', lambda: 'token')
+        time.sleep(0.2)
+        started = time.time()
+        job_id = box.enqueue('athlete', _payload('now'), start_at=time.time())
+        jobs = _wait(box, [job_id], timeout=outbox_module.IDLE_POLL_SECONDS / 2)
+    finally:
+        box.stop()
+    assert jobs[0]['status'] == 'done'
+    assert time.time() - started < outbox_module.IDLE_POLL_SECONDS / 2
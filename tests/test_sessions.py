@@ -0,0 +1,33 @@
+import io
+
+import pandas as pd
+
+from data.parser import parse_csv, get_sessions
+from data.sessions import parse_timestamps
+
+# A multi-day export across a DST change: the UTC offset changes from +01:00 to +02:00
+DST_CSV = (
+    b"Exercise,Set,Reps,Load,Timestamp\n"
+    b"Squat,1,5,100kg,2024-03-30T10:00:00+01:00\n"
+    b"Squat,2,5,100kg,2024-03-30T10:05:00+01:00\n"
+    b"Bench,1,5,60kg,2024-04-01T10:00:00+02:00\n"
+)
+
+def test_mixed_offsets_keep_wall_clock_time():
+    timestamps = parse_timestamps([pd.Series(['2024-03-30T10:00:00+01:00', '2024-04-01T10:00:00+02:00', None])])
+    assert timestamps.tolist()[:2] == [pd.Timestamp('2024-03-30 10:00'), pd.Timestamp('2024-04-01 10:00')]
+    assert pd.isna(timestamps.iloc[2])
+
+def test_export_across_dst_change_parses_and_splits():
+    _, elapsed_time, total_weight, total_sets, total_reps, _ = parse_csv(io.BytesIO(DST_CSV))
+    assert (total_weight, total_sets, total_reps) == (260.0, 2, 15)
+    sessions = get_sessions(io.BytesIO(DST_CSV))
+    assert [(s['start'].isoformat(), s['elapsed_time']) for s in sessions] == [
+        ('2024-03-30T10:00:00', 300),
+        ('2024-04-01T10:00:00', 600)
+    ]
+
+def test_unparseable_timestamps_skip_segmentation():
+    csv = b"Exercise,Set,Reps,Load,Timestamp\nSquat,1,5,100kg,soon\nSquat,2,5,100kg,later\n"
+    assert parse_csv(io.BytesIO(csv))[2] == 200.0
+    assert get_sessions(io.BytesIO(csv)) is None
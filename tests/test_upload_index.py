@@ -0,0 +1,14 @@
+from data import upload_index as upload_index_module
+
+# Looking an entry up keeps it in the index after a reload, where only last_seen orders eviction
+def test_lookup_is_remembered_across_reloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_index_module, 'UPLOAD_INDEX_DB', str(tmp_path / 'index.db'))
+    index = upload_index_module.UploadIndex(max_entries=2)
+    index.add('athlete', {'content': 'old'}, 1, 'Old')
+    index.add('athlete', {'content': 'new'}, 2, 'New')
+    assert index.lookup('athlete', {'content': 'old'})['activity_id'] == 1
+
+    reloaded = upload_index_module.UploadIndex(max_entries=2)
+    reloaded.add('athlete', {'content': 'newest'}, 3, 'Newest')
+    assert reloaded.lookup('athlete', {'content': 'old'}) is not None
+    assert reloaded.lookup('athlete', {'content': 'new'}) is None
@@ -0,0 +1,138 @@
+import os
+import time
+import socket
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Shared HTTP client for every Strava call (auth and api packages).
+# One pooled keep-alive session per process, so reruns, sessions and bulk workers reuse
+# open TLS connections instead of handshaking with strava.com on every request.
+POOL_SIZE = int(os.getenv("STRAVA_HTTP_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("STRAVA_HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("STRAVA_HTTP_READ_TIMEOUT", "30"))
+LATENCY_HISTORY = 500
+
+# Connection-setup timings of the request currently running on this thread
+_connect_timings = threading.local()
+
+def _record_connect(**timings):
+    current = getattr(_connect_timings, 'value', None) or {}
+    current.update(timings)
+    _connect_timings.value = current
+
+class _TimedConnectionMixin:
+    # Resolve the host ourselves so DNS and TCP connect can be timed separately
+    def _new_conn(self):
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            address = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror:
+            # Let urllib3 raise its usual resolution error
+            return super()._new_conn()
+        resolved = time.perf_counter()
+
+        self._dns_host = address
+        try:
+            sock = super()._new_conn()
+        except Exception:
+            # Fall back to urllib3's own multi-address connect
+            self._dns_host = host
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+
+        _record_connect(dns=resolved - started, connect=time.perf_counter() - resolved)
+        return sock
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    # TLS handshake time is whatever connect() spends beyond the socket setup
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        total = time.perf_counter() - started
+        timings = getattr(_connect_timings, 'value', None) or {}
+        _record_connect(tls=max(0.0, total - timings.get('dns', 0.0) - timings.get('connect', 0.0)))
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+class HttpClient:
+    # Pooled keep-alive session that records per-request latency
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Retries are the rate-limit scheduler's job, not the transport's
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_HISTORY)
+        self.new_connections = 0
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        _connect_timings.value = None
+        started = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        total = time.perf_counter() - started
+
+        timings = _connect_timings.value or {}
+        _connect_timings.value = None
+        record = {
+            'method': method,
+            'url': url,
+            'status': response.status_code,
+            'reused': not timings,
+            'dns': timings.get('dns', 0.0),
+            'connect': timings.get('connect', 0.0),
+            'tls': timings.get('tls', 0.0),
+            # requests measures from sending the request until the headers are parsed
+            'ttfb': response.elapsed.total_seconds(),
+            'total': total
+        }
+        with self._lock:
+            self._latencies.append(record)
+            if timings:
+                self.new_connections += 1
+        return response
+
+    def latencies(self):
+        with self._lock:
+            return list(self._latencies)
+
+    # Mean and p95 of each latency phase over the recent requests, in milliseconds
+    def latency_stats(self):
+        records = self.latencies()
+        stats = {'requests': len(records), 'new_connections': self.new_connections}
+        if not records:
+            return stats
+        stats['reused_ratio'] = round(sum(1 for r in records if r['reused']) / len(records), 3)
+        for phase in ('dns', 'connect', 'tls', 'ttfb', 'total'):
+            values = sorted(r[phase] for r in records)
+            stats[phase] = {
+                'mean_ms': round(1000 * sum(values) / len(values), 1),
+                'p95_ms': round(1000 * values[min(len(values) - 1, int(0.95 * len(values)))], 1)
+            }
+        return stats
+
+http_client = HttpClient()
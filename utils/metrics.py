@@ -0,0 +1,130 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Per-stage timings for the request path.
+# Every measurement feeds a process-wide histogram (exportable as JSON or Prometheus text)
+# and, when the current thread has started a run, that run's breakdown for the debug sidebar.
+STAGES = (
+    'csv_read',
+    'normalize',
+    'segment',
+    'aggregate',
+    'vbt',
+    'render',
+    'token_refresh',
+    'create_activity',
+    'upload_file',
+    'upload_status',
+    'list_activities',
+    'storage_io'
+)
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    # Cumulative counts per upper bound, as Prometheus expects
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            result.append((bound, total))
+        return result
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._histograms.setdefault(stage, Histogram()).observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'stages': {
+                    stage: {
+                        'count': h.count,
+                        'sum_seconds': round(h.sum, 6),
+                        'mean_ms': round(1000 * h.sum / h.count, 3) if h.count else 0.0,
+                        'buckets': {str(bound): count for bound, count in h.cumulative()}
+                    }
+                    for stage, h in self._histograms.items()
+                },
+                'counters': dict(self._counters)
+            }
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP strava_uploader_stage_duration_seconds Time spent in each request stage.",
+            "# TYPE strava_uploader_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                for bound, count in h.cumulative():
+                    lines.append(f'strava_uploader_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'strava_uploader_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'strava_uploader_stage_duration_seconds_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'strava_uploader_stage_duration_seconds_count{{stage="{stage}"}} {h.count}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE strava_uploader_{name}_total counter")
+                lines.append(f"strava_uploader_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+_run = threading.local()
+
+# Start collecting a per-stage breakdown for the current thread (one Streamlit rerun)
+def start_run():
+    _run.stages = {}
+
+# Breakdown collected since start_run(): stage -> {'calls', 'ms'}
+def current_run():
+    stages = getattr(_run, 'stages', None) or {}
+    return {stage: {'calls': calls, 'ms': round(seconds * 1000, 3)} for stage, (calls, seconds) in stages.items()}
+
+def record(stage, seconds):
+    registry.observe(stage, seconds)
+    stages = getattr(_run, 'stages', None)
+    if stages is not None:
+        calls, total = stages.get(stage, (0, 0.0))
+        stages[stage] = (calls + 1, total + seconds)
+
+def increment(name, amount=1):
+    registry.increment(name, amount)
+
+# Time a block of code as one call of the given stage
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def export_json():
+    return json.dumps(registry.snapshot(), indent=2)
+
+def export_prometheus():
+    return registry.to_prometheus()
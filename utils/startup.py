@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import threading
+import importlib
+import subprocess
+
+# Fast startup: app.py imports only what the credentials page needs. Everything the
+# upload phase needs is imported on first use, or pre-warmed in the background while the
+# user is going through OAuth, so the first page renders without waiting on it.
+DEFERRED_MODULES = [
+    'requests',
+    'utils.http_client',
+    'api.rate_limit',
+    'auth.oauth',
+    'auth.tokens',
+    'api.starva_api',
+    'data.cache',
+    'data.vbt',
+    'data.templates',
+    'data.sessions',
+    'data.dialects',
+    'data.archive',
+    'data.parser',
+    'data.fit',
+    'data.history',
+    'data.upload_index',
+    'api.bulk',
+    'api.uploads',
+    'api.outbox',
+    'api.activity_sync'
+]
+# Imported by app.py at module load
+EAGER_MODULES = ['auth.credentials', 'utils.storage', 'utils.startup', 'utils.metrics', 'api.urls']
+PREWARM_IMPORTS = os.getenv("PREWARM_IMPORTS", "1") != "0"
+
+_lock = threading.Lock()
+_prewarm_thread = None
+_timings = {}
+_prewarm_total_ms = None
+
+def _prewarm():
+    global _prewarm_total_ms
+    started = time.perf_counter()
+    for module in DEFERRED_MODULES:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except Exception:
+            # The real import on first use will surface the error
+            continue
+        _timings[module] = round((time.perf_counter() - module_started) * 1000, 1)
+    _prewarm_total_ms = round((time.perf_counter() - started) * 1000, 1)
+
+# Import the upload-phase modules in a background thread (once per process)
+def prewarm_imports():
+    global _prewarm_thread
+    if not PREWARM_IMPORTS:
+        return
+    with _lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, name="import-prewarm", daemon=True)
+            _prewarm_thread.start()
+
+# What the pre-warm thread imported and how long each module took
+def import_report():
+    return {
+        'prewarm_started': _prewarm_thread is not None,
+        'prewarm_total_ms': _prewarm_total_ms,
+        'modules_ms': dict(_timings),
+        'deferred_loaded': [m for m in DEFERRED_MODULES if m in sys.modules]
+    }
+
+# Time importing modules in a fresh interpreter, after streamlit (already loaded by `streamlit run`)
+def measure_cold_imports(modules, preload=('streamlit',)):
+    script = (
+        "import json, time, importlib\n"
+        f"for m in {list(preload)!r}: importlib.import_module(m)\n"
+        "timings = {}\n"
+        "started = time.perf_counter()\n"
+        f"for m in {list(modules)!r}:\n"
+        "    t = time.perf_counter(); importlib.import_module(m)\n"
+        "    timings[m] = round((time.perf_counter() - t) * 1000, 1)\n"
+        "timings['total'] = round((time.perf_counter() - started) * 1000, 1)\n"
+        "print(json.dumps(timings))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+# Import-time report: what the first page pays for now versus importing everything up front
+if __name__ == "__main__":
+    eager = measure_cold_imports(EAGER_MODULES)
+    everything = measure_cold_imports(EAGER_MODULES + DEFERRED_MODULES)
+    print(json.dumps({
+        'first_page_ms': eager['total'],
+        'all_imports_ms': everything['total'],
+        'first_page': eager,
+        'all_imports': everything
+    }, indent=2))
@@ -1,49 +1,295 @@
 import os
 import json
 import time
+import heapq
+import sqlite3
 import tempfile
+import threading
 import streamlit as st
 
-# File-based temporary storage for credentials
-# This persists across Streamlit restarts unlike in-memory dictionary
+from utils.metrics import timed
+
+# SQLite-backed temporary storage for credentials.
+# This persists across Streamlit restarts unlike in-memory dictionary, and WAL mode lets
+# parallel sessions and processes read and write single entries without losing each other's updates.
 TEMP_DIR = tempfile.gettempdir()
-TEMP_STORAGE_FILE = os.path.join(TEMP_DIR, "strava_uploader_temp_credentials.json")
+TEMP_STORAGE_DB = os.path.join(TEMP_DIR, "strava_uploader_temp_credentials.db")
+# Previous whole-file JSON storage, imported once if it is still around
+LEGACY_STORAGE_FILE = os.path.join(TEMP_DIR, "strava_uploader_temp_credentials.json")
+
+# Seconds the sweeper sleeps when no entry is due to expire
+SWEEP_IDLE_INTERVAL = 60
+
+_legacy_lock = threading.Lock()
+_legacy_checked = False
+
+def _report_error(message):
+    try:
+        if st.session_state.get('debug_mode', False):
+            st.error(message)
+    except Exception:
+        # No Streamlit session (e.g. the sweeper thread)
+        pass
+
+# Import entries from the old JSON file into the database, then remove the file
+def _import_legacy_file(conn):
+    global _legacy_checked
+    with _legacy_lock:
+        if _legacy_checked:
+            return
+        _legacy_checked = True
+        if not os.path.exists(LEGACY_STORAGE_FILE):
+            return
+        with open(LEGACY_STORAGE_FILE, 'r') as f:
+            data = json.load(f)
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp_storage (key, value, expires_at) VALUES (?, ?, ?)",
+            [(k, json.dumps(v), v.get('expires_at', 0)) for k, v in data.items()]
+        )
+        os.remove(LEGACY_STORAGE_FILE)
+
+def _open_connection():
+    # Autocommit mode; multi-statement writes open their own transactions.
+    # The connection is only ever used under the cache lock, so any thread may use it.
+    conn = sqlite3.connect(TEMP_STORAGE_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS temp_storage ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    # Expiry index so purges don't scan the table
+    conn.execute("CREATE INDEX IF NOT EXISTS temp_storage_expires_at ON temp_storage (expires_at)")
+    _import_legacy_file(conn)
+    return conn
+
+class TempStorageCache:
+    # Write-through, in-process copy of the temp storage table.
+    # Reads are served from memory; PRAGMA data_version tells us (without reading the table)
+    # whether another connection or process has committed since we last loaded it.
+    # A sweeper thread evicts entries as they expire, driven by a min-heap of expiry times.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._conn = None
+        self._version = None
+        self._entries = {}
+        self._heap = []
+        self._sweeper = None
+        self._closed = False
+        self.hits = 0
+        self.reloads = 0
+        self.sweeps = 0
+        self.swept_entries = 0
+        self.last_sweep_ms = 0.0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = _open_connection()
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="temp-storage-sweeper", daemon=True)
+            self._sweeper.start()
+        return self._conn
+
+    def _track(self, key, value):
+        self._entries[key] = value
+        heapq.heappush(self._heap, (value.get('expires_at', 0), key))
+
+    # Reload the table if anyone else has written to it; must hold the lock
+    def _sync(self, count=True):
+        conn = self._connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            if count:
+                self.hits += 1
+            return conn
+        with timed('storage_io'):
+            rows = conn.execute(
+                "SELECT key, value FROM temp_storage WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        self._entries = {}
+        self._heap = []
+        for k, v in rows:
+            self._track(k, json.loads(v))
+        self._version = version
+        if count:
+            self.reloads += 1
+        self._cond.notify_all()
+        return conn
+
+    def get(self, key):
+        with self._cond:
+            self._sync()
+            value = self._entries.get(key)
+            if value and value.get('expires_at', 0) > time.time():
+                return value
+            return None
+
+    def snapshot(self):
+        with self._cond:
+            self._sync()
+            now = time.time()
+            return {k: v for k, v in self._entries.items() if v.get('expires_at', 0) > now}
+
+    def put(self, key, value):
+        with self._cond:
+            conn = self._sync()
+            with timed('storage_io'):
+                conn.execute(
+                    "INSERT OR REPLACE INTO temp_storage (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), value.get('expires_at', 0))
+                )
+            self._track(key, value)
+            # Wake the sweeper in case this entry now expires first
+            self._cond.notify_all()
+
+    def delete(self, key):
+        with self._cond:
+            conn = self._sync()
+            with timed('storage_io'):
+                conn.execute("DELETE FROM temp_storage WHERE key = ?", (key,))
+            self._entries.pop(key, None)
+
+    def replace_all(self, data):
+        with self._cond:
+            conn = self._sync()
+            with timed('storage_io'):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    existing = {row[0] for row in conn.execute("SELECT key FROM temp_storage")}
+                    conn.executemany("DELETE FROM temp_storage WHERE key = ?", [(k,) for k in existing - set(data)])
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO temp_storage (key, value, expires_at) VALUES (?, ?, ?)",
+                        [(k, json.dumps(v), v.get('expires_at', 0)) for k, v in data.items()]
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            self._entries = {}
+            self._heap = []
+            for k, v in data.items():
+                self._track(k, v)
+            self._cond.notify_all()
+
+    # Evict everything that has expired, in memory and on disk; must hold the lock
+    def _sweep(self):
+        started = time.perf_counter()
+        now = time.time()
+        evicted = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            value = self._entries.get(key)
+            # Heap items for replaced or deleted entries are stale and simply dropped
+            if value is not None and value.get('expires_at', 0) == expires_at:
+                del self._entries[key]
+                evicted += 1
+        with timed('storage_io'):
+            self._connection().execute("DELETE FROM temp_storage WHERE expires_at <= ?", (now,))
+        self.sweeps += 1
+        self.swept_entries += evicted
+        self.last_sweep_ms = round((time.perf_counter() - started) * 1000, 3)
+        return evicted
+
+    def purge(self):
+        with self._cond:
+            self._sync()
+            return self._sweep()
+
+    def _sweep_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                try:
+                    wait = self._heap[0][0] - time.time() if self._heap else SWEEP_IDLE_INTERVAL
+                    if wait > 0:
+                        self._cond.wait(min(wait, SWEEP_IDLE_INTERVAL))
+                        # Pick up entries written by other processes
+                        self._sync(count=False)
+                        continue
+                    self._sweep()
+                except Exception as e:
+                    _report_error(f"Error cleaning temp storage: {str(e)}")
+                    self._cond.wait(SWEEP_IDLE_INTERVAL)
 
-# Load existing temp storage if it exists
+    # Stop the sweeper and close the database connection
+    def close(self):
+        with self._cond:
+            self._closed = True
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            lookups = self.hits + self.reloads
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'sweeps': self.sweeps,
+                'swept_entries': self.swept_entries,
+                'last_sweep_ms': self.last_sweep_ms
+            }
+
+_cache = TempStorageCache()
+
+# Cache hit rate and sweep timings
+def temp_storage_stats():
+    return _cache.stats()
+
+# Get a single unexpired entry by key (None if missing or expired)
+def get_temp_entry(key):
+    try:
+        return _cache.get(key)
+    except Exception as e:
+        _report_error(f"Error loading temp storage: {str(e)}")
+    return None
+
+# Insert or replace a single entry
+def put_temp_entry(key, value):
+    try:
+        _cache.put(key, value)
+    except Exception as e:
+        _report_error(f"Error saving temp storage: {str(e)}")
+
+# Delete a single entry
+def delete_temp_entry(key):
+    try:
+        _cache.delete(key)
+    except Exception as e:
+        _report_error(f"Error saving temp storage: {str(e)}")
+
+# Delete every expired entry, returning how many were removed
+def purge_expired_entries():
+    try:
+        return _cache.purge()
+    except Exception as e:
+        _report_error(f"Error cleaning temp storage: {str(e)}")
+    return 0
+
+# Delete every entry
+def clear_temp_storage():
+    save_temp_storage({})
+
+# Load all unexpired entries as a dictionary
 def load_temp_storage():
     try:
-        if os.path.exists(TEMP_STORAGE_FILE):
-            with open(TEMP_STORAGE_FILE, 'r') as f:
-                data = json.load(f)
-                # Clean up expired entries
-                current_time = time.time()
-                cleaned_data = {k: v for k, v in data.items() 
-                               if v.get('expires_at', 0) > current_time}
-                # Save cleaned data
-                if len(cleaned_data) != len(data):
-                    save_temp_storage(cleaned_data)
-                return cleaned_data
+        return _cache.snapshot()
     except Exception as e:
-        if st.session_state.get('debug_mode', False):
-            st.error(f"Error loading temp storage: {str(e)}")
+        _report_error(f"Error loading temp storage: {str(e)}")
     return {}
 
-# Save temp storage
+# Save temp storage, replacing the whole contents with data in one transaction.
+# Prefer the single-entry functions above, which can't overwrite other sessions' entries.
 def save_temp_storage(data):
     try:
-        with open(TEMP_STORAGE_FILE, 'w') as f:
-            json.dump(data, f)
+        _cache.replace_all(data)
     except Exception as e:
-        if st.session_state.get('debug_mode', False):
-            st.error(f"Error saving temp storage: {str(e)}")
+        _report_error(f"Error saving temp storage: {str(e)}")
 
-# Clean up temp storage entries
+# Clean up temp storage entries (expiry is handled by the sweeper, so this is served from memory)
 def clean_temp_storage():
-    temp_storage = load_temp_storage()
-    # Clean any old entries
-    current_time = time.time()
-    cleaned_storage = {k: v for k, v in temp_storage.items() 
-                      if v.get('expires_at', 0) > current_time}
-    if len(cleaned_storage) != len(temp_storage):
-        save_temp_storage(cleaned_storage)
-    return cleaned_storage
\ No newline at end of file
+    return load_temp_storage()